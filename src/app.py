@@ -1,86 +1,241 @@
 import os
-import glob
+import json
+import uuid
+import hashlib
+import threading
 import logging 
-import re
 
 import dash
-from dash import html, Input, Output, State, dcc
+from dash import html, Input, Output, State, dcc, Patch
 import dash_bootstrap_components as dbc
 
-from layouts.index import index_layout
+from layouts.index import index_layout, UPLOAD_INLINE_MAX_BYTES
 
-from langchain_core.messages import HumanMessage, AIMessage
+# LangChain, numpy, pandas, pyarrow and the HTTP clients are imported where they are first used, so the server
+# starts without them, see bench_startup.py
+from libs.chunked_upload import register_upload_routes
 
-from libs.chat_model import RetailLLM
-from libs.file_handler import *
-
-from libs.timeseries import *
-from libs.product_description import *
-from libs.text_to_shop import *
-import libs.cart as cart
+from libs.session_state import SessionManager, session_scope
+from libs.job_manager import get_job_manager, JobQueueFull, QUEUED, DONE, CANCELLED
+from libs.warmup import start_warmup, import_modules, preload_prophet, open_connections
+from libs.asset_registry import get_asset_registry, register_asset_routes, PLOTLY_MIMETYPE
+from libs.telemetry import get_telemetry, register_metrics_route
 
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
-# remove old asset files
-assets_dir = './src/assets/*'
-files = glob.glob(assets_dir)
-for f in files:
-    os.remove(f)
-
-
 # Initialize the Dash app
 logger.info("Initialize the Dash app.")
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
 # Application layout
-app.layout = dbc.Container(
-    [
-     index_layout,
-    ],
-    fluid=True,
+# every page load starts a new session
+def serve_layout():
+    session_id = uuid.uuid4().hex
+    return dbc.Container(
+        [
+         index_layout,
+         dcc.Store(id="session-id", data=session_id),
+         # read by assets/chunked_upload.js to send large files to the chunked upload endpoints of the session
+         html.Div(id="upload-session", hidden=True, **{'data-session-id': session_id, 'data-max-size': UPLOAD_INLINE_MAX_BYTES}),
+        ],
+        fluid=True,
+    )
+
+app.layout = serve_layout
+
+
+# tools keep no state of their own, they act on the current session.
+# the tool modules pull in prophet, plotly, scikit-learn and langchain, so they are created with the first agent
+_tools = None
+_router = None
+_tools_lock = threading.Lock()
+
+
+def get_tools():
+    """Returns the shared tools and intent router, creating them on first use. """
+    global _tools, _router
+    if _tools is None:
+        with _tools_lock:
+            if _tools is None:
+                logger.info("Creating LLM Objects.")
+                from libs.timeseries import ForecastTool
+                from libs.product_description import ProductDescriptionTool
+                from libs.text_to_shop import Text2ShopTool
+                from libs.intent_router import IntentRouter
+
+                tools = [
+                    ForecastTool(),
+                    ProductDescriptionTool(),
+                    Text2ShopTool(),
+                ]
+                # clear tool requests skip the agent, ambiguous messages still go through it
+                if os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() == 'true':
+                    _router = IntentRouter([tool.name for tool in tools], threshold=float(os.getenv('INTENT_ROUTER_THRESHOLD', 0.6)), side_effect_threshold=float(os.getenv('INTENT_ROUTER_SIDE_EFFECT_THRESHOLD', 0.75)))
+                _tools = tools
+    return _tools, _router
+
+retail_ai_system_message = "You are a master or retail analytics and busines processes. You have the ability to analyze data files and images. Do not ask the user for more information. The information in the metadata tags is to be treated as extra information for your analysis, do not reference the tags to the user. If the requested task of information falls into the 'Other' category, then please respond that you cannot assist and you are not liable for any responses. Provide detailed and robust answers in the chat."
+# semantic response cache is opt-in
+response_cache = None
+if os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true':
+    from libs.response_cache import ResponseCache
+    response_cache = ResponseCache(ttl=float(os.getenv('RESPONSE_CACHE_TTL', 3600)))
+streaming = os.getenv('CHAT_STREAMING_ENABLED', 'true').lower() == 'true'
+# token budget of the conversation memory of every agent, 0 keeps the entire conversation
+memory_max_tokens = int(os.getenv('CHAT_MEMORY_MAX_TOKENS', 1500)) or None
+# messages rendered at once, earlier messages are loaded a page at a time
+chat_page_size = int(os.getenv('CHAT_PAGE_SIZE', 50))
+# agent turns run on the job manager's worker pool and the browser polls for their progress
+background_chat = os.getenv('CHAT_BACKGROUND_ENABLED', 'true').lower() == 'true'
+
+MESSAGE_STYLES = {
+    'user': {"background-color": "#dff0d8", "padding": "5px", "border-radius": "5px", "margin-bottom": "5px", "white-space": "pre-wrap"},
+    'assistant': {"background-color": "#f2dede", "padding": "5px", "border-radius": "5px", "margin-bottom": "5px", "white-space": "pre-wrap"},
+}
+
+
+def create_retail_llm(session):
+    """Creates the agent of a session. Cached answers depend on the files uploaded to the session. """
+    from libs.chat_model import RetailLLM
+    from libs.file_handler import upload_fingerprint
+    tools, router = get_tools()
+    return RetailLLM(system_message=retail_ai_system_message, tools=tools, response_cache=response_cache, cache_state=lambda: upload_fingerprint(session.upload_paths()), streaming=streaming, memory_max_tokens=memory_max_tokens, router=router)
+
+
+# the agent, memory, cart and uploads of every browser session
+session_manager = SessionManager(
+    llm_factory=create_retail_llm,
+    root_dir=os.getenv('SESSION_DIR', '/tmp/sessions'),
+    max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', 500)),
+    idle_timeout=float(os.getenv('SESSION_IDLE_TIMEOUT', 1800)),
+    max_bytes=int(float(os.getenv('SESSION_MAX_MB', 1024)) * 1024 * 1024),
+    on_remove=get_asset_registry().discard_session,
 )
 
 
-# create LLM objects 
-logger.info("Creating LLM Objects.")
-tools = [
-    ForecastTool(),
-    ProductDescriptionTool(),
-    Text2ShopTool(),
-]
+def session_upload_dir(session_id):
+    """Returns the upload directory of an existing session. Chunked uploads never create a session, so a client can
+    only upload to the session of its own page.
+    """
+    session = session_manager.get(session_id) if session_id else None
+    if session is None:
+        raise ValueError(f"Error: unknown session {session_id}.")
+    return session.upload_dir
 
-retail_ai_system_message = "You are a master or retail analytics and busines processes. You have the ability to analyze data files and images. Do not ask the user for more information. The information in the metadata tags is to be treated as extra information for your analysis, do not reference the tags to the user. If the requested task of information falls into the 'Other' category, then please respond that you cannot assist and you are not liable for any responses. Provide detailed and robust answers in the chat."
-retail_llm = RetailLLM(system_message=retail_ai_system_message, tools=tools)
-retail_llm.tools = tools
-logger.info("Resetting chat history.")
-retail_llm.reset_chat_history()
+
+# resumable chunked uploads for large files, saved to the upload directory of the session
+register_upload_routes(app.server, output_dir=session_upload_dir)
+
+# charts and images published by the tools, served from memory
+register_asset_routes(app.server)
+
+# per stage latency histograms of the chat turns in the Prometheus text format
+register_metrics_route(app.server)
+get_telemetry().add_collector('sessions', session_manager.stats)
+get_telemetry().add_collector('assets', lambda: get_asset_registry().stats())
+get_telemetry().add_collector('jobs', lambda: get_job_manager().stats())
+
+# load the tools, the agent and prophet and open the endpoint connections in the background while the server starts,
+# off by default: it trades a faster first request for the memory of every tool, see bench_startup.py --warmup
+if os.getenv('APP_WARMUP_ENABLED', 'false').lower() == 'true':
+    start_warmup([
+        ('tools', get_tools),
+        ('chat model', lambda: import_modules(['libs.chat_model'])),
+        ('prophet', preload_prophet),
+        ('connections', open_connections),
+    ], delay=float(os.getenv('APP_WARMUP_DELAY', 0)))
 
 
 
 # Callback to reset some objects on the page. 
 # We do not retain session upon refresh for the demo
 @app.callback(
-    [Input('url', 'pathname')]
+    [Input('url', 'pathname')],
+    [State('session-id', 'data')],
 )
-def reset_on_load(_):
+def reset_on_load(_, session_id):
     """Resets 'session' objects whenever the web page is refreshed. 
     """
-    retail_llm.reset_chat_history()
-    cart.empty_cart()
+    with session_manager.session(session_id) as session:
+        session.reset()
+    get_asset_registry().discard_session(session_id)
     
 
 
+def render_asset(asset):
+    """Renders a chart or image published by the tools, None if there is none. """
+    if asset is None:
+        return None
+    if asset.mimetype == PLOTLY_MIMETYPE:
+        logger.info("Display forecast chart %s", asset.digest)
+        return dcc.Graph(figure=json.loads(asset.data))
+    logger.info("Display Image %s", asset.digest)
+    return html.Img(src=asset.url)
+
+
+def save_upload(session, file_name, file_content):
+    """Moves an uploaded file to the session's upload location for processing in tools. The upload component sends
+    its contents with every turn, they are only decoded and saved again when the file changed.
+
+    Returns:
+        bool: True if the file was saved.
+    """
+    if file_content is None:
+        return False
+    digest = hashlib.sha1(f"{file_name}:".encode('utf-8'))
+    digest.update(file_content.encode('utf-8'))
+    if digest.hexdigest() == session.upload_digest:
+        return False
+    from libs.file_handler import save_file_upload
+    logger.info("Saving uploaded file.")
+    file_bytes = file_content.split(",")[1]
+    save_file_upload(input_file_name=file_name, file_bytes=file_bytes, output_file_path=session.upload_dir)
+    session.upload_digest = digest.hexdigest()
+    return True
+
+
+def run_chat_turn(job, session, message, file_name=None, file_content=None):
+    """Runs the agent turn of a message on a worker of the job manager, after saving the upload of the turn.
+
+    Returns:
+        Asset: the chart or image published by the tools during this turn, if any.
+    """
+    from langchain_core.messages import AIMessage
+    from libs.callbacks import JobProgressHandler
+    with session.lock, session_scope(session):
+        if file_content is not None:
+            job.set_progress("Saving the upload")
+        save_upload(session, file_name, file_content)
+        retail_llm = session.llm
+        bot_message = retail_llm.send_chat(msg=message, callbacks=[JobProgressHandler(job)])
+        retail_llm.add_message(AIMessage(bot_message))
+        logger.info("Cart: %s", session.cart.items())
+        return get_asset_registry().pop_latest(session.session_id)
+
+
+def finish_chat_turn(job, status, session):
+    """Answers turns that were stopped or failed so the conversation stays consistent, then releases the session. """
+    from langchain_core.messages import AIMessage
+    try:
+        if status != DONE:
+            message = "The request was stopped." if status == CANCELLED else "Sorry, something went wrong while answering. Please try again."
+            with session.lock:
+                session.llm.add_message(AIMessage(message))
+    finally:
+        session_manager.release(session)
+
+
 # Callback to update chat history when the send button is clicked or Enter key is pressed
 # main orchestrator of events 
 @app.callback(
-    [Output("store-chat-history", "data"), Output("output-image", "children")],
+    [Output("store-chat-history", "data"), Output("output-image", "children"), Output("streaming-response", "children"), Output("stream-interval", "disabled"), Output("store-job", "data")],
     [Input("send-button", "n_clicks"), Input("input-message", "n_submit")],
-    [State("input-message", "value"), State("store-chat-history", "data"), State('upload-file', 'filename'), State('upload-file', 'contents')],
+    [State("input-message", "value"), State("store-chat-history", "data"), State('upload-file', 'filename'), State('upload-file', 'contents'), State('session-id', 'data')],
 )
-def update_chat(n_clicks, n_submit, new_message, chat_history, file_name, file_content):
+def update_chat(n_clicks, n_submit, new_message, chat_history, file_name, file_content, session_id):
     """_summary_
 
     Args:
@@ -90,71 +245,205 @@ def update_chat(n_clicks, n_submit, new_message, chat_history, file_name, file_c
         chat_history (list): the total chat history
         file_name (str): the name of the file that is uploaded 
         file_content (str): the bytes of the file stored as a string
+        session_id (str): the id of the browser session
 
     Returns:
-        tuple: returns the chat history and the image to display if there is one. 
+        tuple: returns the chat history, the image to display if there is one, resets the streamed answer, whether polling is disabled and the background job of the turn.
     """
     logger.info("Updating the Chat.")
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    # one turn of a session at a time, new messages wait for the answer of the current turn
+    if background_chat and get_job_manager().active(session_id):
+        return chat_history, dash.no_update, html.Div("Please wait for the current answer or stop it.", style=MESSAGE_STYLES['assistant']), dash.no_update, dash.no_update
+
+    with session_manager.session(session_id) as session:
+        # Do nothing but save the upload if there is no valid text input from the user
+        display_check = ((n_clicks is None or n_clicks == 0) and (n_submit is None or n_submit == 0)) or (new_message is None or new_message.strip() == "")
+        if display_check:
+            save_upload(session, file_name, file_content)
+            return chat_history, None, None, True, None
+
+        # Add the user message to the client chat
+        chat_history = chat_history or []
+        retail_llm = session.llm
+        retail_llm.add_message(HumanMessage(new_message))
+
+        if not background_chat:
+            # if a file is uploaded then we want to move it to the session's upload location for processing in tools
+            save_upload(session, file_name, file_content)
+
+            # Get bot response and add it to chat history
+            bot_message = retail_llm.send_chat(msg=new_message)
+            retail_llm.add_message(AIMessage(bot_message))
+
+            logger.info("Cart: %s", session.cart.items())
+
+            # display the chart or image published by the tools during this turn, if any
+            asset = get_asset_registry().pop_latest(session.session_id)
+            return chat_history, render_asset(asset), None, True, None
+
+        # the session is held, i.e. not evicted, until the job finished
+        session_manager.hold(session_id)
+        try:
+            job = get_job_manager().submit(run_chat_turn, session, new_message, file_name, file_content, session_id=session_id, description="chat turn", on_done=lambda job, status: finish_chat_turn(job, status, session))
+        except JobQueueFull:
+            logger.warning("Chat turn of session %s rejected, the job queue is full.", session_id)
+            retail_llm.add_message(AIMessage("The assistant is busy, please try again in a moment."))
+            session_manager.release(session)
+            return chat_history, None, None, True, None
+        except BaseException:
+            # the turn was not queued, so its done callback will never release the session
+            session_manager.release(session)
+            raise
+    # the user message is displayed right away, the answer once the job finished
+    return chat_history, None, html.Div(job.progress, style=MESSAGE_STYLES['assistant']), False, {'job_id': job.job_id}
+
+
+# Start polling for the streamed answer as soon as a message is sent
+app.clientside_callback(
+    """
+    function(n_clicks, n_submit, message) {
+        if (!message || !message.trim()) {
+            return window.dash_clientside.no_update;
+        }
+        return false;
+    }
+    """,
+    Output("stream-interval", "disabled", allow_duplicate=True),
+    [Input("send-button", "n_clicks"), Input("input-message", "n_submit")],
+    [State("input-message", "value")],
+    prevent_initial_call=True,
+)
+
 
-    # if a file is uploaded then we want to move it to the tmp location for processing in tools
-    if file_content is not None:
-        logger.info("Saving uploaded file.")
-        file_bytes = file_content.split(",")[1]
-        save_file_upload(input_file_name=file_name, file_bytes=file_bytes)
+# Callback to render the progress and the partial answer while the agent is generating it
+@app.callback(
+    [Output("streaming-response", "children", allow_duplicate=True), Output("store-chat-history", "data", allow_duplicate=True), Output("output-image", "children", allow_duplicate=True), Output("stream-interval", "disabled", allow_duplicate=True), Output("store-job", "data", allow_duplicate=True)],
+    [Input("stream-interval", "n_intervals")],
+    [State("store-job", "data"), State("store-chat-history", "data"), State('session-id', 'data')],
+    prevent_initial_call=True,
+)
+def poll_chat(_, job_data, chat_history, session_id):
+    """Displays the progress of the background turn and the tokens of the final answer that have been streamed so far.
+    Once the turn finished, the chat history and the chart or image of the turn are updated and polling stops.
+
+    Args:
+        job_data (dict): The id of the background job of the turn, None when turns run in the request.
+        chat_history (list): the total chat history
+        session_id (str): the id of the browser session
 
-    # Do nothing if there is no valid text input from the user
-    display_check = ((n_clicks is None or n_clicks == 0) and (n_submit is None or n_submit == 0)) or (new_message is None or new_message.strip() == "")
-    if display_check:
-        return chat_history, None
+    Returns:
+        tuple: the partial answer, the chat history, the image, whether polling is disabled and the job.
+    """
+    unchanged = (dash.no_update,) * 4
+    # polling must not wait for the chat turn holding the session
+    session = session_manager.get(session_id)
+    if job_data is None:
+        if session is None or not session.has_llm:
+            return (dash.no_update, *unchanged)
+        stream = session.llm.stream
+        text = stream.text()
+        if stream.done or not text:
+            return (dash.no_update, *unchanged)
+        return (html.Div(text, style=MESSAGE_STYLES['assistant']), *unchanged)
+
+    job = get_job_manager().get(job_data['job_id'])
+    if job is None:
+        return None, chat_history, dash.no_update, True, None
+    if job.done:
+        asset = job.result if job.status == DONE else None
+        return None, chat_history, render_asset(asset), True, None
+
+    text = session.llm.stream.text() if session is not None and session.has_llm and job.status != QUEUED else ''
+    return html.Div([html.Small(f"{job.progress}..."), html.Div(text)] if text else f"{job.progress}...", style=MESSAGE_STYLES['assistant']), *unchanged
+
+
+# Callback to stop the background turn of the session
+@app.callback(
+    Output("streaming-response", "children", allow_duplicate=True),
+    [Input("cancel-button", "n_clicks")],
+    [State("store-job", "data")],
+    prevent_initial_call=True,
+)
+def cancel_chat(_, job_data):
+    """Cancels the running turn, it stops at the next LLM or tool call of the agent. """
+    if job_data is None or not get_job_manager().cancel(job_data['job_id']):
+        return dash.no_update
+    return html.Div("Stopping...", style=MESSAGE_STYLES['assistant'])
 
-    # Add the user message to the client chat
-    chat_history = chat_history or []
-    retail_llm.add_message(HumanMessage(new_message))
 
-    # Get bot response and add it to chat history
-    bot_message = retail_llm.send_chat(msg=new_message)
-    retail_llm.add_message(AIMessage(bot_message))
+def render_messages(messages):
+    """Renders (role, text) pairs of `RetailLLM.get_display_messages` with different colors per role. """
+    return [html.Div(text, style=MESSAGE_STYLES[role]) for role, text in messages if role is not None]
 
-    logger.info("Cart: %s", cart.cart_items)
 
-    # Return updated chat history and image if there was a file uploaded. 
-    # the only time we display an image is if the user provides a file (image or data)
-    if file_content is not None:
-        image_list = os.listdir('./src/assets')
-        image_list.sort()
-        latest_image = image_list[-1]
-        logger.info("Display Image %s", latest_image)
-        return chat_history, html.Img(src=f'/assets/{latest_image}') 
-    else :
-        return chat_history, None
+def _earlier_button_style(start):
+    return {"display": "block" if start > 0 else "none"}
 
 
 # Callback to render the chat history
-@app.callback(Output("chat-history", "children"),
-              [Input("store-chat-history", "data")])
-def display_chat(_):
-    """Displays the chat history between the user and the assistant. 
+@app.callback(
+    [Output("chat-history", "children"), Output("store-chat-window", "data"), Output("load-earlier-button", "style")],
+    [Input("store-chat-history", "data")],
+    [State("store-chat-window", "data"), State('session-id', 'data')],
+)
+def display_chat(_, window, session_id):
+    """Displays the chat history between the user and the assistant. Only the messages added since the last update
+    are sent to the browser and appended to the rendered history. The metadata tags of the messages, extra
+    information for the LLM, are removed once per message.
 
     Args:
-        chat_history (list): List of dictionaries with alternating assistant and user text. 
+        window (dict): The positions of the first (`start`) and after the last (`end`) message rendered in the browser.
+        session_id (str): the id of the browser session
 
     Returns:
-        list: List of dictionaries containing user and assistant chat messages
+        tuple: the rendered messages or a partial update appending the new ones, the new window and the style of the 'show earlier messages' button.
     """
     logger.info("Displaying the chat")
-    # Define the regular expression pattern to match the metadata tags and their content
-    # we can use this tags to provide additional information to the LLM without the user knowing
-    # i.e. system prompt engineering
-    pattern = r'<metadata>.*?</metadata>'
+    session = session_manager.get(session_id)
+    # a new or evicted session has no messages, its agent is only built by the first chat turn
+    if session is None or not session.has_llm:
+        return [], {'start': 0, 'end': 0}, _earlier_button_style(0)
+    llm = session.llm
+    start, end = (window or {}).get('start', 0), (window or {}).get('end', 0)
+
+    if end > llm.display_length() or end - start <= 0:
+        # first render or the conversation was reset: render the last page
+        start = max(0, llm.display_length() - chat_page_size)
+        messages = llm.get_display_messages(start)
+        return render_messages(messages), {'start': start, 'end': start + len(messages)}, _earlier_button_style(start)
+
+    messages = llm.get_display_messages(end)
+    if not messages:
+        return dash.no_update, dash.no_update, dash.no_update
+    children = Patch()
+    children.extend(render_messages(messages))
+    return children, {'start': start, 'end': end + len(messages)}, dash.no_update
+
+
+# Callback to render the previous page of a long chat history
+@app.callback(
+    [Output("chat-history", "children", allow_duplicate=True), Output("store-chat-window", "data", allow_duplicate=True), Output("load-earlier-button", "style", allow_duplicate=True)],
+    [Input("load-earlier-button", "n_clicks")],
+    [State("store-chat-window", "data"), State('session-id', 'data')],
+    prevent_initial_call=True,
+)
+def load_earlier_messages(_, window, session_id):
+    """Prepends the page of messages before the first rendered message. 
 
-    # loop through the stored chat history in the llm class object and display with different colors
-    messages = []
-    for msg in retail_llm.get_chat_history():
-        if isinstance(msg, HumanMessage):
-            messages.append(html.Div(re.sub(pattern, '', msg.content, flags=re.DOTALL) , style={"background-color": "#dff0d8", "padding": "5px", "border-radius": "5px", "margin-bottom": "5px", "white-space": "pre-wrap"}))
-        elif isinstance(msg, AIMessage):
-            messages.append(html.Div(re.sub(pattern, '', msg.content, flags=re.DOTALL), style={"background-color": "#f2dede", "padding": "5px", "border-radius": "5px", "margin-bottom": "5px", "white-space": "pre-wrap"}))
-    return messages
+    Returns:
+        tuple: a partial update prepending the messages, the new window and the style of the 'show earlier messages' button.
+    """
+    session = session_manager.get(session_id)
+    start = (window or {}).get('start', 0)
+    if session is None or not session.has_llm or start <= 0:
+        return dash.no_update, dash.no_update, _earlier_button_style(0)
+    new_start = max(0, start - chat_page_size)
+    children = Patch()
+    for message in reversed(render_messages(session.llm.get_display_messages(new_start, start))):
+        children.prepend(message)
+    return children, dict(window, start=new_start), _earlier_button_style(new_start)
 
 
 # Callback to clear the input field after sending the message
@@ -176,9 +465,9 @@ def clear_input(_, __):
 @app.callback(
     [Output("cart-contents", "children"), Output("store-show-cart", "data")],
     [Input("cart-button", "n_clicks")],
-    [State("store-show-cart", "data"), State("store-cart", "data")]
+    [State("store-show-cart", "data"), State("store-cart", "data"), State('session-id', 'data')]
 )
-def toggle_cart(n_clicks, show_cart, _):
+def toggle_cart(n_clicks, show_cart, _, session_id):
     """Displays or hides the contents of the user's cart. 
 
     Args:
@@ -193,7 +482,9 @@ def toggle_cart(n_clicks, show_cart, _):
         logger.info("Cart Clicks is None")
         return "", show_cart
     
-    if cart.cart_items != []:
+    session = session_manager.get(session_id)
+    cart_items = session.cart.items() if session is not None else []
+    if cart_items != []:
         cart_items = [
             html.Div(
                 [
@@ -203,7 +494,7 @@ def toggle_cart(n_clicks, show_cart, _):
                     html.P(f"Company: {item['company_name']}"),
                     html.Hr()
                 ]
-            ) for item in cart.cart_items
+            ) for item in cart_items
         ]
         return cart_items, show_cart
     else:
@@ -0,0 +1,82 @@
+// Files larger than the inline limit are rejected by the dcc.Upload component, which would read them into the page
+// and send them base64 encoded with the chat turn, and are sent in chunks to the resumable upload endpoints of
+// libs/chunked_upload.py instead. The session id and the limit are read from the hidden #upload-session element.
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+
+    function uploadSettings() {
+        var holder = document.getElementById('upload-session');
+        if (!holder) {
+            return null;
+        }
+        return {sessionId: holder.dataset.sessionId, maxSize: Number(holder.dataset.maxSize)};
+    }
+
+    function setStatus(text) {
+        var status = document.getElementById('upload-status');
+        if (status) {
+            status.textContent = text;
+        }
+    }
+
+    async function checked(response) {
+        var body = await response.json();
+        // a 409 reports the offset to resume from
+        if (!response.ok && response.status !== 409) {
+            throw new Error(body.error || response.statusText);
+        }
+        return body;
+    }
+
+    async function uploadFile(file, sessionId) {
+        var body = await checked(await fetch('/upload', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size, session_id: sessionId}),
+        }));
+        var uploadId = body.upload_id;
+        var offset = 0;
+        while (offset < file.size) {
+            body = await checked(await fetch('/upload/' + uploadId + '?offset=' + offset, {
+                method: 'PUT',
+                body: file.slice(offset, offset + CHUNK_SIZE),
+            }));
+            offset = body.offset;
+            setStatus('Uploading ' + file.name + ': ' + Math.floor(100 * offset / file.size) + '%');
+        }
+        await checked(await fetch('/upload/' + uploadId + '/complete', {method: 'POST'}));
+    }
+
+    function uploadLargeFiles(files) {
+        var settings = uploadSettings();
+        if (!settings || !files) {
+            return;
+        }
+        Array.prototype.forEach.call(files, function (file) {
+            if (file.size <= settings.maxSize) {
+                return;
+            }
+            setStatus('Uploading ' + file.name + '...');
+            uploadFile(file, settings.sessionId).then(
+                function () { setStatus('Uploaded ' + file.name + '.'); },
+                function (error) { setStatus('The upload of ' + file.name + ' failed: ' + error.message); }
+            );
+        });
+    }
+
+    function inUploadArea(event) {
+        return event.target.closest && event.target.closest('#upload-file');
+    }
+
+    // capture listeners see the files before the upload component handles them
+    window.addEventListener('change', function (event) {
+        if (inUploadArea(event)) {
+            uploadLargeFiles(event.target.files);
+        }
+    }, true);
+    window.addEventListener('drop', function (event) {
+        if (inUploadArea(event) && event.dataTransfer) {
+            uploadLargeFiles(event.dataTransfer.files);
+        }
+    }, true);
+})();
@@ -0,0 +1,90 @@
+"""Compares the accuracy and fit time of the forecasting engines on synthetic daily series.
+
+Usage:
+    python src/benchmarks/bench_forecast_engines.py --series 1000 --days 730 --prophet-series 20
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from libs.timeseries import FORECAST_ENGINES
+
+
+def synthetic_series(n_series, n_days, seed=42):
+    """Builds a long format frame of series with a level, a linear trend, weekly and yearly seasonality and noise. """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_days)
+    level = rng.uniform(50, 500, (n_series, 1))
+    trend = rng.normal(0, 0.05, (n_series, 1)) * level / 100
+    weekly = rng.uniform(0, 0.3, (n_series, 1)) * level * np.sin(2 * np.pi * (t / 7 + rng.uniform(0, 1, (n_series, 1))))
+    yearly = rng.uniform(0, 0.2, (n_series, 1)) * level * np.sin(2 * np.pi * t / 365.25)
+    noise = rng.normal(0, 0.05, (n_series, n_days)) * level
+    y = level + trend * t + weekly + yearly + noise
+    return pd.DataFrame({
+        'sku': np.repeat(np.arange(n_series), n_days),
+        'ds': np.tile(pd.date_range('2020-01-01', periods=n_days, freq='D'), n_series),
+        'y': y.ravel(),
+    })
+
+
+def evaluate(engine_name, history, holdout, horizon, max_workers=None):
+    """Fits an engine on the history and scores its forecast of the holdout. """
+    engine = FORECAST_ENGINES[engine_name]
+    start = time.perf_counter()
+    output_df, _, errors, _ = engine.forecast_many(history, 'sku', periods=horizon, freq='D', max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+
+    scored = holdout.merge(output_df[['sku', 'ds', 'yhat', 'yhat_lower', 'yhat_upper']], on=['sku', 'ds'])
+    abs_error = (scored['y'] - scored['yhat']).abs()
+    return {
+        'engine': engine_name,
+        'series': history['sku'].nunique(),
+        'fit_seconds': round(elapsed, 3),
+        'ms_per_series': round(1000 * elapsed / history['sku'].nunique(), 3),
+        'mae': round(abs_error.mean(), 3),
+        'smape': round(100 * (2 * abs_error / (scored['y'].abs() + scored['yhat'].abs())).mean(), 3),
+        'coverage': round(((scored['y'] >= scored['yhat_lower']) & (scored['y'] <= scored['yhat_upper'])).mean(), 3),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=1000, help='number of series fit by the vectorized engines')
+    parser.add_argument('--days', type=int, default=730, help='length of each series')
+    parser.add_argument('--horizon', type=int, default=30, help='number of held out days to forecast')
+    parser.add_argument('--prophet-series', type=int, default=20, help='number of series fit by prophet, 0 skips prophet')
+    parser.add_argument('--max-workers', type=int, default=None, help='prophet worker processes')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+
+    pdf = synthetic_series(args.series, args.days + args.horizon)
+    cutoff = pdf['ds'].max() - pd.Timedelta(days=args.horizon)
+    history, holdout = pdf[pdf['ds'] <= cutoff], pdf[pdf['ds'] > cutoff]
+
+    results = []
+    for engine_name in FORECAST_ENGINES:
+        if engine_name == 'prophet':
+            if args.prophet_series <= 0:
+                continue
+            # prophet is compared on a subset, the vectorized engines are scored on the same subset as well
+            subset = history['sku'] < args.prophet_series
+            results.append(evaluate(engine_name, history[subset], holdout[holdout['sku'] < args.prophet_series], args.horizon, args.max_workers))
+            for other in FORECAST_ENGINES:
+                if other != 'prophet':
+                    results.append(evaluate(other, history[subset], holdout[holdout['sku'] < args.prophet_series], args.horizon))
+            continue
+        results.append(evaluate(engine_name, history, holdout, args.horizon))
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Offline load test of the chat app with local stand-ins for the Databricks services.
+
+The chat model and image to text endpoints are served by `fake_serving_endpoint.py` and the SQL warehouse is replaced
+by `fake_sql.FakeWarehouse`, each with a configurable latency. Every simulated session uploads a sales file and a
+product image, then sends a mix of chat, shopping, forecast and product description messages. Each turn drives the
+Dash callbacks the browser triggers (`update_chat`, `poll_chat`, `display_chat` and `toggle_cart`) directly, many
+sessions at a time. With background turns (the default) `poll_chat` is called every `--poll-interval` seconds until the
+job of the turn finished.
+
+The p50/p95/p99 latency of every callback and the turns per second are reported. `--save-baseline` stores the results
+and `--baseline` compares a run with them, the exit code is 1 when a metric regressed by more than `--tolerance` or is
+missing. A run with errors or without a completed turn is invalid: its exit code is 1 and it is never saved as a
+baseline.
+
+Usage:
+    python src/benchmarks/bench_load.py --sessions 8 --turns 10 --save-baseline baseline.json
+    python src/benchmarks/bench_load.py --sessions 8 --turns 10 --baseline baseline.json --tolerance 0.2
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import logging
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import dash
+import numpy as np
+import pandas as pd
+from PIL import Image
+from plotly.utils import PlotlyJSONEncoder
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+from fake_sql import FakeWarehouse
+from fake_serving_endpoint import start_fake_serving
+
+
+# the messages of every simulated session, in order and repeated
+DEFAULT_SCRIPT = [
+    "hello, what can you do?",
+    "add 2 apples and milk to my cart",
+    "forecast my data with holt winters",
+    "write a product description for the uploaded image",
+    "what ingredients do i need for lasagna? add them to my cart",
+    "explain the forecast",
+]
+
+CALLBACKS = ['update_chat', 'poll_chat', 'display_chat', 'toggle_cart', 'turn']
+
+# metrics compared with the baseline, a higher value is a regression unless listed in HIGHER_IS_BETTER
+BASELINE_METRICS = [f"{callback}.{stat}" for callback in CALLBACKS for stat in ('p50', 'p95', 'p99')] + ['turns_per_second']
+HIGHER_IS_BETTER = {'turns_per_second'}
+
+
+def sales_upload(days=365, seed=0):
+    """Returns the name and data url of a synthetic daily sales CSV, as sent by the upload component. """
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    pdf = pd.DataFrame({'ds': pd.date_range('2023-01-01', periods=days, freq='D'), 'y': 100 + 10 * np.sin(2 * np.pi * t / 7) + rng.normal(0, 3, days)})
+    return 'data.csv', 'data:text/csv;base64,' + base64.b64encode(pdf.to_csv(index=False).encode()).decode()
+
+
+def image_upload(size=800, seed=0):
+    """Returns the name and data url of a synthetic product photo. """
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return 'product.png', 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def configure_environment(args, host):
+    """Points the app at the fakes. Must run before the app is imported, tools read their settings at import. """
+    os.environ.update({
+        'DATABRICKS_HOST': host,
+        'DATABRICKS_TOKEN': 'benchmark',
+        'ITT_ENDPOINT': f"{host}/serving-endpoints/itt/invocations",
+        'WAREHOUSE_HTTP_PATH': '/sql/fake',
+        'APP_WARMUP_ENABLED': 'false',
+        'SESSION_DIR': tempfile.mkdtemp(prefix='bench_sessions_'),
+        'SESSION_MAX_SESSIONS': str(max(args.sessions * 2, 500)),
+        'CHAT_STREAMING_ENABLED': str(args.streaming).lower(),
+        'CHAT_BACKGROUND_ENABLED': str(args.background).lower(),
+        'JOB_WORKERS': str(args.workers),
+        'TELEMETRY_TRACE_LOG': 'false',
+        # the upload is small, the fake agent asks for holt winters but routed forecasts use the default engine
+        'FORECAST_ENGINE': args.forecast_engine,
+    })
+
+
+class SessionSimulator():
+    """Sends the messages of one simulated browser session through the Dash callbacks. """
+
+    def __init__(self, app, script, turns, think_time=0.0, poll_interval=0.25):
+        self.app = app
+        self.script = script
+        self.turns = turns
+        self.think_time = think_time
+        self.poll_interval = poll_interval
+        self.session_id = uuid.uuid4().hex
+        self.timings = {callback: [] for callback in CALLBACKS}
+        # JSON bytes of the chat history updates sent to the browser
+        self.display_bytes = []
+        self.errors = []
+
+    def _timed(self, callback, *args):
+        start = time.perf_counter()
+        try:
+            return getattr(self.app, callback)(*args)
+        finally:
+            self.timings[callback].append(time.perf_counter() - start)
+
+    def run(self, uploads):
+        chat_history, window = [], {'start': 0, 'end': 0}
+        for turn in range(self.turns):
+            # the first turns carry the uploads, as the upload component keeps its last file
+            file_name, file_content = uploads[turn] if turn < len(uploads) else uploads[-1]
+            message = self.script[turn % len(self.script)]
+            start = time.perf_counter()
+            try:
+                chat_history, _, _, _, job = self._timed('update_chat', turn + 1, None, message, chat_history, file_name, file_content, self.session_id)
+                # the browser polls until the background job of the turn finished
+                while job:
+                    time.sleep(self.poll_interval)
+                    _, new_history, _, _, new_job = self._timed('poll_chat', 1, job, chat_history, self.session_id)
+                    chat_history = chat_history if new_history is dash.no_update else new_history
+                    job = job if new_job is dash.no_update else new_job
+                children, new_window, _ = self._timed('display_chat', chat_history, window, self.session_id)
+                window = window if new_window is dash.no_update else new_window
+                self.display_bytes.append(len(json.dumps(children, cls=PlotlyJSONEncoder)) if children is not dash.no_update else 0)
+                self._timed('toggle_cart', turn + 1, True, None, self.session_id)
+                self.timings['turn'].append(time.perf_counter() - start)
+            except Exception as e:
+                self.errors.append(f"{message!r}: {type(e).__name__}: {e}")
+            if self.think_time:
+                time.sleep(self.think_time)
+        return self
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = np.asarray(values)
+    return {
+        'count': int(values.size),
+        'mean': round(float(values.mean()), 4),
+        'p50': round(float(np.percentile(values, 50)), 4),
+        'p95': round(float(np.percentile(values, 95)), 4),
+        'p99': round(float(np.percentile(values, 99)), 4),
+    }
+
+
+def run_load(args):
+    """Runs the load test and returns its results. """
+    server, host = start_fake_serving(latency=args.llm_latency, token_latency=args.token_latency, itt_latency=args.itt_latency)
+    configure_environment(args, host)
+
+    import app
+    import libs.db_sql as dbsql
+    from libs.telemetry import get_telemetry
+    warehouse = FakeWarehouse(latency=args.sql_latency, connect_latency=args.sql_connect_latency)
+    dbsql.configure_pool(connector=warehouse, connect_kwargs={})
+    if args.warm:
+        app.get_tools()
+
+    uploads = [sales_upload(), image_upload()]
+    simulators = [SessionSimulator(app, DEFAULT_SCRIPT, args.turns, args.think_time, args.poll_interval) for _ in range(args.sessions)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        list(pool.map(lambda simulator: simulator.run(uploads), simulators))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    turns = sum(len(simulator.timings['turn']) for simulator in simulators)
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline', 'tolerance', 'min_delta', 'json', 'verbose')},
+        'seconds': round(elapsed, 3),
+        'turns': turns,
+        'turns_per_second': round(turns / elapsed, 3),
+        'errors': [error for simulator in simulators for error in simulator.errors],
+        'display_chat_bytes': percentiles([value for simulator in simulators for value in simulator.display_bytes]),
+        'warehouse': warehouse.stats(),
+        'stages': get_telemetry().stats(),
+        'jobs': app.get_job_manager().stats(),
+    }
+    for callback in CALLBACKS:
+        results[callback] = percentiles([value for simulator in simulators for value in simulator.timings[callback]])
+    return results
+
+
+def validate(results):
+    """Returns the reasons the run is invalid, a failed turn or a run without turns measures nothing useful. """
+    problems = []
+    if results['errors']:
+        problems.append(f"{len(results['errors'])} turns failed")
+    if not results['turns']:
+        problems.append("no turn completed")
+    return problems
+
+
+def compare(results, baseline, tolerance=0.2, min_delta=0.005):
+    """Compares the results with a baseline. Latencies only regress when they are also `min_delta` seconds slower,
+    so the jitter of sub millisecond callbacks is not flagged. A metric missing from either side is a regression.
+
+    Returns:
+        list: (metric, baseline value, current value, relative change, regressed) tuples.
+    """
+    rows = []
+    for metric in BASELINE_METRICS:
+        section, _, stat = metric.partition('.')
+        current = (results.get(section) or {}).get(stat) if stat else results.get(section)
+        previous = (baseline.get(section) or {}).get(stat) if stat else baseline.get(section)
+        if current is None or previous is None:
+            rows.append((metric, previous, current, None, True))
+            continue
+        if not previous:
+            change = 0.0 if current == previous else (float('inf') if current > previous else float('-inf'))
+        else:
+            change = (current - previous) / previous
+        regressed = change < -tolerance if metric in HIGHER_IS_BETTER else change > tolerance and current - previous >= min_delta
+        rows.append((metric, previous, current, round(change, 4), regressed))
+    return rows
+
+
+def print_report(results, comparison=None):
+    print(f"{results['turns']} turns in {results['seconds']} seconds, {results['turns_per_second']} turns per second, {len(results['errors'])} errors")
+    if results['display_chat_bytes']['count']:
+        print(f"chat history updates: {results['display_chat_bytes']['mean']:.0f} bytes on average, {results['display_chat_bytes']['p99']:.0f} bytes p99")
+    print(f"{'callback':<14}{'count':>8}{'mean s':>10}{'p50 s':>10}{'p95 s':>10}{'p99 s':>10}")
+    for callback in CALLBACKS:
+        r = results[callback]
+        if r['count']:
+            print(f"{callback:<14}{r['count']:>8}{r['mean']:>10}{r['p50']:>10}{r['p95']:>10}{r['p99']:>10}")
+    print(f"\n{'stage':<28}{'count':>8}{'mean s':>10}{'p95 s':>10}")
+    for stage, r in sorted(results['stages'].items(), key=lambda item: -item[1]['mean_seconds'] * item[1]['count']):
+        print(f"{stage:<28}{r['count']:>8}{r['mean_seconds']:>10}{r['p95_seconds']:>10}")
+    for error in results['errors'][:10]:
+        print(f"error: {error}")
+    if comparison:
+        print(f"\n{'metric':<20}{'baseline':>10}{'current':>10}{'change':>10}")
+        for metric, previous, current, change, regressed in comparison:
+            change = 'missing' if change is None else f"{change:+.1%}"
+            print(f"{metric:<20}{str(previous):>10}{str(current):>10}{change:>10}{'  REGRESSION' if regressed else ''}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the chat app against local fakes of the Databricks services.")
+    parser.add_argument('--sessions', type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument('--turns', type=int, default=6, help="chat turns per session")
+    parser.add_argument('--think-time', type=float, default=0.0, help="seconds between the turns of a session")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="seconds before a chat model answer starts")
+    parser.add_argument('--token-latency', type=float, default=0.005, help="seconds between streamed chunks")
+    parser.add_argument('--itt-latency', type=float, default=0.3, help="seconds per described image")
+    parser.add_argument('--sql-latency', type=float, default=0.1, help="seconds per warehouse query")
+    parser.add_argument('--sql-connect-latency', type=float, default=0.5, help="seconds to open a warehouse connection")
+    parser.add_argument('--forecast-engine', default='holt_winters', help="FORECAST_ENGINE of the app")
+    parser.add_argument('--streaming', action=argparse.BooleanOptionalAction, default=True, help="stream the chat model answers")
+    parser.add_argument('--background', action=argparse.BooleanOptionalAction, default=True, help="run the chat turns as background jobs")
+    parser.add_argument('--workers', type=int, default=4, help="JOB_WORKERS, the background turns running at the same time")
+    parser.add_argument('--poll-interval', type=float, default=0.25, help="seconds between the polls of a background turn")
+    parser.add_argument('--warm', action=argparse.BooleanOptionalAction, default=True, help="load the tools before the clock starts")
+    parser.add_argument('--baseline', help="JSON results of a previous run to compare with")
+    parser.add_argument('--save-baseline', help="save the results as a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="relative change of a metric flagged as a regression")
+    parser.add_argument('--min-delta', type=float, default=0.005, help="seconds a latency must also grow by to be flagged")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="keep the app logs and the agent output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    # the agent prints its reasoning to stdout
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        results = run_load(args)
+    logging.disable(logging.NOTSET)
+
+    problems = validate(results)
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.tolerance, args.min_delta)
+    if args.save_baseline:
+        if problems:
+            print(f"Not saving {args.save_baseline}, the run is invalid: {', '.join(problems)}.", file=sys.stderr)
+        else:
+            with open(args.save_baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps(dict(results, comparison=comparison, problems=problems), indent=2))
+    else:
+        print_report(results, comparison)
+    if problems:
+        print(f"Invalid run: {', '.join(problems)}.", file=sys.stderr)
+    if problems or (comparison and any(row[-1] for row in comparison)):
+        sys.exit(1)
@@ -0,0 +1,137 @@
+"""Measures the import time and memory of the app and its modules.
+
+Every module is imported in a fresh interpreter so the numbers include everything it pulls in, as in a restarted
+worker. The resident set size (RSS) is read before and after the import. With `--warmup` the app is also imported
+with `APP_WARMUP_ENABLED=true` and its RSS is read again once the background warm-up finished, the steady state
+memory every worker pays for a fast first request. The run fails if importing the app loads one of
+`APP_DEFERRED_MODULES`, the libraries it imports on first use.
+
+Usage:
+    python src/benchmarks/bench_startup.py
+    python src/benchmarks/bench_startup.py --modules app libs.timeseries prophet --repeat 3
+    python src/benchmarks/bench_startup.py --modules app --warmup
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    'dash',
+    'langchain_core.messages',
+    'libs.chat_model',
+    'libs.timeseries',
+    'libs.product_description',
+    'libs.text_to_shop',
+    'prophet',
+    'plotly.express',
+    'sklearn.metrics',
+    'PIL.Image',
+    'app',
+]
+
+# libraries the app imports on first use, a plain `import app` must not load them. Dash itself loads PIL and the
+# plotly base package.
+APP_DEFERRED_MODULES = [
+    'numpy',
+    'pandas',
+    'pyarrow',
+    'requests',
+    'aiohttp',
+    'langchain_core',
+    'langchain',
+    'prophet',
+    'plotly.express',
+    'sklearn',
+    'scipy',
+    'mlflow',
+]
+
+# runs in the child interpreter, prints the import (and warm-up) seconds, the RSS before and after in MB and which
+# of the deferred modules were loaded
+PROBE = """
+import sys, time, json, importlib
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * {page_size} / 2 ** 20
+before = rss()
+start = time.perf_counter()
+importlib.import_module({module!r})
+{wait}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'rss_before_mb': before, 'rss_after_mb': rss(), 'modules_loaded': len(sys.modules), 'deferred_loaded': [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+# waits for the background warm-up of the app before the import is timed and measured
+WAIT_FOR_WARMUP = "from libs.warmup import wait_for_warmup; wait_for_warmup()"
+
+
+def measure(module, repeat=1, warmup=False):
+    """Imports a module in `repeat` fresh interpreters and returns the median import time and memory.
+
+    Args:
+        module (str): The module to import.
+        repeat (int, optional): The number of fresh interpreters. Defaults to 1.
+        warmup (bool, optional): Enable the app warm-up and measure once it finished. Defaults to False.
+    """
+    env = dict(os.environ)
+    # app.py requires the workspace credentials at import, they are not used
+    env.setdefault('DATABRICKS_TOKEN', 'benchmark')
+    env.setdefault('DATABRICKS_HOST', 'benchmark')
+    # by default the import alone is measured, not the background warm-up it may start
+    env['APP_WARMUP_ENABLED'] = 'true' if warmup else 'false'
+    env['APP_WARMUP_DELAY'] = '0'
+    code = PROBE.format(module=module, page_size=os.sysconf('SC_PAGE_SIZE'), wait=WAIT_FOR_WARMUP if warmup else '', deferred=APP_DEFERRED_MODULES)
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(SRC_DIR), env=dict(env, PYTHONPATH=SRC_DIR), capture_output=True, text=True)
+        if result.returncode != 0:
+            return {'module': module, 'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        'module': f"{module} (warm)" if warmup else module,
+        'import_seconds': round(statistics.median(run['seconds'] for run in runs), 3),
+        'rss_mb': round(statistics.median(run['rss_after_mb'] for run in runs), 1),
+        'rss_added_mb': round(statistics.median(run['rss_after_mb'] - run['rss_before_mb'] for run in runs), 1),
+        'modules_loaded': runs[0]['modules_loaded'],
+        'deferred_loaded': runs[0]['deferred_loaded'],
+    }
+
+
+def validate(results):
+    """Returns the problems of a run: the deferred modules loaded by a plain import of the app. """
+    return [
+        f"importing the app loaded {', '.join(r['deferred_loaded'])}"
+        for r in results if r['module'] == 'app' and r.get('deferred_loaded')
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the import time and memory of the app modules.")
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES, help="modules to import, relative to src")
+    parser.add_argument('--repeat', type=int, default=1, help="fresh interpreters per module, the median is reported")
+    parser.add_argument('--warmup', action='store_true', help="also measure the app once the background warm-up finished")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = [measure(module, repeat=args.repeat) for module in args.modules]
+    if args.warmup:
+        results.append(measure('app', repeat=args.repeat, warmup=True))
+    problems = validate(results)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'module':<28}{'import s':>10}{'RSS MB':>10}{'added MB':>10}{'modules':>9}")
+        for r in results:
+            if 'error' in r:
+                print(f"{r['module']:<28}  failed: {r['error']}")
+                continue
+            print(f"{r['module']:<28}{r['import_seconds']:>10}{r['rss_mb']:>10}{r['rss_added_mb']:>10}{r['modules_loaded']:>9}")
+    if problems:
+        print(f"Invalid run: {', '.join(problems)}.", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,91 @@
+"""Local stand-in for the image to text model serving endpoint.
+
+It accepts the MLflow serving payload (`{"dataframe_records": [{"content": <base64 image>}, ...]}`) and returns one
+description per record as `{"predictions": [...]}`, optionally after a simulated model latency and with random
+failures. Use it to exercise the product description tool and the bulk description CLI without a GPU endpoint.
+
+Usage:
+    python src/benchmarks/fake_itt_endpoint.py --port 5000 --latency 0.2 --per-image-latency 0.05
+    ITT_ENDPOINT=http://localhost:5000/invocations python src/scripts/describe_catalog.py images/ out.jsonl
+"""
+import io
+import json
+import time
+import base64
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+def describe(content):
+    """Returns a deterministic fake description of a base64 encoded image. """
+    with Image.open(io.BytesIO(base64.b64decode(content))) as image:
+        width, height = image.size
+        red, green, blue = image.convert('RGB').resize((1, 1)).getpixel((0, 0))
+    return f"{width}x{height} product image, average color rgb({red}, {green}, {blue})"
+
+
+def make_handler(latency=0.0, per_image_latency=0.0, failure_rate=0.0):
+    """Builds the request handler class of the fake endpoint. """
+
+    class FakeEndpointHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            records = body.get('dataframe_records', [])
+            FakeEndpointHandler.requests_served += 1
+            time.sleep(latency + per_image_latency * len(records))
+            if random.random() < failure_rate:
+                self._reply(503, {'error_code': 'TEMPORARILY_UNAVAILABLE', 'message': 'Simulated failure.'})
+                return
+            try:
+                predictions = [describe(record['content']) for record in records]
+            except Exception as e:
+                self._reply(400, {'error_code': 'BAD_REQUEST', 'message': str(e)})
+                return
+            self._reply(200, {'predictions': predictions})
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return FakeEndpointHandler
+
+
+def start_fake_endpoint(port=0, latency=0.0, per_image_latency=0.0, failure_rate=0.0):
+    """Serves the fake endpoint from a background thread.
+
+    Returns:
+        tuple: the server (call `shutdown()` to stop it) and the invocation url.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency, per_image_latency, failure_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/invocations"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake image to text endpoint.")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--per-image-latency', type=float, default=0.0, help="seconds added per image of a request")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of requests answered with a 503")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args.latency, args.per_image_latency, args.failure_rate))
+    logger.info("Fake image to text endpoint listening on http://127.0.0.1:%s/invocations", args.port)
+    server.serve_forever()
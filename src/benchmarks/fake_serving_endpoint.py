@@ -0,0 +1,181 @@
+"""Local stand-in for the Databricks model serving endpoints at `/serving-endpoints/<name>/invocations`.
+
+Chat requests (`{"messages": [...]}`) are answered in the chat completion format, as a whole or as server-sent events
+when `"stream": true`. The answers follow the structured chat format of the agent: a tool action for clear tool
+requests, and a final answer once the prompt holds a tool observation. MLflow image to text requests
+(`{"dataframe_records": [...]}`) are answered like `fake_itt_endpoint.py`. Point the app at it with
+`DATABRICKS_HOST=http://127.0.0.1:<port>` and `ITT_ENDPOINT=http://127.0.0.1:<port>/serving-endpoints/itt/invocations`.
+
+Usage:
+    python src/benchmarks/fake_serving_endpoint.py --port 8080 --latency 0.5 --token-latency 0.01
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_itt_endpoint import describe
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+INVOCATIONS_PATH = re.compile(r'^/serving-endpoints/([^/]+)/invocations/?$')
+
+# the tool the fake agent picks for a user message, with the arguments it sends
+TOOL_ACTIONS = [
+    (re.compile(r'forecast|predict', re.I), "Forecast Generation Tool", lambda text: {'frequency': 'daily', 'engine': 'holt_winters'}),
+    (re.compile(r'description|describe', re.I), "Product Description Tool Tool", lambda text: {}),
+    (re.compile(r'\b(add|buy|purchase|cart|ingredients)\b', re.I), "Text to shop Tool", lambda text: {'items': [{'product_name': word, 'quantity': 1} for word in re.findall(r'\b(milk|eggs|bread|apples|butter|pasta|tomato sauce|cheese|coffee)\b', text.lower())] or [{'product_name': 'bread', 'quantity': 1}]}),
+]
+
+
+def _action(action, action_input):
+    return "Action:\n```\n" + json.dumps({'action': action, 'action_input': action_input}) + "\n```"
+
+
+def reply(messages):
+    """Returns the answer of the fake chat model to a conversation. """
+    system = ' '.join(m.get('content', '') for m in messages if m.get('role') == 'system')
+    last = messages[-1].get('content', '') if messages else ''
+    if 'recommend a single additional item' in system:
+        # the upsell call of the text to shop tool
+        return "Butter"
+    if 'summarize' in last.lower() and 'New summary' in last:
+        return "The user asked about their cart and forecasts, the assistant used the tools to help."
+    if 'Answer the user based on this result' in last:
+        # a message routed straight to a tool
+        return "Done. I ran the tool for you, here is a summary of the result."
+    if 'Observation:' in last:
+        return _action("Final Answer", "Here is the result of the tool.")
+    # the structured chat prompt appends the scratchpad and a format reminder after the user input
+    user_input = last.split('\n\n')[0]
+    for pattern, tool, arguments in TOOL_ACTIONS:
+        if pattern.search(user_input):
+            return _action(tool, arguments(user_input))
+    return _action("Final Answer", "I can forecast your uploaded data, describe product images and add products to your cart.")
+
+
+def make_handler(latency=0.0, token_latency=0.0, itt_latency=0.0, failure_rate=0.0):
+    """Builds the request handler class of the fake serving endpoints. """
+
+    class FakeServingHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        requests_served = 0
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            FakeServingHandler.requests_served += 1
+            if not INVOCATIONS_PATH.match(self.path.split('?')[0]):
+                self._reply(404, {'error_code': 'ENDPOINT_NOT_FOUND', 'message': f"Unknown path {self.path}."})
+                return
+            if random.random() < failure_rate:
+                self._reply(503, {'error_code': 'TEMPORARILY_UNAVAILABLE', 'message': 'Simulated failure.'})
+                return
+
+            if 'dataframe_records' in body:
+                records = body['dataframe_records']
+                time.sleep(itt_latency * len(records))
+                self._reply(200, {'predictions': [describe(record['content']) for record in records]})
+                return
+
+            time.sleep(latency)
+            content = reply(body.get('messages', []))
+            if body.get('stream'):
+                self._stream(content)
+                return
+            self._reply(200, {
+                'id': uuid.uuid4().hex, 'object': 'chat.completion', 'created': int(time.time()), 'model': 'fake',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': sum(len(m.get('content', '')) // 4 for m in body.get('messages', [])), 'completion_tokens': len(content) // 4},
+            })
+
+        def _stream(self, content):
+            """Sends the answer as server-sent chat completion chunks of a few characters each. """
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            chunks = [content[i:i + 8] for i in range(0, len(content), 8)]
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(token_latency)
+                delta = {'role': 'assistant', 'content': chunk} if i == 0 else {'content': chunk}
+                self._write_chunk(f"data: {json.dumps({'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return FakeServingHandler
+
+
+class FakeServingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping their keep-alive connections are expected
+        logger.debug("Connection of %s closed with an error.", client_address, exc_info=True)
+
+
+def start_fake_serving(port=0, latency=0.0, token_latency=0.0, itt_latency=0.0, failure_rate=0.0):
+    """Serves the fake endpoints from a background thread.
+
+    Args:
+        port (int, optional): The port, 0 picks a free port. Defaults to 0.
+        latency (float, optional): Seconds before a chat answer starts. Defaults to 0.
+        token_latency (float, optional): Seconds between streamed chunks. Defaults to 0.
+        itt_latency (float, optional): Seconds per described image. Defaults to 0.
+        failure_rate (float, optional): Share of requests failing with a 503. Defaults to 0.
+
+    Returns:
+        tuple: the server (call `shutdown()` to stop it) and its base url, the value of `DATABRICKS_HOST`.
+    """
+    server = FakeServingServer(('127.0.0.1', port), make_handler(latency, token_latency, itt_latency, failure_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a local fake of the Databricks model serving endpoints.")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before a chat answer starts")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument('--itt-latency', type=float, default=0.0, help="seconds per described image")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of requests failing with a 503")
+    args = parser.parse_args()
+
+    server, url = start_fake_serving(args.port, args.latency, args.token_latency, args.itt_latency, args.failure_rate)
+    logger.info("Fake serving endpoints at %s/serving-endpoints/<name>/invocations, press Ctrl+C to stop.", url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
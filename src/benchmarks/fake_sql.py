@@ -0,0 +1,153 @@
+"""Local stand-in for the `databricks.sql` connector.
+
+`FakeWarehouse` exposes `connect()` and `exc` like the connector module, so it can be plugged into the shared
+connection pool with `db_sql.configure_pool(connector=FakeWarehouse(latency=0.05), connect_kwargs={})`. It serves a
+synthetic product catalog: the catalog query of the product index returns every product and the batched
+`ai_similarity` search query of the text to shop tool returns the best matches of every search term.
+
+Usage:
+    from benchmarks.fake_sql import FakeWarehouse
+    warehouse = FakeWarehouse(latency=0.05, connect_latency=0.5)
+    db_sql.configure_pool(connector=warehouse, connect_kwargs={})
+"""
+import re
+import time
+import random
+import difflib
+import threading
+from types import SimpleNamespace
+from collections import namedtuple
+
+
+PRODUCTS = [
+    'apples', 'bananas', 'avocados', 'oranges', 'strawberries', 'grapes', 'lemons', 'tomatoes', 'potatoes', 'onions',
+    'carrots', 'lettuce', 'spinach', 'milk', 'eggs', 'butter', 'cheddar cheese', 'yogurt', 'bread', 'bagels',
+    'tortillas', 'rice', 'pasta', 'lasagna noodles', 'ground beef', 'chicken breast', 'salmon', 'bacon', 'coffee',
+    'tea', 'orange juice', 'soda', 'sparkling water', 'cereal', 'oatmeal', 'peanut butter', 'jam', 'olive oil',
+    'flour', 'sugar', 'salt', 'black pepper', 'tomato sauce', 'salsa', 'chips', 'cookies', 'ice cream', 'diapers',
+    'paper towels', 'dish soap',
+]
+BRANDS = ['Acme', 'Fresh Farms', 'Daily Pantry', 'Green Valley', 'Market Basket', 'Sunrise']
+
+CatalogRow = namedtuple('CatalogRow', ['name', 'id', 'description', 'company_name'])
+SearchRow = namedtuple('SearchRow', ['request_id', 'name', 'id', 'description', 'company_name'])
+
+SEARCH_VALUES = re.compile(r"\((\d+),\s*'((?:[^'\\]|\\.)*)'\)")
+SEARCH_LIMIT = re.compile(r'<=\s*(\d+)')
+
+
+class OperationalError(Exception):
+    pass
+
+
+class InterfaceError(Exception):
+    pass
+
+
+def build_catalog(size=300, seed=0):
+    """Builds a synthetic product catalog of `size` branded products. """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(size):
+        product, brand = PRODUCTS[i % len(PRODUCTS)], BRANDS[(i // len(PRODUCTS)) % len(BRANDS)]
+        name = f"{brand} {product.title()}"
+        rows.append(CatalogRow(name, i + 1, f"{name}, {rng.choice(['organic', 'family size', 'value pack', 'fresh'])}", brand))
+    return rows
+
+
+class FakeCursor():
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query):
+        self._rows = self.warehouse.run(query)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        self._rows = []
+
+
+class FakeConnection():
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self.open = True
+
+    def cursor(self):
+        if not self.open:
+            raise InterfaceError("Connection is closed.")
+        return FakeCursor(self.warehouse)
+
+    def close(self):
+        self.open = False
+
+
+class FakeWarehouse():
+    """A fake SQL warehouse with configurable connection and query latency. """
+
+    exc = SimpleNamespace(OperationalError=OperationalError, InterfaceError=InterfaceError)
+
+    def __init__(self, latency=0.0, connect_latency=0.0, failure_rate=0.0, catalog_size=300, seed=0):
+        """
+        Args:
+            latency (float, optional): Seconds every query takes. Defaults to 0.
+            connect_latency (float, optional): Seconds opening a connection takes. Defaults to 0.
+            failure_rate (float, optional): Share of queries failing with an `OperationalError`. Defaults to 0.
+            catalog_size (int, optional): The number of products in the catalog. Defaults to 300.
+            seed (int, optional): The seed of the catalog and the failures. Defaults to 0.
+        """
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.failure_rate = failure_rate
+        self.catalog = build_catalog(catalog_size, seed)
+        self._names = [row.name.lower() for row in self.catalog]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {'connections': 0, 'queries': 0, 'failures': 0}
+
+    def connect(self, **kwargs):
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self._stats['connections'] += 1
+        return FakeConnection(self)
+
+    def run(self, query):
+        """Executes a query of the app against the synthetic catalog. """
+        time.sleep(self.latency)
+        with self._lock:
+            self._stats['queries'] += 1
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self._stats['failures'] += 1
+        if failed:
+            raise OperationalError("Simulated warehouse failure.")
+
+        terms = SEARCH_VALUES.findall(query)
+        if terms:
+            limit = SEARCH_LIMIT.search(query)
+            k = int(limit.group(1)) if limit else 1
+            return [SearchRow(int(request_id), *row) for request_id, term in terms for row in self.search(term.replace("\\'", "'"), k)]
+        if re.search(r'select\s+name,\s*id,\s*description,\s*company_name\s+from', query, re.I):
+            return list(self.catalog)
+        return []
+
+    def search(self, term, k=1):
+        """Returns the k catalog products whose name is the most similar to the term. """
+        term = term.lower()
+        scores = [(difflib.SequenceMatcher(None, term, name).ratio() + (1.0 if term in name else 0.0), i) for i, name in enumerate(self._names)]
+        return [self.catalog[i] for _, i in sorted(scores, reverse=True)[:k]]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
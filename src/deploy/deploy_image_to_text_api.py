@@ -44,80 +44,15 @@ processor = InstructBlipProcessor.from_pretrained("Salesforce/instructblip-flan-
 
 # COMMAND ----------
 
-class ImageToTextModel(mlflow.pyfunc.PythonModel):
-
-  def load_context(self, context): 
-    from transformers import InstructBlipProcessor, InstructBlipForConditionalGeneration
-    from transformers.generation import GenerationConfig
-    import torch
-
-    model = InstructBlipForConditionalGeneration.from_pretrained("Salesforce/instructblip-flan-t5-xl")
-    processor = InstructBlipProcessor.from_pretrained("Salesforce/instructblip-flan-t5-xl", load_in_8bit=True, cache_dir=context.artifacts["processor"], local_files_only=True)
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model.to(device)
-
-
-  def predict(self, context, model_input, prompt="Describe the image using tags from the fashion industry? Mention style and type. Please be concise."):
-    """Convert an image binary and generate a description"""
-
-    from PIL import Image
-    from io import BytesIO
-    import base64
-    import requests
-    import warnings
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"---------------- Model Input: {model_input}",flush=True)
-    print(f"---------------- Model Type: {type(model_input)}", flush=True)
-
-    img = model_input["content"][0] # get the encoded image
-    print(f"---------------- Get individual row", flush=True)
-
-    decoded_img_data = base64.b64decode(img)
-    print(f"---------------- Data decoded", flush=True)
-    image = Image.open(BytesIO(decoded_img_data))
-    print(f"---------------- Image Loaded", flush=True)
-
-    # Additional prompt engineering represents one of the easiest areas to experiment with the underlying model behavior.
-    inputs = processor(images=image, text=prompt, return_tensors="pt").to(device)
-    print(f"---------------- Inputs set", flush=True)
-
-    model.to('cuda')
-    gen_conf = GenerationConfig.from_model_config(model.config)
-    gen_conf.cache_implementation='dynamic'
-    gen_conf.output_logits = False
-    print(f"---------------- Created Config", flush=True)
-
-    try :
-      # Model parameters can be tuned as desired.
-      outputs = model.generate(
-        **inputs,
-        do_sample=False,
-        num_beams=5,
-        max_length=256,
-        min_length=1,
-        top_p=0.9,
-        repetition_penalty=1.5,
-        length_penalty=1.0,
-        temperature=1,
-        generation_config=gen_conf,
-      )
-      print(f"---------------- Outputs set", flush=True)
-      generated_text = processor.batch_decode(outputs, skip_special_tokens=True)[0].strip()
-      print(f"---------------- Generated Text", flush=True)
-      return(generated_text)
-    except Exception as e:
-      print(f"------------ An exception occurred: {str(e)}", flush=True)
-      return str(e)
-
-
-
+# the served model lives in image_to_text_model.py, next to this notebook, and is shipped with the model through code_paths
+from image_to_text_model import ImageToTextModel
 
 # COMMAND ----------
 
 reqs = ["torch==2.0.1","transformers==4.38.1", "cloudpickle==2.0.0","accelerate>=0.25.0","torchvision==0.15.2","optimum==1.17.1"]
 content_list = ["This is image data as a string"]
 pdf = pd.DataFrame({'content': content_list})
-api_output = "This is an image description"
+api_output = pd.DataFrame({'description': ["This is an image description"], 'error': [""]})
 
 # Log the model
 with mlflow.start_run(run_name = "rac_image_to_text_model"):
@@ -128,6 +63,7 @@ with mlflow.start_run(run_name = "rac_image_to_text_model"):
       artifact_path=model_name,
       python_model=ImageToTextModel(),
       artifacts={'processor': './processor_cache'},
+      code_paths=['image_to_text_model.py'],
       signature=signature, 
       pip_requirements=reqs
   )
@@ -0,0 +1,113 @@
+"""The MLflow model served by the image to text endpoint, logged by `deploy_image_to_text_api.py`.
+
+It is a plain module (shipped with the model through `code_paths`) so the batching and error handling of `predict`
+can be tested without a GPU or the InstructBLIP weights.
+"""
+import base64
+import logging
+from io import BytesIO
+import pandas as pd
+import mlflow.pyfunc
+from PIL import Image
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+class ImageToTextModel(mlflow.pyfunc.PythonModel):
+    """Describes product images with InstructBLIP.
+
+    The model, processor and generation config are created once in `load_context`. `predict` describes every row of
+    the request in mini batches of at most `max_batch_size` images and returns one description per row. Rows that
+    could not be described carry their error instead, the other rows are still answered.
+    """
+
+    def __init__(self, max_batch_size=8, prompt="Describe the image using tags from the fashion industry? Mention style and type. Please be concise.", generation_kwargs=None):
+        self.max_batch_size = max_batch_size
+        self.prompt = prompt
+        # Model parameters can be tuned as desired.
+        self.generation_kwargs = generation_kwargs or dict(
+            do_sample=False,
+            num_beams=5,
+            max_length=256,
+            min_length=1,
+            top_p=0.9,
+            repetition_penalty=1.5,
+            length_penalty=1.0,
+            temperature=1,
+        )
+
+    def load_context(self, context):
+        import os
+        from transformers import InstructBlipProcessor, InstructBlipForConditionalGeneration
+
+        # the batch size can be tuned per endpoint through its environment variables
+        self.max_batch_size = int(os.getenv("ITT_MAX_BATCH_SIZE", self.max_batch_size))
+
+        model = InstructBlipForConditionalGeneration.from_pretrained("Salesforce/instructblip-flan-t5-xl")
+        processor = InstructBlipProcessor.from_pretrained("Salesforce/instructblip-flan-t5-xl", load_in_8bit=True, cache_dir=context.artifacts["processor"], local_files_only=True)
+        self.setup(model, processor)
+
+    def setup(self, model, processor, device=None):
+        """Keeps the model on its device in eval mode and builds the generation config used by every request. """
+        import torch
+        from transformers.generation import GenerationConfig
+
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = model.to(self.device).eval()
+        self.processor = processor
+        self.gen_conf = GenerationConfig.from_model_config(model.config)
+        self.gen_conf.cache_implementation = 'dynamic'
+        self.gen_conf.output_logits = False
+        self.gen_conf.update(**self.generation_kwargs)
+        return self
+
+    def _decode_image(self, content):
+        with Image.open(BytesIO(base64.b64decode(content))) as image:
+            return image.convert('RGB')
+
+    def _describe(self, images):
+        """Describes a mini batch of images with one padded `generate` call. """
+        import torch
+
+        inputs = self.processor(images=images, text=[self.prompt] * len(images), return_tensors="pt", padding=True).to(self.device)
+        with torch.inference_mode():
+            outputs = self.model.generate(**inputs, generation_config=self.gen_conf)
+        return [text.strip() for text in self.processor.batch_decode(outputs, skip_special_tokens=True)]
+
+    def predict(self, context, model_input):
+        """Describes every image of the request.
+
+        Args:
+            context: The MLflow context, unused.
+            model_input (pd.DataFrame): The base64 encoded images in a `content` column.
+
+        Returns:
+            pd.DataFrame: one row per image with its `description`, or the `error` that prevented it.
+        """
+        contents = list(model_input["content"])
+        descriptions = [None] * len(contents)
+        errors = [None] * len(contents)
+
+        # rows that can not be decoded are answered with the error, the other rows are still described
+        decoded = []
+        for i, content in enumerate(contents):
+            try:
+                decoded.append((i, self._decode_image(content)))
+            except Exception as e:
+                logger.warning("Row %s is not a readable image: %s", i, e)
+                errors[i] = f"{type(e).__name__}: {e}"
+
+        for start in range(0, len(decoded), self.max_batch_size):
+            batch = decoded[start:start + self.max_batch_size]
+            try:
+                texts = self._describe([image for _, image in batch])
+            except Exception as e:
+                logger.exception("Describing rows %s failed.", [i for i, _ in batch])
+                for i, _ in batch:
+                    errors[i] = f"{type(e).__name__}: {e}"
+                continue
+            for (i, _), text in zip(batch, texts):
+                descriptions[i] = text
+        return pd.DataFrame({'description': descriptions, 'error': errors})
@@ -1,7 +1,12 @@
+import os
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 
 
+# files up to this size are sent through dcc.Upload, larger files through the chunked upload endpoints, see assets/chunked_upload.js
+UPLOAD_INLINE_MAX_BYTES = int(float(os.getenv('UPLOAD_INLINE_MAX_MB', 10)) * 1024 * 1024)
+
+
 # Sidebar layout
 sidebar = html.Div(
     [
@@ -28,7 +33,13 @@ main_content = html.Div(
         dbc.Row(
             dbc.Col(
                 html.Div(
-                    id="chat-history",
+                    [
+                        # long conversations only render their last page, earlier pages are loaded on demand
+                        html.Button("Show earlier messages", id="load-earlier-button", className="btn btn-link btn-sm", style={"display": "none"}),
+                        html.Div(id="chat-history"),
+                        # partial answer streamed while the agent is still generating
+                        html.Div(id="streaming-response"),
+                    ],
                     style={"width": "100%", "height": "300px", "overflowY": "scroll", "border": "1px solid #ccc", "padding": "10px"},
                 ),
                 className="mb-4",
@@ -44,7 +55,7 @@ main_content = html.Div(
                         style={"width": "100%"},
                         n_submit=0,
                     ),
-                    width=10,
+                    width=8,
                 ),
                 dbc.Col(
                     dbc.Button(
@@ -52,6 +63,13 @@ main_content = html.Div(
                     ),
                     width=2,
                 ),
+                dbc.Col(
+                    # stops the answer that is being generated in the background
+                    dbc.Button(
+                        "Stop", id="cancel-button", color="secondary", outline=True, className="w-100"
+                    ),
+                    width=2,
+                ),
             ],
             className="mb-2",
         ),
@@ -71,10 +89,18 @@ main_content = html.Div(
                 'textAlign': 'center',
                 'margin-top': '10px'
             },
-            multiple=False
+            multiple=False,
+            max_size=UPLOAD_INLINE_MAX_BYTES,
         ),
+        # progress of the chunked uploads of large files
+        html.Div(id='upload-status', style={'width': '100%', 'textAlign': 'center', 'margin-top': '5px'}),
         html.Div(id='output-image', style={'width': '100%', 'display': 'inline-block', 'textAlign': 'center', 'margin-top': '10px'}),
         dcc.Store(id="store-chat-history", data=[], storage_type='session'),
+        # positions of the first and after the last message rendered in the chat history
+        dcc.Store(id="store-chat-window", data={'start': 0, 'end': 0}),
+        # background job generating the answer of the current turn
+        dcc.Store(id="store-job", data=None),
+        dcc.Interval(id="stream-interval", interval=250, disabled=True),
         html.Div(id='page-load-trigger', style={'display': 'none'}),
         dcc.Location(id='url', refresh=False),
     ]
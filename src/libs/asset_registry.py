@@ -0,0 +1,133 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from flask import Response, abort
+from libs.lru_cache import TTLLRUCache
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+PLOTLY_MIMETYPE = 'application/vnd.plotly.v1+json'
+
+
+class Asset():
+    """A file produced by a tool for display, e.g. a product image or a forecast chart. """
+
+    def __init__(self, session_id, digest, data, mimetype):
+        self.session_id = session_id
+        self.digest = digest
+        self.data = data
+        self.mimetype = mimetype
+        self.created_at = time.time()
+
+    @property
+    def url(self):
+        return f"/asset/{self.session_id}/{self.digest}"
+
+
+class AssetRegistry():
+    """In memory registry of the assets tools publish for display.
+
+    Assets are keyed by session and the sha256 of their content, so republishing the same content is free and a
+    session can never read another session's assets. The registry is bounded by entry count and total size and assets
+    expire after `ttl` seconds. The latest asset of each session is tracked so the app finds it in O(1).
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=256 * 1024 * 1024, ttl=3600):
+        """
+        Args:
+            max_entries (int, optional): The maximum number of assets. Defaults to 1024.
+            max_bytes (int, optional): The maximum total size of the assets. Defaults to 256 MB.
+            ttl (float, optional): Seconds an asset stays available. Defaults to 3600.
+        """
+        self.ttl = ttl
+        self._assets = TTLLRUCache(max_size=max_entries, ttl=ttl, max_bytes=max_bytes, size_fn=lambda asset: len(asset.data))
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def publish(self, session_id, data, mimetype):
+        """Stores an asset and makes it the latest asset of the session.
+
+        Args:
+            session_id (str): The session the asset belongs to.
+            data (bytes): The content of the asset.
+            mimetype (str): The content type, e.g. 'image/png' or `PLOTLY_MIMETYPE` for Plotly figure JSON.
+
+        Returns:
+            Asset: the published asset.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        asset = Asset(session_id, digest, data, mimetype)
+        self._assets.put((session_id, digest), asset)
+        with self._lock:
+            self._latest[session_id] = digest
+        logger.info("Published %s asset %s (%s bytes) for session %s.", mimetype, digest[:12], len(data), session_id)
+        return asset
+
+    def get(self, session_id, digest):
+        """Returns an asset of a session, None if it does not exist or expired. """
+        return self._assets.get((session_id, digest))
+
+    def latest(self, session_id):
+        """Returns the latest asset published for the session. """
+        with self._lock:
+            digest = self._latest.get(session_id)
+        return self.get(session_id, digest) if digest is not None else None
+
+    def pop_latest(self, session_id):
+        """Returns the latest asset published for the session since the last call, e.g. during the current chat turn. """
+        with self._lock:
+            digest = self._latest.pop(session_id, None)
+        return self.get(session_id, digest) if digest is not None else None
+
+    def discard_session(self, session_id):
+        """Removes every asset of a session. """
+        with self._lock:
+            self._latest.pop(session_id, None)
+        for key, _ in self._assets.items():
+            if key[0] == session_id:
+                self._assets.pop(key)
+
+    def stats(self):
+        return self._assets.stats()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_asset_registry():
+    """Returns the shared asset registry configured from the environment. """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = AssetRegistry(
+                    max_entries=int(os.getenv('ASSET_REGISTRY_MAX_ENTRIES', 1024)),
+                    max_bytes=int(float(os.getenv('ASSET_REGISTRY_MAX_MB', 256)) * 1024 * 1024),
+                    ttl=float(os.getenv('ASSET_REGISTRY_TTL', 3600)),
+                )
+    return _registry
+
+
+def register_asset_routes(server):
+    """Serves the registered assets at `/asset/<session_id>/<digest>` from the Flask server of the Dash app. Content
+    addressed urls never change content, so browsers may cache them for the lifetime of the asset.
+    """
+
+    @server.route('/asset/<session_id>/<digest>')
+    def serve_asset(session_id, digest):
+        registry = get_asset_registry()
+        asset = registry.get(session_id, digest)
+        if asset is None:
+            abort(404)
+        response = Response(asset.data, mimetype=asset.mimetype)
+        response.headers['Cache-Control'] = f"private, max-age={int(registry.ttl)}, immutable"
+        response.headers['ETag'] = digest
+        return response
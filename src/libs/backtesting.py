@@ -0,0 +1,180 @@
+import os
+import random
+import logging
+import itertools
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+from libs.warmup import wait_for_warmup
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+# Prophet parameters searched by default, the interval width does not change the point forecast and is not searched
+DEFAULT_SEARCH_SPACE = {
+    'changepoint_prior_scale': [0.01, 0.1, 0.5],
+    'seasonality_mode': ['additive', 'multiplicative'],
+}
+
+
+def rolling_origin_cutoffs(pdf, horizon=30, n_folds=3, step=None, min_train=None):
+    """Returns the cutoff dates of a rolling origin cross validation.
+
+    The last fold forecasts the final `horizon` observations, every earlier fold moves the origin back by `step`.
+
+    Args:
+        pdf (pd.DataFrame): The history with a `ds` column.
+        horizon (int, optional): The number of observations forecast by every fold. Defaults to 30.
+        n_folds (int, optional): The number of folds. Defaults to 3.
+        step (int, optional): The number of observations between origins. Defaults to `horizon`.
+        min_train (int, optional): The minimum number of training observations. Defaults to 3 * `horizon`.
+
+    Returns:
+        list: the cutoff dates, oldest first. Folds without enough training data are dropped.
+    """
+    step = step or horizon
+    min_train = min_train or 3 * horizon
+    dates = np.sort(pdf['ds'].unique())
+    cutoffs = []
+    for fold in range(n_folds):
+        end = len(dates) - horizon - fold * step
+        if end < min_train:
+            break
+        cutoffs.append(pd.Timestamp(dates[end - 1]))
+    return cutoffs[::-1]
+
+
+def parameter_grid(space):
+    """Returns every combination of the search space as a list of parameter dictionaries. """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_candidates(space, n_candidates, seed=42):
+    """Samples distinct parameter combinations of the search space. """
+    grid = parameter_grid(space)
+    return random.Random(seed).sample(grid, min(n_candidates, len(grid)))
+
+
+def _evaluate_fold(pdf, cutoff, horizon, params, interval_width=0.8):
+    """Fits Prophet with `params` on the history up to `cutoff` and scores the next `horizon` observations.
+
+    Returns:
+        dict: the out of sample mae, rmse and interval coverage of the fold.
+    """
+    history = pdf[pdf['ds'] <= cutoff]
+    actuals = pdf[pdf['ds'] > cutoff].sort_values('ds').head(horizon)
+    model = Prophet(interval_width=interval_width, **params)
+    model.fit(history[['ds', 'y']])
+    forecast = model.predict(actuals[['ds']])
+    errors = actuals['y'].to_numpy() - forecast['yhat'].to_numpy()
+    covered = (actuals['y'].to_numpy() >= forecast['yhat_lower'].to_numpy()) & (actuals['y'].to_numpy() <= forecast['yhat_upper'].to_numpy())
+    return {'mae': float(np.abs(errors).mean()), 'rmse': float(np.sqrt((errors ** 2).mean())), 'coverage': float(covered.mean())}
+
+
+def tune(pdf, space=None, horizon=30, n_folds=3, search='grid', n_candidates=10, metric='mae', max_workers=None, early_stopping=True, tolerance=1.5, seed=42, interval_width=0.8):
+    """Rolling origin cross validation and hyperparameter search of Prophet models.
+
+    Every (candidate, fold) pair is a task of a process pool. The first fold of every candidate is submitted at once
+    and the next fold of a candidate only once its previous fold finished, so every candidate is scored on the first
+    folds early. With early stopping a candidate whose mean error relative to the best error of the same folds exceeds
+    `tolerance` is dropped and its remaining folds are never fit.
+
+    Args:
+        pdf (pd.DataFrame): The history with `ds` and `y` columns.
+        space (dict, optional): Lists of Prophet parameter values to search. Defaults to `DEFAULT_SEARCH_SPACE`.
+        horizon (int, optional): The number of observations forecast by every fold. Defaults to 30.
+        n_folds (int, optional): The number of folds. Defaults to 3.
+        search (str, optional): 'grid' or 'random'. Defaults to 'grid'.
+        n_candidates (int, optional): The number of candidates of a random search. Defaults to 10.
+        metric (str, optional): 'mae' or 'rmse'. Ties are broken by the coverage closest to `interval_width`. Defaults to 'mae'.
+        max_workers (int, optional): The number of worker processes. Defaults to the FORECAST_MAX_WORKERS environment variable or the CPU count.
+        early_stopping (bool, optional): Drop clearly losing candidates before all of their folds ran. Defaults to True.
+        tolerance (float, optional): The relative error beyond which a candidate is dropped. Defaults to 1.5.
+        seed (int, optional): The random search seed. Defaults to 42.
+        interval_width (float, optional): The width of the uncertainty interval whose coverage is reported. Defaults to 0.8.
+
+    Returns:
+        dict: the best parameters, their cross validated metrics and a frame with the results of every candidate.
+
+    Raises:
+        ValueError: if the history is too short for a single fold, the space searches the interval width or every candidate failed.
+    """
+    space = space or DEFAULT_SEARCH_SPACE
+    if 'interval_width' in space:
+        raise ValueError("interval_width does not change the forecast error, pass it as `interval_width` instead of searching it.")
+    candidates = parameter_grid(space) if search == 'grid' else random_candidates(space, n_candidates, seed=seed)
+    cutoffs = rolling_origin_cutoffs(pdf, horizon=horizon, n_folds=n_folds)
+    if not cutoffs:
+        raise ValueError(f"Not enough history for a backtest with a horizon of {horizon}.")
+    max_workers = max_workers or int(os.getenv('FORECAST_MAX_WORKERS', os.cpu_count() or 1))
+    logger.info("Backtesting %s candidates on %s folds across %s workers.", len(candidates), len(cutoffs), max_workers)
+
+    history = pdf[['ds', 'y']]
+    scores = [{} for _ in candidates]
+    pruned = set()
+    # the workers are forked, see `wait_for_warmup`
+    wait_for_warmup()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        def submit(candidate, fold):
+            return executor.submit(_evaluate_fold, history, cutoffs[fold], horizon, candidates[candidate], interval_width), (candidate, fold)
+
+        pending = dict(submit(candidate, 0) for candidate in range(len(candidates)))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            finished = []
+            for future in done:
+                candidate, fold = pending.pop(future)
+                try:
+                    scores[candidate][fold] = future.result()
+                    finished.append((candidate, fold))
+                except Exception as e:
+                    logger.warning("Backtest of %s failed on fold %s: %s", candidates[candidate], fold, e)
+                    pruned.add(candidate)
+
+            if early_stopping:
+                best_fold = {}
+                for candidate_scores in scores:
+                    for fold, fold_scores in candidate_scores.items():
+                        best_fold[fold] = min(best_fold.get(fold, np.inf), fold_scores[metric])
+                for candidate, candidate_scores in enumerate(scores):
+                    if candidate in pruned or not candidate_scores:
+                        continue
+                    relative = np.mean([fold_scores[metric] / max(best_fold[fold], 1e-12) for fold, fold_scores in candidate_scores.items()])
+                    if relative > tolerance:
+                        pruned.add(candidate)
+                        logger.info("Early stopping candidate %s after %s folds (relative %s %.2f), skipped %s folds.", candidates[candidate], len(candidate_scores), metric, relative, len(cutoffs) - len(candidate_scores))
+
+            # the next fold of the remaining candidates
+            for candidate, fold in finished:
+                if candidate not in pruned and fold + 1 < len(cutoffs):
+                    future, task = submit(candidate, fold + 1)
+                    pending[future] = task
+
+    rows = []
+    for candidate, params in enumerate(candidates):
+        fold_scores = list(scores[candidate].values())
+        row = dict(params, folds=len(fold_scores), pruned=candidate in pruned)
+        for name in ('mae', 'rmse', 'coverage'):
+            row[name] = round(float(np.mean([s[name] for s in fold_scores])), 4) if fold_scores else np.nan
+        rows.append(row)
+    results_df = pd.DataFrame(rows)
+
+    complete = results_df[(~results_df['pruned']) & (results_df['folds'] == len(cutoffs))]
+    if complete.empty:
+        raise ValueError("Every backtest candidate failed.")
+    best = complete.assign(_gap=(complete['coverage'] - interval_width).abs()).sort_values([metric, '_gap']).iloc[0]
+    best_params = {name: best[name].item() if hasattr(best[name], 'item') else best[name] for name in space}
+    logger.info("Best backtest parameters %s with %s %s.", best_params, metric, best[metric])
+    return {
+        'params': best_params,
+        'mae': best['mae'],
+        'rmse': best['rmse'],
+        'coverage': best['coverage'],
+        'folds': len(cutoffs),
+        'horizon': horizon,
+        'results': results_df,
+    }
@@ -0,0 +1,282 @@
+"""Generates product descriptions for a whole catalog of images with the image to text endpoint.
+
+Images are packed into multi record `dataframe_records` requests, a bounded number of requests is kept in flight and
+results are streamed to a JSONL file or a directory of Parquet parts. The output doubles as the checkpoint: images
+already in it are skipped, so an interrupted run resumes where it stopped. A failed request is retried in halves down
+to single images, and the images that still fail are logged to `<output>.errors.jsonl` and retried by the next run. Test against a local fake endpoint with
+`python src/benchmarks/fake_itt_endpoint.py`. The command line is `src/scripts/describe_catalog.py`.
+"""
+import os
+import json
+import time
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import libs.http_client as http_client
+import libs.image_to_text as image_to_text
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpeg', '.jpg')
+
+
+def iter_images(input_dir):
+    """Yields the (image_id, path) of every image below `input_dir` in a stable order. The id is the relative path. """
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, input_dir), path
+
+
+def iter_batches(images, batch_size, done=(), limit=None):
+    """Packs the first `limit` images that are not `done` into lists of at most `batch_size`. """
+    batch = []
+    remaining = limit
+    for image_id, path in images:
+        if image_id in done:
+            continue
+        if remaining is not None:
+            if remaining == 0:
+                break
+            remaining -= 1
+        batch.append((image_id, path))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class JsonlWriter():
+    """Appends results to a JSONL file. A line torn by an interrupted run is dropped when the file is reopened. """
+
+    def __init__(self, path):
+        self.path = path
+        self._repair()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _repair(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+                logger.warning("Dropped a partially written line of %s.", self.path)
+
+    def completed(self):
+        """Returns the ids of the images already in the output. """
+        done = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    done.add(json.loads(line)['image_id'])
+        return done
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter():
+    """Writes results as a directory of Parquet parts, one per `rows_per_part` results, readable with
+    `pd.read_parquet(path)`. Parts are written atomically so an interrupted run never leaves a broken part.
+    """
+
+    def __init__(self, path, rows_per_part=1000):
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._buffer = []
+        os.makedirs(self.path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self.path) if name.endswith('.parquet'))
+
+    def completed(self):
+        import pyarrow.parquet as pq
+        done = set()
+        for name in self._parts():
+            done.update(pq.read_table(os.path.join(self.path, name), columns=['image_id']).column('image_id').to_pylist())
+        return done
+
+    def write(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.rows_per_part:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self._buffer:
+            return
+        part_path = os.path.join(self.path, f"part-{len(self._parts()):05d}-{int(time.time())}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._buffer), f"{part_path}.tmp")
+        os.replace(f"{part_path}.tmp", part_path)
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+
+
+def open_writer(output_path, output_format=None):
+    """Returns the writer of the output, the format defaults to the extension of `output_path`. """
+    output_format = output_format or ('parquet' if output_path.endswith('.parquet') else 'jsonl')
+    if output_format == 'parquet':
+        return ParquetWriter(output_path)
+    return JsonlWriter(output_path)
+
+
+def describe_batch(batch, preprocess=True, max_side=448):
+    """Describes a batch of images with one image to text request.
+
+    Images that cannot be read or preprocessed fail on their own. A failed request is split in halves and retried,
+    down to single images, so one bad image or an oversized request does not fail the whole batch.
+
+    Args:
+        batch (list): The (image_id, path) of the images.
+        preprocess (bool, optional): Downsize and re-encode the images before sending them. Defaults to True.
+        max_side (int, optional): The maximum width and height of preprocessed images. Defaults to 448.
+
+    Returns:
+        tuple: the result rows, the failed images with their error and the request statistics.
+    """
+    records = []
+    failures = []
+    request_stats = {'requests': 0, 'raw_bytes': 0, 'payload_bytes': 0, 'seconds': 0.0}
+    for image_id, path in batch:
+        try:
+            with open(path, 'rb') as f:
+                img_data = f.read()
+            request_stats['raw_bytes'] += len(img_data)
+            if preprocess:
+                img_data, _ = image_to_text.preprocess_image(img_data, max_side=max_side)
+        except Exception as e:
+            failures.append({'image_id': image_id, 'path': path, 'error': f"{type(e).__name__}: {e}"})
+            continue
+        records.append(((image_id, path), {'content': base64.b64encode(img_data).decode('utf-8')}))
+
+    rows = []
+    _describe_records(records, rows, failures, request_stats)
+    return rows, failures, request_stats
+
+
+def _describe_records(records, rows, failures, request_stats):
+    """Sends the records in one request, bisecting the request when it fails. """
+    if not records:
+        return
+    data = {'dataframe_records': [record for _, record in records]}
+    request_stats['requests'] += 1
+    request_stats['payload_bytes'] += sum(len(record['content']) for record in data['dataframe_records'])
+    start = time.perf_counter()
+    try:
+        response = image_to_text.image_to_text_extract(data=data)
+        predictions = response.get('predictions') if isinstance(response, dict) else None
+        if isinstance(predictions, str) and len(records) == 1:
+            # endpoints serving one image per request return a single description
+            predictions = [predictions]
+        if not isinstance(predictions, list) or len(predictions) != len(records):
+            raise ValueError(f"Expected {len(records)} predictions, the endpoint returned {str(response)[:200]}")
+    except Exception as e:
+        request_stats['seconds'] += time.perf_counter() - start
+        # an open circuit rejects every request, splitting the batch would not help
+        if len(records) == 1 or isinstance(e, http_client.CircuitOpenError):
+            failures.extend({'image_id': image_id, 'path': path, 'error': f"{type(e).__name__}: {e}"} for (image_id, path), _ in records)
+            return
+        logger.warning("Request of %s images starting with %s failed, retrying in halves: %s", len(records), records[0][0][0], e)
+        middle = len(records) // 2
+        _describe_records(records[:middle], rows, failures, request_stats)
+        _describe_records(records[middle:], rows, failures, request_stats)
+        return
+    request_stats['seconds'] += time.perf_counter() - start
+
+    for ((image_id, path), _), prediction in zip(records, predictions):
+        # the served model answers every row with its description or the error that prevented it
+        if isinstance(prediction, dict):
+            if prediction.get('error'):
+                failures.append({'image_id': image_id, 'path': path, 'error': prediction['error']})
+                continue
+            prediction = prediction.get('description')
+        rows.append({'image_id': image_id, 'path': path, 'description': str(prediction).strip()})
+
+
+def bulk_describe(input_dir, output_path, output_format=None, batch_size=16, concurrency=4, preprocess=True, max_side=448, limit=None):
+    """Describes every image below `input_dir` that is not in the output yet.
+
+    At most `concurrency` requests are in flight and new batches are only read once a request completes, so memory
+    stays bounded whatever the catalog size.
+
+    Args:
+        input_dir (str): The directory of the catalog images.
+        output_path (str): The JSONL file or Parquet directory of the results.
+        output_format (str, optional): 'jsonl' or 'parquet'. Defaults to the extension of `output_path`.
+        batch_size (int, optional): The number of images per request. Defaults to 16.
+        concurrency (int, optional): The maximum number of requests in flight. Defaults to 4.
+        preprocess (bool, optional): Downsize and re-encode the images before sending them. Defaults to True.
+        max_side (int, optional): The maximum width and height of preprocessed images. Defaults to 448.
+        limit (int, optional): The maximum number of images described by this run. Defaults to None (all).
+
+    Returns:
+        dict: the run statistics.
+    """
+    writer = open_writer(output_path, output_format)
+    done = writer.completed()
+    if done:
+        logger.info("Resuming with %s images already described.", len(done))
+    batches = iter_batches(iter_images(input_dir), batch_size, done=done, limit=limit)
+
+    stats = {'skipped': len(done), 'described': 0, 'failed': 0, 'requests': 0, 'raw_bytes': 0, 'payload_bytes': 0, 'request_seconds': 0.0}
+    start = time.perf_counter()
+    error_path = f"{output_path.rstrip(os.sep)}.errors.jsonl"
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor, open(error_path, 'w', encoding='utf-8') as errors:
+            pending = {}
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < concurrency:
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    pending[executor.submit(describe_batch, batch, preprocess, max_side)] = batch
+
+                if not pending:
+                    break
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    batch = pending.pop(future)
+                    try:
+                        rows, failures, request_stats = future.result()
+                    except Exception as e:
+                        logger.warning("Failed to describe %s images starting with %s: %s", len(batch), batch[0][0], e)
+                        rows, failures, request_stats = [], [{'image_id': image_id, 'path': path, 'error': str(e)} for image_id, path in batch], {}
+                    if rows:
+                        writer.write(rows)
+                    stats['described'] += len(rows)
+                    if failures:
+                        logger.warning("Failed to describe %s images, e.g. %s: %s", len(failures), failures[0]['image_id'], failures[0]['error'])
+                        stats['failed'] += len(failures)
+                        for failure in failures:
+                            errors.write(json.dumps(failure) + '\n')
+                        errors.flush()
+                    for name, value in request_stats.items():
+                        stats['request_seconds' if name == 'seconds' else name] += value
+                logger.info("Described %s images (%s failed, %s requests in flight).", stats['described'], stats['failed'], len(pending))
+    finally:
+        writer.close()
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['request_seconds'] = round(stats['request_seconds'], 3)
+    stats['images_per_second'] = round(stats['described'] / stats['seconds'], 3) if stats['seconds'] else 0.0
+    logger.info("Bulk description finished: %s", stats)
+    return stats
+
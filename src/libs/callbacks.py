@@ -0,0 +1,76 @@
+"""LangChain callback handlers that report the LLM and tool calls of an agent turn to the telemetry and the job manager.
+
+They live apart from `libs.telemetry` and `libs.job_manager` so the app starts without importing LangChain.
+"""
+from langchain_core.callbacks import BaseCallbackHandler
+from libs.telemetry import Span, get_telemetry
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """Records a span for every LLM and tool call of the agent. """
+
+    def __init__(self):
+        self._spans = {}
+
+    def _start(self, run_id, stage, **attributes):
+        self._spans[run_id] = Span(stage, **attributes)
+
+    def _end(self, run_id, error=None, payload_bytes=None):
+        current = self._spans.pop(run_id, None)
+        if current is None:
+            return
+        if payload_bytes is not None:
+            current.set(payload_bytes=payload_bytes)
+        get_telemetry().record(current.finish(error=error))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, 'llm.call', payload_bytes=sum(len(str(m.content)) for batch in messages for m in batch))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, 'llm.call', payload_bytes=sum(len(prompt) for prompt in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        current = self._spans.get(run_id)
+        if current is not None:
+            current.set(response_bytes=sum(len(g.text) for generations in response.generations for g in generations))
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, 'tool.call', tool=serialized.get('name'), payload_bytes=len(input_str or ''))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+
+class JobProgressHandler(BaseCallbackHandler):
+    """Reports the steps of an agent turn as the progress of its job and stops the turn once the job is cancelled. """
+    # exceptions of the handler, i.e. `JobCancelled`, stop the agent
+    raise_error = True
+
+    def __init__(self, job):
+        self.job = job
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.job.set_progress("Thinking")
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.job.set_progress("Thinking")
+
+    def on_llm_new_token(self, token, **kwargs):
+        # a streamed answer stops at its next token instead of once it was generated completely
+        self.job.raise_if_cancelled()
+
+    def on_llm_end(self, response, **kwargs):
+        self.job.raise_if_cancelled()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.job.set_progress(f"Running the {serialized.get('name', 'tool')}")
+
+    def on_tool_end(self, output, **kwargs):
+        self.job.raise_if_cancelled()
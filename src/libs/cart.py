@@ -1,18 +1,29 @@
 # Small module to make a user cart work for the demo
 # a simple list of dictionaries should suffice
 # example: [{'name': r.name, 'id': r.id, 'description': r.description, 'company_name': r.company_name }]
+# every session owns its cart, see libs.session_state
+import threading
 
 
-global cart_items 
-cart_items = []
+class Cart():
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cart_items = []
 
-def add_item(item):
-    # global cart_items
-    cart_items.append(item)
+    def add_item(self, item):
+        with self._lock:
+            self.cart_items.append(item)
 
+    def add_items(self, items):
+        # add several items in one operation 
+        with self._lock:
+            self.cart_items.extend(items)
 
-def empty_cart():
-    # global cart_items 
-    global cart_items
-    cart_items = []
+    def empty_cart(self):
+        with self._lock:
+            self.cart_items = []
+
+    def items(self):
+        with self._lock:
+            return list(self.cart_items)
@@ -0,0 +1,108 @@
+import re
+import math
+import logging
+from typing import Any, Dict, List
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, HumanMessage
+from libs.telemetry import span
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+# tokens added by the chat template around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """Estimates the number of tokens of a text without a tokenizer.
+
+    Every punctuation mark is a token and words are split in pieces of about four characters, which is close to the
+    BPE tokenizers of the served chat models for English text.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in TOKEN_PATTERN.findall(str(text)))
+
+
+def estimate_message_tokens(messages):
+    """Estimates the number of tokens of a list of chat messages. """
+    return sum(estimate_tokens(msg.content) + MESSAGE_OVERHEAD_TOKENS for msg in messages)
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """Chat memory bounded by a token budget: a sliding window of the most recent turns plus a running summary of
+    the older ones.
+
+    When a new turn pushes the window beyond `max_token_limit` tokens, the oldest turns are removed from the window
+    and folded into the summary with a single LLM call. The summary is only recomputed when the window overflows.
+    Tokens are estimated locally so pruning never downloads a tokenizer or calls the endpoint.
+    """
+    memory_key: str = "chat_history"
+    output_key: str = "output"
+    return_messages: bool = True
+    summaries: int = 0
+
+    def get_num_tokens(self, messages: List[BaseMessage]) -> int:
+        return estimate_message_tokens(messages)
+
+    def summary_tokens(self) -> int:
+        return estimate_tokens(self.moving_summary_buffer) + MESSAGE_OVERHEAD_TOKENS if self.moving_summary_buffer else 0
+
+    def buffer_tokens(self) -> int:
+        """Returns the estimated tokens the memory adds to the prompt: the summary and the window. """
+        return self.summary_tokens() + self.get_num_tokens(self.chat_memory.messages)
+
+    def prune(self) -> None:
+        """Moves the oldest turns into the summary until the window fits the budget. The latest turn is always kept. """
+        buffer = self.chat_memory.messages
+        tokens = self.get_num_tokens(buffer)
+        if tokens <= self.max_token_limit:
+            return
+
+        pruned = []
+        while tokens > self.max_token_limit and len(buffer) > 2:
+            # remove whole turns so the window always starts with a user message
+            pruned.append(buffer.pop(0))
+            while len(buffer) > 2 and not isinstance(buffer[0], HumanMessage):
+                pruned.append(buffer.pop(0))
+            tokens = self.get_num_tokens(buffer)
+        if not pruned:
+            return
+
+        try:
+            with span('memory.summarize', messages=len(pruned)):
+                self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+            self.summaries += 1
+        except Exception as e:
+            # the conversation goes on without the pruned turns rather than failing the chat turn
+            logger.warning("Failed to summarize %s messages, they are dropped from the memory: %s", len(pruned), e)
+        logger.info("Summarized %s messages, the memory holds %s window tokens and %s summary tokens.", len(pruned), tokens, self.summary_tokens())
+
+    def clear(self) -> None:
+        super().clear()
+        self.summaries = 0
+
+
+class PromptTokenCounter(BaseCallbackHandler):
+    """Estimates the prompt tokens of every LLM call made during a chat turn. """
+
+    def __init__(self):
+        self.calls = []
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], **kwargs: Any) -> None:
+        self.calls.extend(estimate_message_tokens(prompt) for prompt in messages)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.calls.extend(estimate_tokens(prompt) for prompt in prompts)
+
+    def stats(self):
+        """Returns the tokens of the first prompt of the turn (system prompt, memory and user message), of all the
+        prompts of the turn (agent iterations included) and the number of LLM calls.
+        """
+        return {
+            'prompt_tokens': self.calls[0] if self.calls else 0,
+            'total_prompt_tokens': sum(self.calls),
+            'llm_calls': len(self.calls),
+        }
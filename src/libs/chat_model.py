@@ -1,25 +1,71 @@
 import os
+import re
+import hashlib
 import logging
+import threading
+from collections import deque
 from dotenv import load_dotenv
 
 from langchain.agents import initialize_agent
 from langchain.memory import ConversationBufferMemory
 from langchain.agents.agent_types import AgentType
 from langchain.chat_models import ChatDatabricks
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.prompts import MessagesPlaceholder
+from langchain_core.language_models.chat_models import generate_from_stream
+from libs.streaming import TokenStream, FinalAnswerStreamHandler, TokenStreamHandler
+from libs.chat_memory import TokenBudgetMemory, PromptTokenCounter
+from libs.session_state import get_current_session
+from libs.telemetry import trace
+from libs.callbacks import SpanCallbackHandler
 
 
+# extra information for the LLM in user and assistant messages that is never displayed
+METADATA_PATTERN = re.compile(r'<metadata>.*?</metadata>', re.DOTALL)
+# words that refer to earlier turns, the answer to such a prompt depends on the conversation
+CONTEXT_PATTERN = re.compile(r"\b(it|its|this|that|these|those|they|them|again|above|previous|earlier|before|last|same|more|another|also|instead|too|else|other|then)\b", re.I)
+
+
+class StreamingChatDatabricks(ChatDatabricks):
+    """ChatDatabricks that can generate through the endpoint's streaming API so callbacks receive every new token. """
+    streaming: bool = False
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
 
 
 class RetailLLM():
 
-    def __init__(self, system_message, tools=None, model_name="databricks-dbrx-instruct"):
+    def __init__(self, system_message, tools=None, model_name="databricks-dbrx-instruct", response_cache=None, cache_state=None, streaming=False, memory_max_tokens=1500, router=None):
+        """
+        Args:
+            system_message (str): The system prompt.
+            tools (list, optional): LangChain tools available to the agent. Defaults to None.
+            model_name (str, optional): The serving endpoint of the chat model. Defaults to "databricks-dbrx-instruct".
+            response_cache (ResponseCache, optional): Opt-in cache of agent answers. Defaults to None (disabled).
+            cache_state (callable, optional): Returns a key of the tool state cached answers depend on, e.g. the uploaded files. Defaults to None.
+            streaming (bool, optional): Stream the final answer into `self.stream` while it is generated. Defaults to False.
+            memory_max_tokens (int, optional): Token budget of the conversation memory sent with every prompt. Older turns are summarized beyond it. None keeps the entire conversation. Defaults to 1500.
+            router (IntentRouter, optional): Sends clear tool requests straight to the tool, skipping the agent. Defaults to None.
+        """
         load_dotenv()
 
         self.system_message = SystemMessage(system_message)
         self.model_name = model_name
-        self.model = ChatDatabricks(endpoint=self.model_name)
+        self.streaming = streaming
+        self.model = StreamingChatDatabricks(endpoint=self.model_name, streaming=streaming)
+        self.stream = TokenStream()
         self.tools = tools
+        self.response_cache = response_cache
+        self.cache_state = cache_state
+        self.router = router
+        # prompt token estimates of the recent turns
+        self.turn_stats = deque(maxlen=1000)
+        # the displayed (role, text) of every message of the conversation, see `get_display_messages`
+        self._display_messages = []
+        self._display_lock = threading.Lock()
 
         # configure logging
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -27,7 +73,10 @@ class RetailLLM():
 
         assert os.getenv('DATABRICKS_TOKEN') is not None and os.getenv('DATABRICKS_HOST') is not None, "DATABRICKS_TOKEN and DATABRICKS_HOST environment variables must be set."
         
-        memory = ConversationBufferMemory(memory_key="chat_history")
+        if memory_max_tokens is None:
+            memory = ConversationBufferMemory(memory_key="chat_history", output_key="output", return_messages=True)
+        else:
+            memory = TokenBudgetMemory(llm=self.model, max_token_limit=memory_max_tokens)
         self.agent = initialize_agent(
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
             tools=self.tools,
@@ -35,6 +84,9 @@ class RetailLLM():
             verbose=True,
             max_iterations=3,
             memory=memory,
+            return_intermediate_steps=True,
+            # the conversation memory is part of every prompt
+            agent_kwargs={'memory_prompts': [MessagesPlaceholder(variable_name="chat_history")], 'input_variables': ['input', 'agent_scratchpad', 'chat_history']},
         )
 
         self.reset_chat_history()
@@ -47,6 +99,8 @@ class RetailLLM():
         self.chat_history = []
         self.chat_history.append(self.system_message)
         self.agent.memory.clear()
+        with self._display_lock:
+            self._display_messages = []
 
 
 
@@ -70,15 +124,182 @@ class RetailLLM():
         if reset: 
             self.chat_history[0]['content'] = self.system_message
 
-    def send_chat(self, msg):
-        """Sends the chat history to the LLM to get response. """
+    def send_chat(self, msg, callbacks=None):
+        """Sends the chat history to the LLM to get response. Every stage of the turn is timed, see `libs.telemetry`.
+
+        Args:
+            msg (str): The message of the user.
+            callbacks (list, optional): Extra callback handlers of the LLM and tool calls of the turn, e.g. to report its progress. Defaults to None.
+        """
         self.logger.info("Chat History: %s", self.chat_history)
-        # response = self.model.invoke(self.chat_history)
-        response = self.agent.invoke(msg)
-        self.logger.info("AI Response: %s", response.get('output'))
+        self.stream.start()
+        counter = PromptTokenCounter()
+        output = None
+        with trace(session_id=get_current_session().session_id, turn=self.stream.turn) as turn:
+            try:
+                state = self._cache_state(msg)
+                cached = self.response_cache.lookup(msg, state) if self.response_cache is not None else None
+                if cached is not None:
+                    turn.root.set(path='cached')
+                    for tool_name, tool_input in cached.actions:
+                        self._get_tool(tool_name).run(tool_input, callbacks=[SpanCallbackHandler(), *(callbacks or [])])
+                    output = self._cached_output(msg, cached)
+                    return output
+
+                route = self.router.route(msg) if self.router is not None else None
+                if route is not None and route.routed:
+                    turn.root.set(path='routed', tool=route.tool_name)
+                    observation = self._get_tool(route.tool_name).run(route.tool_input, callbacks=[SpanCallbackHandler(), *(callbacks or [])])
+                    response = self.model.invoke(self._routed_messages(msg, route, observation), config=self._run_config(counter, agent=False, callbacks=callbacks))
+                    output = self._routed_output(msg, state, route, response.content)
+                    return output
+
+                turn.root.set(path='agent')
+                # response = self.model.invoke(self.chat_history)
+                response = self.agent.invoke(msg, config=self._run_config(counter, callbacks=callbacks))
+                self.logger.info("AI Response: %s", response.get('output'))
+                self._cache_response(msg, state, response)
+
+                output = response.get('output')
+                return output
+            finally:
+                self.stream.finish(output)
+                self._record_turn(counter, turn)
+
+    async def asend_chat(self, msg, callbacks=None):
+        """Async version of `send_chat`. Tools run through their `_arun` implementations so the event loop is never blocked. """
+        self.logger.info("Chat History: %s", self.chat_history)
+        self.stream.start()
+        counter = PromptTokenCounter()
+        output = None
+        with trace(session_id=get_current_session().session_id, turn=self.stream.turn) as turn:
+            try:
+                state = self._cache_state(msg)
+                cached = self.response_cache.lookup(msg, state) if self.response_cache is not None else None
+                if cached is not None:
+                    turn.root.set(path='cached')
+                    for tool_name, tool_input in cached.actions:
+                        await self._get_tool(tool_name).arun(tool_input, callbacks=[SpanCallbackHandler(), *(callbacks or [])])
+                    output = self._cached_output(msg, cached)
+                    return output
+
+                route = self.router.route(msg) if self.router is not None else None
+                if route is not None and route.routed:
+                    turn.root.set(path='routed', tool=route.tool_name)
+                    observation = await self._get_tool(route.tool_name).arun(route.tool_input, callbacks=[SpanCallbackHandler(), *(callbacks or [])])
+                    response = await self.model.ainvoke(self._routed_messages(msg, route, observation), config=self._run_config(counter, agent=False, callbacks=callbacks))
+                    output = self._routed_output(msg, state, route, response.content)
+                    return output
+
+                turn.root.set(path='agent')
+                response = await self.agent.ainvoke(msg, config=self._run_config(counter, callbacks=callbacks))
+                self.logger.info("AI Response: %s", response.get('output'))
+                self._cache_response(msg, state, response)
+
+                output = response.get('output')
+                return output
+            finally:
+                self.stream.finish(output)
+                self._record_turn(counter, turn)
 
-        return response.get('output')
+    def _run_config(self, counter, agent=True, callbacks=None):
+        """Attaches the prompt token counter, the span handler timing every LLM and tool call, the extra `callbacks` of the turn and, when streaming is enabled, the stream handler of the agent's final answer or of a plain answer. """
+        handlers = [counter, SpanCallbackHandler(), *(callbacks or [])]
+        if self.streaming:
+            handlers.append(FinalAnswerStreamHandler(self.stream) if agent else TokenStreamHandler(self.stream))
+        return {'callbacks': handlers}
+
+    def _routed_messages(self, msg, route, observation):
+        """Builds the single prompt that turns the output of a routed tool call into the answer. """
+        history = self.agent.memory.load_memory_variables({})['chat_history']
+        return [self.system_message, *history, HumanMessage(f"{msg}\n<metadata>The {route.tool_name} was already run with the input {route.tool_input} and returned: {observation}</metadata>\nAnswer the user based on this result.")]
+
+    def _routed_output(self, msg, state, route, output):
+        """Records the answer of a routed message in the agent memory and the response cache. """
+        self.logger.info("AI Response (routed to %s): %s", route.tool_name, output)
+        self.agent.memory.save_context({'input': msg}, {'output': output})
+        if self.response_cache is not None and output:
+            side_effects = getattr(self._get_tool(route.tool_name), 'has_side_effects', False)
+            self.response_cache.store(msg, state, output, [(route.tool_name, route.tool_input)] if side_effects else [])
+        return output
+
+    def _record_turn(self, counter, turn=None):
+        """Keeps and logs the prompt token estimates of the turn and adds them to its trace. """
+        memory = self.agent.memory
+        stats = dict(counter.stats(), turn=self.stream.turn, memory_messages=len(memory.chat_memory.messages))
+        if isinstance(memory, TokenBudgetMemory):
+            stats.update(memory_tokens=memory.buffer_tokens(), summary_tokens=memory.summary_tokens(), summaries=memory.summaries)
+        self.turn_stats.append(stats)
+        self.logger.info("Turn %s prompt tokens: %s", stats['turn'], stats)
+        if turn is not None:
+            turn.root.set(prompt_tokens=stats['total_prompt_tokens'], llm_calls=stats['llm_calls'], ttft=self.stream.ttft)
+
+    def prompt_token_counts(self):
+        """Returns the estimated prompt tokens of the recent turns, oldest first. """
+        return list(self.turn_stats)
+
+    def _cache_state(self, msg):
+        """Key of the state a cached answer depends on: the tool state, e.g. the content of the uploaded files, and the
+        conversation memory only for prompts that refer to earlier turns ("do it again"). Other prompts get the same
+        answer in every conversation, so it is shared by all sessions with the same tool state.
+        """
+        tool_state = self.cache_state() if self.cache_state is not None else ''
+        if CONTEXT_PATTERN.search(msg) is None:
+            return tool_state
+        return f"{tool_state}:{self._memory_digest()}"
+
+    def _memory_digest(self):
+        memory = self.agent.memory
+        digest = hashlib.sha1((getattr(memory, 'moving_summary_buffer', '') or '').encode('utf-8'))
+        for message in memory.chat_memory.messages:
+            digest.update(f"{message.type}:{message.content};".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _get_tool(self, tool_name):
+        return next(tool for tool in self.tools if tool.name == tool_name)
+
+    def _cached_output(self, msg, cached):
+        """Records a cached answer in the agent memory so the conversation stays consistent. """
+        self.logger.info("AI Response (cached): %s", cached.output)
+        self.agent.memory.save_context({'input': msg}, {'output': cached.output})
+        return cached.output
+
+    def _cache_response(self, msg, state, response):
+        """Caches the agent answer with the side effecting tool calls that have to run again on a cache hit. """
+        output = response.get('output')
+        if self.response_cache is None or output is None or output.startswith("Agent stopped"):
+            return
+        actions = [
+            (action.tool, action.tool_input)
+            for action, _ in response.get('intermediate_steps', [])
+            if getattr(next((t for t in self.tools if t.name == action.tool), None), 'has_side_effects', False)
+        ]
+        self.response_cache.store(msg, state, output, actions)
 
     def get_chat_history(self):
-        return self.agent.memory.chat_memory.messages 
+        """Returns the user and assistant messages of the whole conversation. The agent memory only keeps the recent turns. """
+        return self.chat_history[1:] 
+
+    def get_display_messages(self, start=0, end=None):
+        """Returns the messages of the conversation as displayed: (role, text) pairs with the metadata tags removed.
+        Every message is stripped once, when it is first displayed. The role is 'user', 'assistant' or None for
+        messages that are not displayed, so positions match `get_chat_history`.
+
+        Args:
+            start (int, optional): The position of the first message. Defaults to 0.
+            end (int, optional): The position after the last message. Defaults to the end of the conversation.
+
+        Returns:
+            list: (role, text) pairs.
+        """
+        history = self.get_chat_history()
+        with self._display_lock:
+            for msg in history[len(self._display_messages):]:
+                role = 'user' if isinstance(msg, HumanMessage) else 'assistant' if isinstance(msg, AIMessage) else None
+                self._display_messages.append((role, METADATA_PATTERN.sub('', msg.content) if role else None))
+            return self._display_messages[start:end]
+
+    def display_length(self):
+        """Returns the number of messages of the conversation, the end position of `get_display_messages`. """
+        return len(self.chat_history) - 1
 
@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import logging
+import threading
+from flask import request, jsonify
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# the files the tools process, other files are rejected before any byte is received
+UPLOAD_FILE_TYPES = ('.csv', '.png', '.jpeg', '.jpg')
+
+
+def check_upload_type(filename):
+    """Returns the lowercase extension of a file the tools process.
+
+    Raises:
+        ValueError: for any other file, see `UPLOAD_FILE_TYPES`.
+    """
+    _, file_extension = os.path.splitext(filename)
+    file_extension = file_extension.lower()
+    if file_extension not in UPLOAD_FILE_TYPES:
+        raise ValueError(f"Error: {file_extension or 'files without an extension'} can not be uploaded, use one of {list(UPLOAD_FILE_TYPES)}.")
+    return file_extension
+
+
+class OffsetMismatchError(Exception):
+    """Raised when a chunk does not start where the received bytes end. `offset` is where the client must resume. """
+
+    def __init__(self, offset):
+        super().__init__(f"Offset mismatch, resume at {offset}.")
+        self.offset = offset
+
+
+class ChunkedUploadStore():
+    """Resumable uploads written to disk chunk by chunk.
+
+    Every upload is a `<upload_id>.part` file and a `<upload_id>.json` manifest in `upload_dir`. The size of the part
+    file is the resume offset, so an interrupted upload (or a restarted server) continues where it stopped. Chunks
+    are streamed from the request body to disk and never held in memory as a whole.
+    """
+
+    def __init__(self, upload_dir='/tmp/uploads', max_bytes=1024 * 1024 * 1024, block_size=1024 * 1024):
+        """
+        Args:
+            upload_dir (str, optional): The directory of in progress uploads. Defaults to '/tmp/uploads'.
+            max_bytes (int, optional): The maximum size of an upload. Defaults to 1 GB.
+            block_size (int, optional): The number of bytes copied from the request at a time. Defaults to 1 MB.
+        """
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def _path(self, upload_id, suffix):
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            raise ValueError(f"Invalid upload id {upload_id}.")
+        return os.path.join(self.upload_dir, f"{upload_id}{suffix}")
+
+    def _lock(self, upload_id):
+        with self._locks_lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename, size, session_id=None):
+        """Starts an upload.
+
+        Args:
+            filename (str): The name of the uploaded file, its extension selects the processing.
+            size (int): The total size of the file in bytes.
+            session_id (str, optional): The session the file is uploaded for. Defaults to None.
+
+        Returns:
+            str: the upload id.
+        """
+        check_upload_type(filename)
+        if size > self.max_bytes:
+            raise ValueError(f"Error: the file is {size} bytes, uploads are limited to {self.max_bytes} bytes.")
+        upload_id = uuid.uuid4().hex
+        with open(self._path(upload_id, '.json'), 'w') as f:
+            json.dump({'filename': filename, 'size': size, 'session_id': session_id}, f)
+        open(self._path(upload_id, '.part'), 'wb').close()
+        logger.info("Started upload %s of %s (%s bytes).", upload_id, filename, size)
+        return upload_id
+
+    def status(self, upload_id):
+        """Returns the manifest of an upload with the number of bytes received so far as `offset`. """
+        with open(self._path(upload_id, '.json')) as f:
+            manifest = json.load(f)
+        manifest['offset'] = os.path.getsize(self._path(upload_id, '.part'))
+        manifest['upload_id'] = upload_id
+        return manifest
+
+    def write_chunk(self, upload_id, offset, stream):
+        """Appends a chunk read from `stream` at `offset`.
+
+        Args:
+            upload_id (str): The upload id.
+            offset (int): The position of the chunk in the file, it must equal the bytes received so far.
+            stream (file): The chunk, e.g. the request body stream.
+
+        Returns:
+            int: the bytes received so far.
+
+        Raises:
+            OffsetMismatchError: the chunk does not start at the bytes received so far, nothing was written.
+        """
+        with self._lock(upload_id):
+            manifest = self.status(upload_id)
+            if offset != manifest['offset']:
+                raise OffsetMismatchError(manifest['offset'])
+            written = offset
+            with open(self._path(upload_id, '.part'), 'ab') as f:
+                for block in iter(lambda: stream.read(self.block_size), b''):
+                    written += len(block)
+                    if written > manifest['size']:
+                        f.truncate(offset)
+                        raise ValueError(f"Error: the chunk exceeds the declared size of {manifest['size']} bytes.")
+                    f.write(block)
+            return written
+
+    def complete(self, upload_id, output_file_path='/tmp'):
+        """Moves a fully received upload to the tool locations. CSV files are converted once to Arrow IPC.
+
+        Returns:
+            dict: the manifest of the processed upload.
+
+        Raises:
+            ValueError: the upload is incomplete or not a file the tools process.
+        """
+        # pandas, pyarrow and PIL are imported with the first upload, see bench_startup.py
+        from PIL import Image
+        import libs.file_handler as fh
+
+        with self._lock(upload_id):
+            manifest = self.status(upload_id)
+            if manifest['offset'] != manifest['size']:
+                raise ValueError(f"Error: received {manifest['offset']} of {manifest['size']} bytes.")
+
+            part_path = self._path(upload_id, '.part')
+            if check_upload_type(manifest['filename']) == '.csv':
+                csv_path = f"{output_file_path}/data.csv"
+                shutil.move(part_path, csv_path)
+                manifest['rows'] = fh.convert_csv_to_arrow(csv_path, f"{output_file_path}/data.arrow")
+            else:
+                with Image.open(part_path) as image:
+                    image.save(f"{output_file_path}/product_image.png")
+                os.remove(part_path)
+            os.remove(self._path(upload_id, '.json'))
+
+        with self._locks_lock:
+            self._locks.pop(upload_id, None)
+        logger.info("Completed upload %s of %s.", upload_id, manifest['filename'])
+        return manifest
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Returns the shared upload store configured from the environment. """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ChunkedUploadStore(
+                    upload_dir=os.getenv('UPLOAD_DIR', '/tmp/uploads'),
+                    max_bytes=int(float(os.getenv('UPLOAD_MAX_MB', 1024)) * 1024 * 1024),
+                )
+    return _store
+
+
+def register_upload_routes(server, output_dir=None):
+    """Adds the resumable chunked upload endpoints to the Flask server of the Dash app.
+
+    - `POST /upload` with JSON `{"filename": ..., "size": ..., "session_id": ...}` starts an upload and returns its `upload_id`. The session must exist, see `output_dir`.
+    - `GET /upload/<upload_id>` returns the number of bytes received (`offset`) to resume from.
+    - `PUT /upload/<upload_id>?offset=<offset>` appends the raw request body at `offset`. A mismatched offset returns 409 with the expected offset.
+    - `POST /upload/<upload_id>/complete` processes the file once every byte was received.
+
+    Args:
+        server (flask.Flask): The server of the Dash app.
+        output_dir (callable, optional): Returns the upload directory of a session id, raises ValueError for an unknown session. It is checked when the upload starts and again when it completes. Defaults to '/tmp' for every session.
+    """
+    output_dir = output_dir or (lambda session_id: '/tmp')
+
+    @server.route('/upload', methods=['POST'])
+    def create_upload():
+        body = request.get_json(force=True)
+        try:
+            # the upload is bound to an existing server side session, the client can not pick the destination
+            output_dir(body.get('session_id'))
+            upload_id = get_upload_store().create(body['filename'], int(body['size']), session_id=body.get('session_id'))
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'upload_id': upload_id, 'offset': 0})
+
+    @server.route('/upload/<upload_id>', methods=['GET'])
+    def upload_status(upload_id):
+        try:
+            return jsonify(get_upload_store().status(upload_id))
+        except (OSError, ValueError) as e:
+            return jsonify({'error': str(e)}), 404
+
+    @server.route('/upload/<upload_id>', methods=['PUT'])
+    def upload_chunk(upload_id):
+        store = get_upload_store()
+        try:
+            offset = int(request.args.get('offset', 0))
+            received = store.write_chunk(upload_id, offset, request.stream)
+        except OffsetMismatchError as e:
+            return jsonify({'error': str(e), 'offset': e.offset}), 409
+        except OSError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'upload_id': upload_id, 'offset': received})
+
+    @server.route('/upload/<upload_id>/complete', methods=['POST'])
+    def complete_upload(upload_id):
+        store = get_upload_store()
+        try:
+            return jsonify(store.complete(upload_id, output_file_path=output_dir(store.status(upload_id).get('session_id'))))
+        except OSError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+
+def upload_file(base_url, path, session_id=None, chunk_size=8 * 1024 * 1024, session=None):
+    """Uploads a local file through the chunked upload endpoints, resuming from the offset the server reports.
+
+    Args:
+        base_url (str): The url of the app, e.g. http://localhost:8050.
+        path (str): The file to upload.
+        session_id (str, optional): The app session the file is uploaded for. Defaults to None.
+        chunk_size (int, optional): The bytes sent per request. Defaults to 8 MB.
+        session (requests.Session, optional): The session used for the requests. Defaults to a new session.
+
+    Returns:
+        dict: the manifest of the processed upload.
+    """
+    import requests
+    session = session or requests.Session()
+    size = os.path.getsize(path)
+    response = session.post(f"{base_url}/upload", json={'filename': os.path.basename(path), 'size': size, 'session_id': session_id})
+    response.raise_for_status()
+    upload_id = response.json()['upload_id']
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            response = session.put(f"{base_url}/upload/{upload_id}", params={'offset': offset}, data=f.read(chunk_size))
+            if response.status_code != 409:
+                response.raise_for_status()
+            offset = response.json()['offset']
+    response = session.post(f"{base_url}/upload/{upload_id}/complete")
+    response.raise_for_status()
+    return response.json()
@@ -1,25 +1,346 @@
 from dotenv import load_dotenv
 import logging
-import os 
-from databricks import sql 
+import os
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from databricks import sql
+from libs.telemetry import span
 
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
+
+class PoolTimeoutError(Exception):
+    """Raised when no warehouse connection becomes available within the checkout timeout. """
+
+
+class _PooledConnection():
+    """Small wrapper that tracks when a connection was last used and last verified. """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+
+
+class ConnectionPool():
+    """Thread safe pool of reusable Databricks SQL warehouse connections.
+
+    Connections are opened lazily up to `pool_size`, handed out LIFO so the warmest session is reused first,
+    closed after sitting idle for `idle_timeout` seconds and verified with a cheap query before reuse
+    once they have not been checked for `health_check_interval` seconds.
+    """
+
+    def __init__(self, connect_kwargs, connector=sql, pool_size=4, idle_timeout=300, checkout_timeout=30, health_check_interval=60, max_retries=1):
+        """
+        Args:
+            connect_kwargs (dict): keyword arguments passed to `connector.connect`.
+            connector (module, optional): module exposing `connect()` (and optionally `exc`). Defaults to `databricks.sql`.
+            pool_size (int, optional): maximum number of open connections. Defaults to 4.
+            idle_timeout (float, optional): seconds an unused connection is kept open. Defaults to 300.
+            checkout_timeout (float, optional): seconds to wait for a free connection before raising `PoolTimeoutError`. Defaults to 30.
+            health_check_interval (float, optional): seconds after which an idle connection is verified before reuse. Defaults to 60.
+            max_retries (int, optional): number of times a query is retried on a fresh connection after a connection failure. Defaults to 1.
+        """
+        if pool_size < 1:
+            raise ValueError(f"pool_size must be at least 1, got {pool_size}.")
+        self.connect_kwargs = connect_kwargs
+        self.connector = connector
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.max_retries = max_retries
+
+        self._idle = deque()
+        self._open_count = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._metrics = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'connects': 0,
+            'reconnects': 0,
+            'health_checks': 0,
+            'failed_health_checks': 0,
+            'idle_evictions': 0,
+        }
+
+    def _retryable_errors(self):
+        """Errors that indicate a broken session rather than a bad query. """
+        exc = getattr(self.connector, 'exc', None)
+        errors = tuple(getattr(exc, name) for name in ('OperationalError', 'InterfaceError') if hasattr(exc, name))
+        return errors + (ConnectionError,)
+
+    def _connect(self):
+        connection = self.connector.connect(**self.connect_kwargs)
+        with self._cond:
+            self._metrics['connects'] += 1
+        return _PooledConnection(connection)
+
+    def _close_quietly(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception as e:
+            logger.warning("Error closing warehouse connection: %s", e)
+
+    def _is_healthy(self, pooled):
+        """Runs a trivial query to make sure the session is still usable. """
+        with self._cond:
+            self._metrics['health_checks'] += 1
+        try:
+            if getattr(pooled.connection, 'open', True) is False:
+                raise ConnectionError("connection is closed")
+            with pooled.connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            pooled.last_checked = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning("Warehouse connection failed health check: %s", e)
+            with self._cond:
+                self._metrics['failed_health_checks'] += 1
+            return False
+
+    def _evict_idle(self):
+        """Removes connections that have been idle too long. Must be called with the lock held. """
+        now = time.monotonic()
+        expired = [p for p in self._idle if now - p.last_used > self.idle_timeout]
+        for pooled in expired:
+            self._idle.remove(pooled)
+            self._open_count -= 1
+            self._metrics['idle_evictions'] += 1
+        return expired
+
+    def acquire(self):
+        """Checks a connection out of the pool, opening or replacing one if required.
+
+        Returns:
+            _PooledConnection: the pooled connection wrapper. Must be returned with `release`.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        pooled = None
+        create = False
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed.")
+            expired = self._evict_idle()
+            waited = False
+            wait_start = time.monotonic()
+            while not self._idle and self._open_count >= self.pool_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError(f"No warehouse connection available after {self.checkout_timeout} seconds.")
+                if not waited:
+                    self._metrics['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self._metrics['wait_seconds'] += time.monotonic() - wait_start
+
+            if self._idle:
+                pooled = self._idle.pop()
+            else:
+                self._open_count += 1
+                create = True
+            self._metrics['checkouts'] += 1
+
+        for stale in expired:
+            self._close_quietly(stale)
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                self._discard_slot()
+                raise
+
+        if time.monotonic() - pooled.last_checked > self.health_check_interval and not self._is_healthy(pooled):
+            self._close_quietly(pooled)
+            with self._cond:
+                self._metrics['reconnects'] += 1
+            try:
+                return self._connect()
+            except Exception:
+                self._discard_slot()
+                raise
+        return pooled
+
+    def _discard_slot(self):
+        with self._cond:
+            self._open_count -= 1
+            self._cond.notify()
+
+    def release(self, pooled, discard=False):
+        """Returns a connection to the pool.
+
+        Args:
+            pooled (_PooledConnection): connection returned by `acquire`.
+            discard (bool, optional): close the connection instead of reusing it. Defaults to False.
+        """
+        if discard or self._closed:
+            self._close_quietly(pooled)
+            self._discard_slot()
+            return
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a raw connection that is returned to the pool afterwards.
+        A connection that raised a connection level error is closed instead of being reused.
+        """
+        pooled = self.acquire()
+        try:
+            yield pooled.connection
+        except self._retryable_errors():
+            self.release(pooled, discard=True)
+            raise
+        except BaseException:
+            self.release(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    def execute(self, query):
+        """Executes a query on a pooled connection and returns all rows.
+        Connection level failures are retried on a fresh connection up to `max_retries` times.
+
+        Args:
+            query (str): the SQL statement to execute.
+
+        Returns:
+            list: rows returned by the warehouse.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(query)
+                        return cursor.fetchall()
+            except self._retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                with self._cond:
+                    self._metrics['reconnects'] += 1
+                logger.warning("Warehouse connection failed (%s). Reconnecting, attempt %s.", e, attempt)
+
+    def metrics(self):
+        """Returns a snapshot of the pool counters.
+
+        Returns:
+            dict: pool size, open/idle/in use connection counts and cumulative counters.
+        """
+        with self._cond:
+            snapshot = dict(self._metrics)
+            snapshot.update({
+                'pool_size': self.pool_size,
+                'open': self._open_count,
+                'idle': len(self._idle),
+                'in_use': self._open_count - len(self._idle),
+            })
+        return snapshot
+
+    def close(self):
+        """Closes all idle connections. Connections in use are closed when released. """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open_count -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _build_pool(connector=sql, connect_kwargs=None, **pool_kwargs):
+    if connect_kwargs is None:
+        connect_kwargs = {
+            'server_hostname': os.getenv('DATABRICKS_HOST', '').replace("https://", ""),
+            'http_path': os.getenv('WAREHOUSE_HTTP_PATH'),
+            'access_token': os.getenv('DATABRICKS_TOKEN'),
+        }
+    defaults = {
+        'pool_size': int(os.getenv('WAREHOUSE_POOL_SIZE', 4)),
+        'idle_timeout': float(os.getenv('WAREHOUSE_POOL_IDLE_TIMEOUT', 300)),
+        'checkout_timeout': float(os.getenv('WAREHOUSE_POOL_CHECKOUT_TIMEOUT', 30)),
+        'health_check_interval': float(os.getenv('WAREHOUSE_POOL_HEALTH_CHECK_INTERVAL', 60)),
+    }
+    defaults.update(pool_kwargs)
+    return ConnectionPool(connect_kwargs=connect_kwargs, connector=connector, **defaults)
+
+
+def configure_pool(connector=sql, connect_kwargs=None, **pool_kwargs):
+    """Replaces the shared connection pool. Useful to tune the pool or to point it at a local stand-in connector.
+
+    Args:
+        connector (module, optional): module exposing `connect()`. Defaults to `databricks.sql`.
+        connect_kwargs (dict, optional): connection arguments. Defaults to the values read from the environment.
+        **pool_kwargs: extra arguments passed to `ConnectionPool`.
+
+    Returns:
+        ConnectionPool: the new shared pool.
+    """
+    global _pool
+    new_pool = _build_pool(connector=connector, connect_kwargs=connect_kwargs, **pool_kwargs)
+    with _pool_lock:
+        old_pool, _pool = _pool, new_pool
+    if old_pool is not None:
+        old_pool.close()
+    return new_pool
+
+
+def get_pool():
+    """Returns the shared connection pool, creating it from the environment on first use. """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _build_pool()
+    return _pool
+
+
+def get_pool_metrics():
+    """Returns the metrics of the shared connection pool. """
+    return get_pool().metrics()
+
+
+def close_pool():
+    """Closes the shared connection pool. """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
 def execute_query(query):
     logger.info("Executing SQL Query: %s", query)
-    dbtoken = os.getenv('DATABRICKS_TOKEN')
-    server_hostname = os.getenv('DATABRICKS_HOST').replace("https://", "")
-    http_path = os.getenv('WAREHOUSE_HTTP_PATH')
-
-    with sql.connect(server_hostname=server_hostname, 
-                    http_path=http_path, 
-                    access_token=dbtoken) as connection:
-        
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-
-    return result
\ No newline at end of file
+    with span('sql.query', payload_bytes=len(query)) as s:
+        rows = get_pool().execute(query)
+        s.set(rows=len(rows))
+    return rows
+
+
+async def aexecute_query(query):
+    """Async version of `execute_query`.
+    The Databricks SQL connector is blocking, so the query runs on the default executor while the event loop keeps serving other work.
+    Concurrency is bounded by the connection pool size.
+    """
+    return await asyncio.to_thread(execute_query, query)
@@ -0,0 +1,78 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+def lttb(x, y, threshold):
+    """Largest-triangle-three-buckets downsampling.
+
+    Keeps the first and last points and, for every bucket in between, the point forming the largest triangle with
+    the point kept in the previous bucket and the average of the next bucket. This preserves the visual shape of a
+    line (peaks, troughs and trend) far better than taking every n-th row.
+
+    Args:
+        x (np.ndarray): sorted numeric x values.
+        y (np.ndarray): y values, same length as `x`.
+        threshold (int): the number of points to keep.
+
+    Returns:
+        np.ndarray: the sorted indices of the points to keep.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # bucket edges for the n - 2 points between the first and the last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # twice the triangle area of every candidate in the bucket, the constant factor does not change the argmax
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample_frame(pdf, x_column, y_columns, max_points=2000):
+    """Downsamples a frame of several lines sharing an x axis for plotting.
+
+    Every line is reduced with LTTB on its non-null rows and the union of the selected rows is kept, so each line
+    keeps its shape and the frame holds at most `len(y_columns) * max_points` rows.
+
+    Args:
+        pdf (pd.DataFrame): the frame to plot, sorted by `x_column`.
+        x_column (str): the x axis column. Datetime columns are supported.
+        y_columns (list): the line columns.
+        max_points (int, optional): the number of points kept per line. Defaults to 2000.
+
+    Returns:
+        pd.DataFrame: the downsampled frame.
+    """
+    if len(pdf) <= max_points:
+        return pdf
+
+    x = pdf[x_column]
+    x = (x.astype('int64') if pd.api.types.is_datetime64_any_dtype(x) else x).to_numpy(dtype=np.float64)
+    keep = []
+    for column in y_columns:
+        y = pdf[column].to_numpy(dtype=np.float64)
+        rows = np.flatnonzero(~np.isnan(y))
+        keep.append(rows[lttb(x[rows], y[rows], max_points)])
+
+    rows = np.unique(np.concatenate(keep))
+    logger.info("Downsampled %s rows to %s for plotting.", len(pdf), len(rows))
+    return pdf.iloc[rows]
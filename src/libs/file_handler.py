@@ -4,12 +4,20 @@ import pandas as pd
 from io import StringIO, BytesIO
 from datetime import datetime
 import base64
+import hashlib
 from PIL import Image
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from libs.forecast_cache import hash_file
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
+# uploaded forecast data, the arrow file is the columnar copy read by the forecast tool
+DATA_CSV_PATH = '/tmp/data.csv'
+DATA_ARROW_PATH = '/tmp/data.arrow'
+
 def check_file_type(file_name):
     """Validates files uploaded are of acceptable type 
 
@@ -45,22 +53,110 @@ def save_file_upload(input_file_name, file_bytes, output_file_path='/tmp'):
 
     if file_extension == '.csv':
         logger.info("Saving CSV to tmp location.")
-        # Decode the base64 string
-        data = base64.b64decode(file_bytes).decode('utf-8')
-        # Convert the decoded string to a file-like object
-        string_io = StringIO(data)
-        pdf = pd.read_csv(string_io, parse_dates=['ds'])
-        pdf.to_csv(f"{output_file_path}/data.csv")
+        # decode the base64 string to disk in blocks and convert it once to the columnar format
+        csv_path = f"{output_file_path}/data.csv"
+        decode_base64_to_file(file_bytes, csv_path)
+        convert_csv_to_arrow(csv_path, f"{output_file_path}/data.arrow")
     
     elif file_extension in ['.png', '.jpeg', '.jpg']:
-        logger.info("Saving Image to tmp location - %s", f'/tmp/product_image{file_extension}')
+        logger.info("Saving Image to tmp location - %s", f'{output_file_path}/product_image.png')
         data = base64.b64decode(file_bytes)
         image = Image.open(BytesIO(data))
-        image.save(f'/tmp/product_image.png')
+        image.save(f'{output_file_path}/product_image.png')
         image.close()
         logger.info("Uploaded image saved.")
 
 
+def decode_base64_to_file(file_bytes, path, block_size=4 * 1024 * 1024):
+    """Decodes a base64 string to a file block by block so the decoded file is never held in memory.
+
+    Args:
+        file_bytes (str): The base64 encoded file.
+        path (str): The output file.
+        block_size (int, optional): The number of base64 characters decoded at a time, a multiple of 4. Defaults to 4 MB.
+    """
+    with open(path, 'wb') as f:
+        for start in range(0, len(file_bytes), block_size):
+            f.write(base64.b64decode(file_bytes[start:start + block_size]))
+
+
+def convert_csv_to_arrow(csv_path, arrow_path=DATA_ARROW_PATH, block_size=16 * 1024 * 1024):
+    """Converts a CSV file to an Arrow IPC file one record batch at a time, memory use is bounded by `block_size`.
+
+    The `ds` column is parsed as a timestamp. The file is written next to its destination and moved in place so
+    readers never see a partial file.
+
+    Args:
+        csv_path (str): The CSV file.
+        arrow_path (str, optional): The Arrow IPC file. Defaults to DATA_ARROW_PATH.
+        block_size (int, optional): The number of CSV bytes parsed per record batch. Defaults to 16 MB.
+
+    Returns:
+        int: the number of rows converted.
+    """
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(column_types={'ds': pa.timestamp('ns')}),
+    )
+    rows = 0
+    tmp_path = f"{arrow_path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    os.replace(tmp_path, arrow_path)
+    logger.info("Converted %s rows of %s to %s.", rows, csv_path, arrow_path)
+    return rows
+
+
+def forecast_data_path(csv_path=DATA_CSV_PATH, arrow_path=DATA_ARROW_PATH):
+    """Returns the file holding the latest uploaded forecast data, the Arrow file unless the CSV is newer. """
+    if os.path.exists(arrow_path) and (not os.path.exists(csv_path) or os.path.getmtime(arrow_path) >= os.path.getmtime(csv_path)):
+        return arrow_path
+    return csv_path
+
+
+def load_forecast_data(columns=None, csv_path=DATA_CSV_PATH, arrow_path=DATA_ARROW_PATH):
+    """Loads the uploaded forecast data.
+
+    The Arrow IPC file is memory mapped and the requested columns are selected from every record batch before they
+    are converted, so the other columns are never read. Uploads saved before the columnar copy existed are read from
+    the CSV, parsing only the requested columns.
+
+    Args:
+        columns (list, optional): The columns to load. Missing columns are ignored. Defaults to all columns.
+
+    Returns:
+        pd.DataFrame: the uploaded data.
+    """
+    path = forecast_data_path(csv_path, arrow_path)
+    if path == csv_path:
+        usecols = (lambda column: column in columns) if columns is not None else None
+        pdf = pd.read_csv(csv_path, usecols=usecols)
+        if 'ds' in pdf.columns:
+            pdf['ds'] = pd.to_datetime(pdf['ds'])
+        return pdf
+
+    with pa.memory_map(arrow_path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        names = reader.schema.names if columns is None else [column for column in columns if column in reader.schema.names]
+        schema = pa.schema([reader.schema.field(name) for name in names])
+        batches = [reader.get_batch(i).select(names) for i in range(reader.num_record_batches)]
+        return pa.Table.from_batches(batches, schema=schema).to_pandas()
+
+
+def forecast_data_columns(csv_path=DATA_CSV_PATH, arrow_path=DATA_ARROW_PATH):
+    """Returns the column names of the uploaded forecast data without loading it, an empty list if nothing was uploaded. """
+    path = forecast_data_path(csv_path, arrow_path)
+    if not os.path.exists(path):
+        return []
+    if path == csv_path:
+        return list(pd.read_csv(csv_path, nrows=0).columns)
+    with pa.memory_map(arrow_path, 'r') as source:
+        return pa.ipc.open_file(source).schema.names
+
+
 def get_current_timestamp():
     # Get the current time
     now = datetime.now()
@@ -69,3 +165,20 @@ def get_current_timestamp():
     current_timestamp = now.strftime('%Y%m%d%H%M%S')
     
     return current_timestamp
+
+
+def upload_fingerprint(paths=(DATA_CSV_PATH, DATA_ARROW_PATH, '/tmp/product_image.png')):
+    """Returns a short key that changes whenever the content of one of the uploaded files changes. Sessions that
+    uploaded the same files get the same key.
+
+    Args:
+        paths (tuple, optional): The files to fingerprint. Defaults to the uploaded data and image locations.
+
+    Returns:
+        str: hash of the content of each existing file, see `libs.forecast_cache.hash_file`. 
+    """
+    digest = hashlib.sha1()
+    for slot, path in enumerate(paths):
+        if os.path.exists(path):
+            digest.update(f"{slot}:{hash_file(path)};".encode('utf-8'))
+    return digest.hexdigest()[:16]
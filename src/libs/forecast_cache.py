@@ -0,0 +1,247 @@
+import os
+import json
+import stat
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from dotenv import load_dotenv
+import pandas as pd
+from libs.lru_cache import TTLLRUCache
+
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+# digests of the recently hashed files, keyed by path, size and modification time
+_file_hashes = TTLLRUCache(max_size=1024, ttl=None)
+
+
+def hash_file(path, block_size=1 << 20):
+    """Returns the sha256 of a file, memoized on its size and modification time so repeat calls are free.
+
+    Args:
+        path (str): The file to hash.
+        block_size (int, optional): The number of bytes read at a time. Defaults to 1 MB.
+
+    Returns:
+        str: the hex digest of the file contents.
+    """
+    info = os.stat(path)
+    memo_key = (os.path.abspath(path), info.st_size, info.st_mtime_ns)
+    digest = _file_hashes.get(memo_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+    _file_hashes.put(memo_key, digest)
+    return digest
+
+
+def _json_default(value):
+    # numpy scalars and timestamps in the metrics
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def ensure_private_dir(path):
+    """Creates a directory only the current user can access, or verifies an existing one.
+
+    Raises:
+        PermissionError: if the directory belongs to another user or others can write to it and it cannot be fixed.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise PermissionError(f"{path} belongs to another user.")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+
+
+class ForecastCache():
+    """Content addressed, size bounded on disk cache of forecast results.
+
+    Entries are keyed by the hash of the uploaded data plus the model parameters, so a changed upload or changed
+    parameters never hit a stale entry. Each entry is a directory holding the forecast frames as Parquet and the
+    metrics, tool response and fitted model parameters as JSON, nothing is unpickled. The cache directory is private
+    to the user running the app. Reads refresh the entry's modification time and the least recently used entries are
+    removed once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir='/tmp/forecast_cache', max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (str, optional): The cache directory, created with 0700 permissions. Defaults to '/tmp/forecast_cache'.
+            max_bytes (int, optional): The maximum total size of the cache on disk. Defaults to 512 MB.
+
+        Raises:
+            PermissionError: if the cache directory belongs to another user.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'write_errors': 0}
+        ensure_private_dir(self.cache_dir)
+
+    def key(self, data_path, **params):
+        """Builds the cache key of a forecast.
+
+        Args:
+            data_path (str): The uploaded data file.
+            **params: The model parameters the forecast depends on (horizon, frequency, interval width, ...).
+
+        Returns:
+            str: the cache key.
+        """
+        payload = json.dumps({'data': hash_file(data_path), 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Returns a cached forecast.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            dict: the cached values and the fitted model parameters under 'model', or None if the key is not cached.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'entry.json')) as f:
+                entry = json.load(f)
+            for name in os.listdir(entry_dir):
+                if name.endswith('.parquet'):
+                    entry[name[:-len('.parquet')]] = pd.read_parquet(os.path.join(entry_dir, name))
+            model_path = os.path.join(entry_dir, 'model.json')
+            if os.path.exists(model_path):
+                with open(model_path) as f:
+                    entry['model'] = json.load(f)
+            os.utime(entry_dir)
+        except Exception as e:
+            # a corrupt entry, or one written by an older version, is removed so the next forecast stores it again
+            if os.path.isdir(entry_dir):
+                logger.warning("Forecast cache entry %s is unreadable and was removed: %s", key, e)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        with self._lock:
+            self._stats['hits'] += 1
+        logger.info("Forecast cache hit: %s", key)
+        return entry
+
+    def put(self, key, model=None, **values):
+        """Stores a forecast atomically and evicts the least recently used entries beyond the size bound. Failures
+        are logged and never raised, the forecast is returned to the user either way.
+
+        Args:
+            key (str): The cache key.
+            model (dict, optional): The fitted model parameters (JSON serializable). Defaults to None.
+            **values: values to cache, data frames are stored as Parquet and everything else as JSON, e.g. the forecast frame, metrics and the tool response.
+
+        Returns:
+            bool: True if the entry is cached.
+        """
+        tmp_dir = None
+        try:
+            tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+            frames = {name: value for name, value in values.items() if isinstance(value, pd.DataFrame)}
+            for name, frame in frames.items():
+                frame.to_parquet(os.path.join(tmp_dir, f"{name}.parquet"), index=False)
+            with open(os.path.join(tmp_dir, 'entry.json'), 'w') as f:
+                json.dump({name: value for name, value in values.items() if name not in frames}, f, default=_json_default)
+            if model is not None:
+                with open(os.path.join(tmp_dir, 'model.json'), 'w') as f:
+                    json.dump(model, f, default=_json_default)
+            entry_dir = self._entry_dir(key)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # entries are content addressed, another session already stored the same forecast
+                if not os.path.isdir(entry_dir):
+                    raise
+            else:
+                tmp_dir = None
+        except Exception as e:
+            logger.warning("Could not cache forecast %s: %s", key, e)
+            with self._lock:
+                self._stats['write_errors'] += 1
+            return False
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            self.evict()
+        except Exception as e:
+            logger.warning("Forecast cache eviction failed: %s", e)
+        return True
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in `max_bytes`. """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self._stats['evictions'] += 1
+            logger.info("Evicted forecast cache entry %s", entry_dir)
+
+    def clear(self):
+        for _, _, entry_dir in self._entries():
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and the current size of the cache. """
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'entries': len(entries), 'bytes': sum(size for _, size, _ in entries)})
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_forecast_cache():
+    """Returns the shared forecast cache configured from the environment, None if its directory is not private. """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = ForecastCache(
+                        cache_dir=os.getenv('FORECAST_CACHE_DIR', '/tmp/forecast_cache'),
+                        max_bytes=int(float(os.getenv('FORECAST_CACHE_MAX_MB', 512)) * 1024 * 1024),
+                    )
+                except PermissionError as e:
+                    logger.warning("Forecast cache disabled: %s", e)
+                    return None
+    return _cache
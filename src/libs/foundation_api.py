@@ -1,8 +1,11 @@
 import os
+import time
 import logging
 from dotenv import load_dotenv
-import requests
 import json
+import libs.http_client as http_client
+from libs.streaming import iter_sse_tokens
+from libs.telemetry import span
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,8 +15,7 @@ logger = logging.getLogger()
 
 
 
-def call_foundation_model(system_msg, user_msg, max_tokens=3):
-    logger.info("Executing Foundational API call.")
+def _foundation_model_request(system_msg, user_msg, max_tokens, stream=False):
     dbtoken = os.getenv('DATABRICKS_TOKEN')
     db_workspace = os.environ.get('DATABRICKS_HOST')
     endpoint_url = f"{db_workspace}/serving-endpoints/databricks-dbrx-instruct/invocations"
@@ -30,13 +32,51 @@ def call_foundation_model(system_msg, user_msg, max_tokens=3):
     ]
 
     payload = {"messages": messages, 'max_tokens': max_tokens}
+    if stream:
+        payload['stream'] = True
     headers = {"Content-Type": "application/json"}
     logger.info("Payload: %s", payload)
-    response = requests.post(endpoint_url, headers=headers, json=payload, auth=("token", dbtoken))
+    return {'url': endpoint_url, 'headers': headers, 'json': payload, 'auth': ("token", dbtoken)}
+
+
+def call_foundation_model(system_msg, user_msg, max_tokens=3, stream=False):
+    """Calls the foundation model serving endpoint. 
+
+    Args:
+        system_msg (str): The system prompt. 
+        user_msg (str): The user prompt. 
+        max_tokens (int, optional): Maximum number of tokens to generate. Defaults to 3.
+        stream (bool, optional): Stream the completion with server-sent events. Defaults to False.
+
+    Returns:
+        dict | generator: the parsed response, or a generator of content tokens when streaming. 
+    """
+    logger.info("Executing Foundational API call.")
+    if stream:
+        return _stream_foundation_model(system_msg, user_msg, max_tokens)
+    with span('foundation.request', payload_bytes=len(system_msg) + len(user_msg)):
+        response = http_client.post(**_foundation_model_request(system_msg, user_msg, max_tokens))
     logger.info(f"Response Text: %s", response.text)
     return json.loads(response.content.decode('utf-8'))
 
 
-    
-    return response.get('output')
+def _stream_foundation_model(system_msg, user_msg, max_tokens):
+    start = time.perf_counter()
+    response = http_client.post(stream=True, **_foundation_model_request(system_msg, user_msg, max_tokens, stream=True))
+    try:
+        response.raise_for_status()
+        for i, token in enumerate(iter_sse_tokens(response)):
+            if i == 0:
+                logger.info("Foundation model time to first token: %.3f seconds.", time.perf_counter() - start)
+            yield token
+    finally:
+        response.close()
+
 
+async def acall_foundation_model(system_msg, user_msg, max_tokens=3):
+    """Async version of `call_foundation_model` that does not block the event loop. """
+    logger.info("Executing async Foundational API call.")
+    with span('foundation.request', payload_bytes=len(system_msg) + len(user_msg)):
+        response = await http_client.apost(**_foundation_model_request(system_msg, user_msg, max_tokens))
+    logger.info(f"Response Text: %s", response.text)
+    return json.loads(response.content.decode('utf-8'))
@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import asyncio
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import aiohttp
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# errors raised before the request reached the server, safe to retry for any request
+ASYNC_CONNECT_ERRORS = (aiohttp.ClientConnectorError,) + ((aiohttp.ConnectionTimeoutError,) if hasattr(aiohttp, 'ConnectionTimeoutError') else ())
+
+
+def _not_sent(error):
+    """Returns True if a `requests` error was raised before the request was sent, i.e. while connecting. """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint's circuit breaker is open and the request is rejected without being sent. """
+
+
+class CircuitBreaker():
+    """Consecutive failure circuit breaker.
+
+    A request counts as failed once its retries are exhausted.
+    After `failure_threshold` consecutive failed requests the circuit opens and calls are rejected for `reset_timeout` seconds.
+    The first call after that is let through as a trial (half open); success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Returns True if a request may be sent. """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Lets the next call through as the trial again, for requests that ended without an outcome, e.g. cancelled. """
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HttpClient():
+    """Shared HTTP client for the Databricks serving endpoints.
+
+    Keeps one keep-alive `requests.Session` per host with a bounded connection pool, applies connect and read timeouts,
+    retries 429 and 5xx responses and connection errors with jittered exponential backoff and guards every endpoint with a circuit breaker.
+    A POST is not idempotent: once it may have reached the server, e.g. on a read timeout or a dropped connection,
+    it is only retried when the call is marked `idempotent`, so model invocations and their side effects never run twice.
+    """
+
+    def __init__(self, pool_maxsize=10, connect_timeout=5, read_timeout=120, max_retries=3, backoff_base=0.5, backoff_max=10, failure_threshold=5, reset_timeout=30):
+        """
+        Args:
+            pool_maxsize (int, optional): keep-alive connections kept per host. Defaults to 10.
+            connect_timeout (float, optional): seconds to establish a connection. Defaults to 5.
+            read_timeout (float, optional): seconds to wait for response data. Defaults to 120.
+            max_retries (int, optional): retries after the first attempt. Defaults to 3.
+            backoff_base (float, optional): base delay in seconds of the exponential backoff. Defaults to 0.5.
+            backoff_max (float, optional): maximum delay in seconds between retries. Defaults to 10.
+            failure_threshold (int, optional): consecutive failures that open an endpoint's circuit. Defaults to 5.
+            reset_timeout (float, optional): seconds an open circuit rejects requests. Defaults to 30.
+        """
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """Returns the keep-alive session for the url's host. """
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+        return session
+
+    def breaker(self, url):
+        """Returns the circuit breaker of the endpoint (host and path) the url points at. """
+        parts = urlsplit(url)
+        endpoint = f"{parts.scheme}://{parts.netloc}{parts.path}"
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = CircuitBreaker(failure_threshold=self.failure_threshold, reset_timeout=self.reset_timeout)
+                self._breakers[endpoint] = breaker
+        return breaker
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # full jitter: uniform delay between zero and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, url, timeout=None, idempotent=False, **kwargs):
+        """Sends a POST request with retries, backoff and circuit breaking.
+
+        Args:
+            url (str): the endpoint url.
+            timeout (tuple, optional): (connect, read) timeout in seconds. Defaults to the client timeout.
+            idempotent (bool, optional): also retry errors raised after the request may have been sent. Defaults to False.
+            **kwargs: passed to `requests.Session.post` (json, headers, auth, stream, ...).
+
+        Returns:
+            requests.Response: the final response. Retryable error responses are returned once retries are exhausted.
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {url}, retry in {breaker.reset_timeout} seconds.")
+        session = self.session(url)
+        attempt = 0
+        # every way out of the loop settles the breaker, otherwise a half open circuit would wait for its trial forever
+        try:
+            while True:
+                try:
+                    response = session.post(url, timeout=timeout or self.timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt >= self.max_retries or not (idempotent or _not_sent(e)):
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning("Request to %s failed (%s). Retrying in %.2f seconds.", url, e, delay)
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        breaker.record_success()
+                        return response
+                    if attempt >= self.max_retries:
+                        breaker.record_failure()
+                        return response
+                    delay = self._backoff(attempt, response)
+                    logger.warning("Request to %s returned %s. Retrying in %.2f seconds.", url, response.status_code, delay)
+                    response.close()
+                attempt += 1
+                time.sleep(delay)
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release_trial()
+            raise
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+class AsyncResponse():
+    """Minimal response object returned by `AsyncHttpClient.post`, mirroring the parts of `requests.Response` we use. """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class AsyncHttpClient(HttpClient):
+    """asyncio counterpart of `HttpClient` built on aiohttp.
+
+    Uses the same timeout, retry, backoff and circuit breaker settings. One aiohttp session is kept per event loop,
+    its connector keeps up to `pool_maxsize` keep-alive connections per host.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._async_sessions = {}
+
+    def async_session(self):
+        """Returns the aiohttp session of the running event loop. """
+        loop = asyncio.get_running_loop()
+        for closed_loop in [l for l in self._async_sessions if l.is_closed()]:
+            del self._async_sessions[closed_loop]
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_maxsize)
+            session = aiohttp.ClientSession(connector=connector)
+            self._async_sessions[loop] = session
+        return session
+
+    async def post(self, url, timeout=None, auth=None, idempotent=False, **kwargs):
+        """Sends a POST request with retries, backoff and circuit breaking without blocking the event loop.
+
+        Args:
+            url (str): the endpoint url.
+            timeout (tuple, optional): (connect, read) timeout in seconds. Defaults to the client timeout.
+            idempotent (bool, optional): also retry errors raised after the request may have been sent. Defaults to False.
+            auth (tuple, optional): (user, password) basic auth credentials.
+            **kwargs: passed to `aiohttp.ClientSession.post` (json, headers, ...).
+
+        Returns:
+            AsyncResponse: the final response. Retryable error responses are returned once retries are exhausted.
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {url}, retry in {breaker.reset_timeout} seconds.")
+        connect_timeout, read_timeout = timeout or self.timeout
+        client_timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        if auth is not None:
+            kwargs['auth'] = aiohttp.BasicAuth(*auth)
+        try:
+            session = self.async_session()
+            attempt = 0
+            while True:
+                try:
+                    async with session.post(url, timeout=client_timeout, **kwargs) as raw_response:
+                        response = AsyncResponse(raw_response.status, raw_response.headers, await raw_response.read())
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if attempt >= self.max_retries or not (idempotent or isinstance(e, ASYNC_CONNECT_ERRORS)):
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning("Request to %s failed (%s). Retrying in %.2f seconds.", url, e, delay)
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        breaker.record_success()
+                        return response
+                    if attempt >= self.max_retries:
+                        breaker.record_failure()
+                        return response
+                    delay = self._backoff(attempt, response)
+                    logger.warning("Request to %s returned %s. Retrying in %.2f seconds.", url, response.status_code, delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # e.g. asyncio.CancelledError, not a failure of the endpoint
+            breaker.release_trial()
+            raise
+
+    async def aclose(self):
+        """Closes the aiohttp session of the running event loop. """
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def _client_settings():
+    return {
+        'pool_maxsize': int(os.getenv('HTTP_POOL_MAXSIZE', 10)),
+        'connect_timeout': float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(os.getenv('HTTP_READ_TIMEOUT', 120)),
+        'max_retries': int(os.getenv('HTTP_MAX_RETRIES', 3)),
+        'failure_threshold': int(os.getenv('HTTP_CIRCUIT_FAILURE_THRESHOLD', 5)),
+        'reset_timeout': float(os.getenv('HTTP_CIRCUIT_RESET_TIMEOUT', 30)),
+    }
+
+
+def get_client():
+    """Returns the shared HTTP client configured from the environment. """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(**_client_settings())
+    return _client
+
+
+def post(url, **kwargs):
+    """Sends a POST request through the shared client. See `HttpClient.post`. """
+    return get_client().post(url, **kwargs)
+
+
+def get_async_client():
+    """Returns the shared asyncio HTTP client configured from the environment. """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncHttpClient(**_client_settings())
+    return _async_client
+
+
+async def apost(url, **kwargs):
+    """Sends a POST request through the shared asyncio client. See `AsyncHttpClient.post`. """
+    return await get_async_client().post(url, **kwargs)
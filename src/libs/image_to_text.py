@@ -1,8 +1,19 @@
-import requests
+import io
 import json
+import asyncio
+import time
+import base64
+import hashlib
+import threading
+from collections import deque
 from dotenv import load_dotenv
 import logging
-import os 
+import os
+import numpy as np
+from PIL import Image, ImageOps
+import libs.http_client as http_client
+from libs.lru_cache import TTLLRUCache
+from libs.telemetry import span
 
 
 
@@ -11,16 +22,241 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
-def image_to_text_extract(data):
-    # data = {'dataframe_records': [{'content': content}] }
+def _image_to_text_request(data):
     itt_endpoint = os.getenv("ITT_ENDPOINT")
     dbtoken = os.getenv('DATABRICKS_TOKEN')
+    return {'url': itt_endpoint, 'auth': ("token", dbtoken), 'headers': {"Content-Type": "application/json"}, 'json': data}
+
+
+def _request_span(data):
+    records = data.get('dataframe_records', [])
+    return span('itt.request', payload_bytes=sum(len(record.get('content', '')) for record in records), images=len(records))
+
+
+def image_to_text_extract(data):
+    # data = {'dataframe_records': [{'content': content}] }
+    return _post(data)[1]
+
+
+async def aimage_to_text_extract(data):
+    """Async version of `image_to_text_extract` that does not block the event loop. """
+    return (await _apost(data))[1]
+
+
+def _post(data):
+    """Sends an image to text request.
+
+    Returns:
+        tuple: the status code and the decoded response.
+    """
+    with _request_span(data):
+        response = http_client.post(**_image_to_text_request(data))
+    return response.status_code, json.loads(response.content.decode('utf-8'))
+
+
+async def _apost(data):
+    with _request_span(data):
+        response = await http_client.apost(**_image_to_text_request(data))
+    return response.status_code, json.loads(response.content.decode('utf-8'))
+
+
+def is_description(status_code, output):
+    """Returns True if the endpoint answered with descriptions, only those are cached. Errors, e.g. a 429 or 503
+    after the retries were exhausted, must be retried by the next request for the image.
+    """
+    return status_code == 200 and isinstance(output, dict) and 'predictions' in output
+
+
+def preprocess_image(img_data, max_side=448, quality=90):
+    """Downsizes and re-encodes an image for the image to text model.
+
+    The InstructBLIP processor of the endpoint resizes every image to 224x224, so larger uploads only add bytes to the
+    request. The image is shrunk to at most `max_side` pixels on its longest side (never enlarged), flattened to RGB
+    and encoded as JPEG.
+
+    Args:
+        img_data (bytes): The uploaded image.
+        max_side (int, optional): The maximum width and height in pixels. Defaults to 448.
+        quality (int, optional): The JPEG quality. Defaults to 90.
+
+    Returns:
+        tuple: the re-encoded image bytes and the RGB `PIL.Image` they were encoded from.
+    """
+    with Image.open(io.BytesIO(img_data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # transparent pixels become white instead of black
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue(), image
+
+
+def image_fingerprint(image, hash_size=8, color_levels=8):
+    """Perceptual key of an image: a difference hash (dHash) plus its coarse average color.
+
+    The dHash compares the brightness of neighbouring pixels of a grayscale thumbnail so resized or re-encoded copies
+    of an image share a key. It ignores color, so the quantized average color is added to keep color variants of the
+    same product (which get different descriptions) apart.
+
+    Args:
+        image (PIL.Image): The image.
+        hash_size (int, optional): The hash has hash_size * hash_size bits. Defaults to 8.
+        color_levels (int, optional): The number of levels per RGB channel of the average color. Defaults to 8.
+
+    Returns:
+        str: the fingerprint.
+    """
+    gray = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    dhash = int(''.join('1' if bit else '0' for bit in bits), 2)
+    color = np.asarray(image.resize((1, 1), Image.BOX), dtype=np.int16).reshape(3) * color_levels // 256
+    return f"{dhash:0{hash_size * hash_size // 4}x}-{''.join(str(c) for c in color)}"
+
+
+class ImageToTextStats():
+    """Payload size and latency statistics of the image to text requests. """
+
+    def __init__(self, window=1000):
+        """
+        Args:
+            window (int, optional): The number of recent endpoint calls the latency percentiles are computed over. Defaults to 1000.
+        """
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._counters = {'requests': 0, 'cache_hits': 0, 'endpoint_calls': 0, 'raw_bytes': 0, 'payload_bytes': 0, 'preprocess_seconds': 0.0}
+
+    def record(self, raw_bytes, payload_bytes, preprocess_seconds, endpoint_seconds=None):
+        """Records a description request. `endpoint_seconds` is None when it was answered from the cache. """
+        with self._lock:
+            self._counters['requests'] += 1
+            self._counters['raw_bytes'] += raw_bytes
+            self._counters['preprocess_seconds'] += preprocess_seconds
+            if endpoint_seconds is None:
+                self._counters['cache_hits'] += 1
+                return
+            self._counters['endpoint_calls'] += 1
+            self._counters['payload_bytes'] += payload_bytes
+            self._latencies.append(endpoint_seconds)
+
+    def stats(self):
+        """Returns the request counters, the bytes saved by preprocessing and the endpoint latency percentiles. """
+        with self._lock:
+            stats = dict(self._counters)
+            latencies = np.array(self._latencies)
+        stats['preprocess_seconds'] = round(stats['preprocess_seconds'], 4)
+        # bytes that would have been sent without preprocessing and caching
+        stats['unprocessed_payload_bytes'] = 4 * ((stats['raw_bytes'] + 2) // 3)
+        stats['bytes_saved'] = stats['unprocessed_payload_bytes'] - stats['payload_bytes']
+        if latencies.size:
+            stats.update({
+                'endpoint_mean_seconds': round(float(latencies.mean()), 4),
+                'endpoint_p50_seconds': round(float(np.percentile(latencies, 50)), 4),
+                'endpoint_p95_seconds': round(float(np.percentile(latencies, 95)), 4),
+            })
+        return stats
+
+
+_stats = ImageToTextStats()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_description_cache():
+    """Returns the shared cache of image descriptions configured from the environment. """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLLRUCache(
+                    max_size=int(os.getenv('ITT_CACHE_MAX_ENTRIES', 1024)),
+                    ttl=float(os.getenv('ITT_CACHE_TTL', 86400)),
+                    max_bytes=int(float(os.getenv('ITT_CACHE_MAX_MB', 16)) * 1024 * 1024),
+                    size_fn=lambda desc: len(json.dumps(desc, default=str)),
+                )
+    return _cache
+
+
+def get_stats():
+    """Returns the image to text payload and latency statistics together with the description cache statistics. """
+    stats = _stats.stats()
+    stats['cache'] = get_description_cache().stats()
+    return stats
+
+
+def prepare_request(img_data):
+    """Preprocesses an image and builds its image to text request.
+
+    Returns:
+        tuple: the cache key of the image, the request payload and the seconds spent preprocessing.
+    """
+    start = time.perf_counter()
+    with span('itt.preprocess', payload_bytes=len(img_data)):
+        content, image = preprocess_image(img_data, max_side=int(os.getenv('ITT_IMAGE_MAX_SIDE', 448)), quality=int(os.getenv('ITT_IMAGE_QUALITY', 90)))
+    key = image_fingerprint(image)
+    data = {'dataframe_records': [{'content': base64.b64encode(content).decode('utf-8')}], 'client_request_id': hashlib.sha1(content).hexdigest()[:16]}
+    return key, data, time.perf_counter() - start
+
+
+def _payload_bytes(data):
+    return len(data['dataframe_records'][0]['content'])
+
+
+def _log_request(img_data, data, key, preprocess_seconds, endpoint_seconds):
+    _stats.record(len(img_data), _payload_bytes(data), preprocess_seconds, endpoint_seconds)
+    if endpoint_seconds is None:
+        logger.info("Image description cache hit %s (raw %s bytes).", key, len(img_data))
+    else:
+        logger.info("Image described in %.3fs: raw %s bytes, sent %s bytes (preprocessing %.3fs).", endpoint_seconds, len(img_data), _payload_bytes(data), preprocess_seconds)
+
+
+def _cache_description(cache, key, status_code, desc_output):
+    if is_description(status_code, desc_output):
+        cache.put(key, desc_output)
+    else:
+        logger.warning("Image to text endpoint returned %s, the response is not cached: %s", status_code, str(desc_output)[:200])
+
+
+def describe_image(img_data):
+    """Describes an image with the image to text endpoint. Images are downsized before sending and the descriptions
+    of perceptually identical images are answered from the cache. Error responses are returned without being cached.
+
+    Args:
+        img_data (bytes): The image.
+
+    Returns:
+        the endpoint response.
+    """
+    key, data, preprocess_seconds = prepare_request(img_data)
+    cache = get_description_cache()
+    desc_output = cache.get(key)
+    endpoint_seconds = None
+    if desc_output is None:
+        start = time.perf_counter()
+        status_code, desc_output = _post(data)
+        endpoint_seconds = time.perf_counter() - start
+        _cache_description(cache, key, status_code, desc_output)
+    _log_request(img_data, data, key, preprocess_seconds, endpoint_seconds)
+    return desc_output
+
 
-    # Make the POST request
-    response = requests.post(
-        itt_endpoint,
-        auth=("token", dbtoken),
-        headers={"Content-Type": "application/json"},
-        json=data
-    )
-    return json.loads(response.content.decode('utf-8'))
+async def adescribe_image(img_data):
+    """Async version of `describe_image`. Preprocessing runs on the default executor. """
+    key, data, preprocess_seconds = await asyncio.to_thread(prepare_request, img_data)
+    cache = get_description_cache()
+    desc_output = cache.get(key)
+    endpoint_seconds = None
+    if desc_output is None:
+        start = time.perf_counter()
+        status_code, desc_output = await _apost(data)
+        endpoint_seconds = time.perf_counter() - start
+        _cache_description(cache, key, status_code, desc_output)
+    _log_request(img_data, data, key, preprocess_seconds, endpoint_seconds)
+    return desc_output
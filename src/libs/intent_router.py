@@ -0,0 +1,258 @@
+import os
+import re
+import logging
+import threading
+import numpy as np
+import libs.file_handler as fh
+from libs.session_state import get_current_session
+from libs.response_cache import normalize_prompt, embed_prompt
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+# the tool each intent is routed to
+INTENT_TOOLS = {
+    'forecast': "Forecast Generation Tool",
+    'describe': "Product Description Tool Tool",
+    'shop': "Text to shop Tool",
+}
+
+# intents whose tool changes the session, e.g. adds items to the cart, a misrouted message can not be taken back
+SIDE_EFFECT_INTENTS = {'shop'}
+
+# labelled example messages of every intent, 'other' covers messages the agent has to handle
+INTENT_EXAMPLES = {
+    'forecast': [
+        "generate a forecast", "forecast my data", "create a daily forecast of the uploaded data",
+        "predict sales for the next month", "forecast demand per sku", "run a demand forecast",
+        "what will sales look like next month", "forecast the uploaded file with holt winters",
+        "give me a tuned forecast", "project future demand", "forecast each store",
+    ],
+    'describe': [
+        "write a product description", "describe this product", "create a product description for the image",
+        "generate a description of the uploaded image", "write copy for this product", "product description please",
+        "describe the item in the picture", "write a catalog description for this image",
+    ],
+    'shop': [
+        "add apples to my cart", "buy 2 gallons of milk", "i want to purchase eggs and bread",
+        "add 3 bananas and a loaf of bread to the cart", "order some coffee", "put 2 avocados in my cart",
+        "i need milk, eggs and butter", "purchase a bag of rice", "get me 6 cans of soda",
+    ],
+    'other': [
+        "hello", "hi there", "what can you do", "thank you", "how are you",
+        "what is the weather today", "tell me a joke", "explain the forecast", "why is the trend going down",
+        "what ingredients do i need for lasagna", "shop for a recipe", "compare these two products",
+        "what is in my cart", "summarize our conversation", "which engine should i use",
+    ],
+}
+
+# keywords that make an intent likely on their own
+INTENT_KEYWORDS = {
+    'forecast': re.compile(r'\b(forecast\w*|predict\w*|projection|project future)\b'),
+    'describe': re.compile(r'\b(product descriptions?|describe|description|catalog copy|copy for)\b'),
+    'shop': re.compile(r'\b(add|buy|purchase|order|cart|basket)\b'),
+}
+
+# messages that look like an intent but need the reasoning of the agent: questions, cart edits and cart queries
+AMBIGUOUS_PATTERN = re.compile(r'\b(why|explain|compare|recipe|ingredients?|recommend\w*|what if|how (do|does|should|would|can)|remove|delete|undo|total|sort\w*|my cart)\b|\?')
+
+NUMBER_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'a dozen': 12, 'dozen': 12, 'a couple of': 2, 'a few': 3}
+SHOP_PREFIX = re.compile(r'^(please\s+)?(can you\s+|could you\s+)?(please\s+)?(add|buy|purchase|order|get( me)?|put|i want( to buy| to purchase)?|i need|i would like( to buy)?|i\'d like( to buy)?)\s+', re.I)
+SHOP_SUFFIX = re.compile(r'\s+(to|in|into)\s+(my|the)\s+(cart|basket)\s*$|\s+(please|for me)\s*$', re.I)
+# words that make a fragment of a shopping request a sentence rather than a product name
+VERB_PATTERN = re.compile(r"\b(add|remove|delete|drop|take|undo|buy|purchase|order|put|get|sort|total|count|sum|show|list|make|is|are|was|were|be|do|does|did|have|has)\b", re.I)
+POSSESSIVE_PATTERN = re.compile(r"\b(my|your|our|their|his|her|its)\b|'s\b", re.I)
+MAX_ITEM_WORDS = 3
+QUANTITY_PATTERN = re.compile(r'^(\d+|' + '|'.join(sorted((re.escape(w) for w in NUMBER_WORDS), key=len, reverse=True)) + r')\s+(?:of\s+)?(.+)$', re.I)
+
+ENGINE_PATTERNS = {
+    'holt_winters': re.compile(r'holt[\s_-]?winters?|exponential smoothing'),
+    'linear_trend': re.compile(r'linear[\s_-]?trend'),
+    'seasonal_naive': re.compile(r'seasonal[\s_-]?naive|naive'),
+    'prophet': re.compile(r'prophet'),
+}
+# a product description request names the product, "describe what you just did" does not
+DESCRIBE_OBJECT_PATTERN = re.compile(r'\b(product|image|picture|photo|item|this|it|copy)\b')
+FREQUENCY_PATTERN = re.compile(r'\b(daily|weekly|monthly)\b')
+SERIES_PATTERN = re.compile(r'\b(?:per|by|for each|each)\s+([a-z_][\w]*)')
+
+
+class Route():
+    """A routing decision: the intent, its confidence and the tool arguments extracted from the message. """
+
+    def __init__(self, intent, confidence, margin, tool_name=None, tool_input=None, reason=None):
+        self.intent = intent
+        self.confidence = confidence
+        self.margin = margin
+        self.tool_name = tool_name
+        self.tool_input = tool_input
+        self.reason = reason
+
+    @property
+    def routed(self):
+        return self.tool_name is not None
+
+    def __repr__(self):
+        return f"Route(intent={self.intent}, confidence={self.confidence:.2f}, margin={self.margin:.2f}, tool={self.tool_name}, input={self.tool_input}, reason={self.reason})"
+
+
+def parse_shopping_items(message):
+    """Extracts the (product_name, quantity) pairs of a plain shopping request such as "add 2 apples and milk to my cart".
+
+    Returns:
+        list: the requested items, None if the message is not a plain list of items.
+    """
+    text = SHOP_SUFFIX.sub('', SHOP_PREFIX.sub('', message.strip().rstrip('.!')))
+    if not text or text == message.strip().rstrip('.!'):
+        # no shopping verb was found at the start of the message
+        return None
+    items = []
+    for part in re.split(r',\s*(?:and\s+)?|\s+and\s+|\s*\n\s*|;\s*', text):
+        part = part.strip().strip('-*').strip()
+        if not part:
+            continue
+        quantity = 1
+        match = QUANTITY_PATTERN.match(part)
+        if match:
+            quantity = int(match.group(1)) if match.group(1).isdigit() else NUMBER_WORDS[match.group(1).lower()]
+            part = match.group(2)
+        part = re.sub(r'^(some|more)\s+', '', part, flags=re.I)
+        # fragments with a verb, a possessive or more than a few words are sentences rather than product names
+        if not part or len(part.split()) > MAX_ITEM_WORDS or VERB_PATTERN.search(part) or POSSESSIVE_PATTERN.search(part):
+            return None
+        items.append({'product_name': part, 'quantity': quantity})
+    return items or None
+
+
+def parse_forecast_arguments(message, columns):
+    """Extracts the forecast tool arguments from the message.
+
+    Returns:
+        dict: the tool arguments, None if the message names a series column that is not in the uploaded data.
+    """
+    text = message.lower()
+    frequency = FREQUENCY_PATTERN.search(text)
+    args = {'frequency': frequency.group(1) if frequency else 'daily'}
+    for engine, pattern in ENGINE_PATTERNS.items():
+        if pattern.search(text):
+            args['engine'] = engine
+            break
+    if re.search(r'\b(tune|tuned|tuning|backtest\w*)\b', text):
+        args['tune'] = True
+
+    series = SERIES_PATTERN.search(text)
+    if series:
+        by_name = {column.lower(): column for column in columns}
+        name = series.group(1)
+        column = by_name.get(name) or by_name.get(name.rstrip('s')) or by_name.get(f"{name}_id") or by_name.get(f"{name.rstrip('s')}_id")
+        if column is None:
+            return None
+        args['series_column'] = column
+    return args
+
+
+class IntentRouter():
+    """Local classifier that sends clear tool requests straight to the tool instead of through the ReAct agent.
+
+    Messages are embedded with the character n-gram embeddings of the response cache and compared with labelled
+    example messages of every intent, keywords of an intent raise its score. A message is routed when the best intent
+    is a tool intent with at least `threshold` confidence (`side_effect_threshold` for the intents whose tool changes
+    the session), a `min_margin` lead over the second best intent and its tool arguments could be extracted locally.
+    Everything else goes to the agent.
+    """
+
+    def __init__(self, tool_names, threshold=0.6, side_effect_threshold=0.75, min_margin=0.15, keyword_boost=0.3, examples=None):
+        """
+        Args:
+            tool_names (list): The names of the tools available to the agent, intents without a tool are never routed.
+            threshold (float, optional): The minimum confidence of a routed message. Defaults to 0.6.
+            side_effect_threshold (float, optional): The minimum confidence of a message routed to a tool with side effects. Defaults to 0.75.
+            min_margin (float, optional): The minimum lead of the best intent over the second best. Defaults to 0.15.
+            keyword_boost (float, optional): Added to the score of an intent whose keywords are in the message. Defaults to 0.3.
+            examples (dict, optional): Example messages per intent. Defaults to `INTENT_EXAMPLES`.
+        """
+        self.tools = {intent: name for intent, name in INTENT_TOOLS.items() if name in tool_names}
+        self.threshold = threshold
+        self.side_effect_threshold = max(threshold, side_effect_threshold)
+        self.min_margin = min_margin
+        self.keyword_boost = keyword_boost
+        examples = examples or INTENT_EXAMPLES
+        self.intents = list(examples)
+        self._labels = np.array([self.intents.index(intent) for intent, texts in examples.items() for _ in texts])
+        self._embeddings = np.stack([embed_prompt(normalize_prompt(text)) for texts in examples.values() for text in texts])
+        self._lock = threading.Lock()
+        self._stats = {'messages': 0, 'routed': 0, 'fallback': 0, 'llm_calls_saved': 0}
+
+    def scores(self, message):
+        """Returns the score of every intent: its most similar example plus the keyword boost. """
+        normalized = normalize_prompt(message)
+        similarities = self._embeddings @ embed_prompt(normalized)
+        scores = {intent: float(similarities[self._labels == i].max()) for i, intent in enumerate(self.intents)}
+        for intent, pattern in INTENT_KEYWORDS.items():
+            if intent in scores and pattern.search(normalized):
+                scores[intent] = min(1.0, scores[intent] + self.keyword_boost)
+        return scores
+
+    def classify(self, message):
+        """Returns the best intent with its confidence and lead over the second best intent. """
+        scores = sorted(self.scores(message).items(), key=lambda item: item[1], reverse=True)
+        (intent, confidence), (_, second) = scores[0], scores[1]
+        return intent, confidence, confidence - second
+
+    def route(self, message):
+        """Decides whether the message goes straight to a tool.
+
+        Returns:
+            Route: the decision, `route.routed` is False when the agent has to handle the message.
+        """
+        intent, confidence, margin = self.classify(message)
+        route = Route(intent, confidence, margin)
+        if intent not in self.tools:
+            route.reason = "no tool intent"
+        elif confidence < (self.side_effect_threshold if intent in SIDE_EFFECT_INTENTS else self.threshold) or margin < self.min_margin:
+            route.reason = "low confidence"
+        # a trailing "to my cart" only names where the items go
+        elif AMBIGUOUS_PATTERN.search(SHOP_SUFFIX.sub('', message.strip().rstrip('.!')).lower()):
+            route.reason = "needs reasoning"
+        else:
+            route.tool_input, route.reason = self._extract(intent, message)
+            if route.tool_input is not None:
+                route.tool_name = self.tools[intent]
+
+        with self._lock:
+            self._stats['messages'] += 1
+            if route.routed:
+                self._stats['routed'] += 1
+                # a tool call through the agent takes at least two LLM calls, a routed message takes one
+                self._stats['llm_calls_saved'] += 1
+            else:
+                self._stats['fallback'] += 1
+        logger.info("Intent routing: %s (%s).", route, "routed to tool" if route.routed else "falling back to the agent")
+        return route
+
+    def _extract(self, intent, message):
+        """Extracts the tool arguments locally. Returns (None, reason) when the message can not be routed. """
+        session = get_current_session()
+        if intent == 'forecast':
+            columns = fh.forecast_data_columns(session.data_csv_path, session.data_arrow_path)
+            if not columns:
+                return None, "no data uploaded"
+            args = parse_forecast_arguments(message, columns)
+            return (args, "routed") if args is not None else (None, "unknown series column")
+        if intent == 'describe':
+            if not DESCRIBE_OBJECT_PATTERN.search(message.lower()):
+                return None, "no product named"
+            if not os.path.exists(session.product_image_path):
+                return None, "no image uploaded"
+            return {}, "routed"
+        items = parse_shopping_items(message)
+        return ({'items': items}, "routed") if items else (None, "items not parsed")
+
+    def stats(self):
+        """Returns the number of routed and fallback messages and the estimated LLM calls saved. """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['routed_share'] = round(stats['routed'] / stats['messages'], 4) if stats['messages'] else 0.0
+        return stats
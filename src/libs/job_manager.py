@@ -0,0 +1,226 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled. """
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are waiting for a worker. """
+
+
+class Job():
+    """A unit of background work, e.g. an agent turn, with its status, progress and result. """
+
+    def __init__(self, session_id=None, description=None):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.description = description
+        self.status = QUEUED
+        self.progress = "Waiting for a worker"
+        self.steps = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._callbacks = []
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def set_progress(self, message):
+        """Records the current step of the job. Raises `JobCancelled` once the job was cancelled, so long running work
+        stops at its next step.
+        """
+        self.steps += 1
+        self.progress = message
+        self.raise_if_cancelled()
+
+    def add_done_callback(self, fn):
+        """Calls `fn(job, status)` from the worker once the job finished, before its status is visible to pollers. """
+        self._callbacks.append(fn)
+
+    def raise_if_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled.")
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'session_id': self.session_id,
+            'status': self.status,
+            'progress': self.progress,
+            'steps': self.steps,
+            'error': self.error,
+            'seconds': round((self.finished_at or time.time()) - (self.started_at or self.created_at), 3),
+        }
+
+
+class JobManager():
+    """Runs jobs on a bounded pool of worker threads, so a web request only submits a job and returns.
+
+    Jobs report progress through `Job.set_progress` and are cancelled cooperatively: a queued job never starts and a
+    running job stops at its next progress step. Finished jobs are kept for `result_ttl` seconds so their result can be
+    polled.
+    """
+
+    def __init__(self, max_workers=4, max_pending=100, result_ttl=600):
+        """
+        Args:
+            max_workers (int, optional): The number of jobs running at the same time. Defaults to 4.
+            max_pending (int, optional): The number of queued and running jobs beyond which `submit` raises `JobQueueFull`. Defaults to 100.
+            result_ttl (float, optional): Seconds a finished job stays available. Defaults to 600.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, DONE: 0, FAILED: 0, CANCELLED: 0, 'rejected': 0}
+
+    def submit(self, fn, *args, session_id=None, description=None, on_done=None, **kwargs):
+        """Queues `fn(job, *args, **kwargs)`, its return value becomes the result of the job.
+
+        Args:
+            fn (callable): The work, called with the job first.
+            session_id (str, optional): The session the job belongs to. Defaults to None.
+            description (str, optional): Logged with the job. Defaults to None.
+            on_done (callable, optional): Called as `on_done(job, status)` once the job finished, also when it was cancelled before it started. Defaults to None.
+
+        Returns:
+            Job: the queued job.
+        """
+        job = Job(session_id=session_id, description=description)
+        if on_done is not None:
+            job.add_done_callback(on_done)
+        with self._lock:
+            self._prune()
+            if sum(1 for queued in self._jobs.values() if not queued.done) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull(f"{self.max_pending} jobs are already waiting.")
+            self._jobs[job.job_id] = job
+            self._stats['submitted'] += 1
+        try:
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        except BaseException:
+            # e.g. the executor was shut down, the job will never run
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+                self._stats['submitted'] -= 1
+            raise
+        logger.info("Queued job %s (%s).", job.job_id, description)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            self._finish(job, CANCELLED)
+            return
+        job.status, job.started_at, job.progress = RUNNING, time.time(), "Started"
+        try:
+            job.result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            logger.exception("Job %s failed.", job.job_id)
+            self._finish(job, FAILED)
+        else:
+            self._finish(job, CANCELLED if job.cancel_requested else DONE)
+
+    def _finish(self, job, status):
+        for callback in job._callbacks:
+            try:
+                callback(job, status)
+            except Exception:
+                logger.exception("Done callback of job %s failed.", job.job_id)
+        job.finished_at = time.time()
+        job.status = status
+        with self._lock:
+            self._stats[status] += 1
+        logger.info("Job %s %s in %.3f seconds.", job.job_id, status, job.finished_at - (job.started_at or job.created_at))
+
+    def get(self, job_id):
+        """Returns a job, None if it does not exist or expired. """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Requests the cancellation of a job.
+
+        Returns:
+            bool: False if the job does not exist or already finished.
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job._cancel.set()
+        job.progress = "Cancelling"
+        logger.info("Cancelling job %s.", job_id)
+        return True
+
+    def active(self, session_id):
+        """Returns the queued and running jobs of a session, oldest first. """
+        with self._lock:
+            return [job for job in self._jobs.values() if job.session_id == session_id and not job.done]
+
+    def _prune(self):
+        """Forgets the jobs that finished more than `result_ttl` seconds ago. Call with the lock held. """
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and now - job.finished_at > self.result_ttl]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        """Returns the number of queued, running and kept jobs and the cumulative counters. """
+        with self._lock:
+            self._prune()
+            stats = dict(self._stats)
+            stats.update({
+                'workers': self.max_workers,
+                QUEUED: sum(1 for job in self._jobs.values() if job.status == QUEUED),
+                RUNNING: sum(1 for job in self._jobs.values() if job.status == RUNNING),
+                'jobs': len(self._jobs),
+            })
+        return stats
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Returns the shared job manager configured from the environment. """
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager(
+                    max_workers=int(os.getenv('JOB_WORKERS', 4)),
+                    max_pending=int(os.getenv('JOB_MAX_PENDING', 100)),
+                    result_ttl=float(os.getenv('JOB_RESULT_TTL', 600)),
+                )
+    return _manager
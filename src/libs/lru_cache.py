@@ -0,0 +1,133 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLLRUCache():
+    """Thread safe least recently used cache with a per entry time to live.
+
+    The cache is bounded by number of entries and optionally by the total size of its values as measured by `size_fn`.
+    Expired entries are dropped lazily when they are read and whenever the cache needs room.
+    """
+
+    def __init__(self, max_size=256, ttl=3600, max_bytes=None, size_fn=None):
+        """
+        Args:
+            max_size (int, optional): maximum number of entries. Defaults to 256.
+            ttl (float, optional): seconds an entry stays valid, None to never expire. Defaults to 3600.
+            max_bytes (int, optional): maximum total size of the cached values. Defaults to None (unbounded).
+            size_fn (callable, optional): returns the size of a value in bytes. Required when `max_bytes` is set.
+        """
+        assert max_bytes is None or size_fn is not None, "size_fn is required when max_bytes is set."
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _remove(self, key):
+        value, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+        return value
+
+    def get(self, key, default=None, count=True):
+        """Returns the value stored for key and marks it as recently used.
+
+        Args:
+            key (hashable): the cache key.
+            default (optional): returned when the key is missing or expired. Defaults to None.
+            count (bool, optional): record the lookup in the hit/miss statistics. Defaults to True.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1], time.monotonic()):
+                self._remove(key)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                if count:
+                    self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            if count:
+                self._stats['hits'] += 1
+            return entry[0]
+
+    def record_lookup(self, hit):
+        """Records a lookup made outside of `get`, e.g. by a caller that also searches the entries itself. """
+        with self._lock:
+            self._stats['hits' if hit else 'misses'] += 1
+
+    def put(self, key, value):
+        """Stores a value, evicting expired and then least recently used entries as needed.
+
+        Returns:
+            list: the (key, value) pairs that were evicted to make room.
+        """
+        size = self.size_fn(value) if self.size_fn is not None else 0
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self.total_bytes += size
+            if len(self._entries) > self.max_size or (self.max_bytes is not None and self.total_bytes > self.max_bytes):
+                evicted.extend(self.expire())
+            while len(self._entries) > 1 and (len(self._entries) > self.max_size or (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+                oldest = next(iter(self._entries))
+                evicted.append((oldest, self._remove(oldest)))
+                self._stats['evictions'] += 1
+        return evicted
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+
+    def expire(self):
+        """Drops every expired entry.
+
+        Returns:
+            list: the (key, value) pairs that expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, stored_at, _) in self._entries.items() if self._expired(stored_at, now)]
+            self._stats['expirations'] += len(expired)
+            return [(key, self._remove(key)) for key in expired]
+
+    def items(self):
+        """Returns a snapshot of the live (key, value) pairs from least to most recently used. """
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, stored_at, _) in self._entries.items() if not self._expired(stored_at, now)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and the current size of the cache. """
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            })
+        return stats
@@ -1,13 +1,12 @@
 from dotenv import load_dotenv
 import logging
 from typing import Union, Dict, Tuple
-import base64
-import io
+import asyncio
 
 from langchain.tools import BaseTool
-from PIL import Image
 import libs.image_to_text as image_to_text
-import libs.file_handler as fh
+from libs.session_state import get_current_session
+from libs.asset_registry import get_asset_registry
 
 
 load_dotenv()
@@ -32,24 +31,43 @@ class ProductDescriptionTool(BaseTool):
         logger.info("Generating Product Description.")
 
         logger.info("Loading image from system.")
-        # create input data from image 
-        with open('/tmp/product_image.png', 'rb') as f:
-            img_data = f.read()
-
-        img_data_base64 = base64.b64encode(img_data).decode('utf-8')
-        data = {'dataframe_records': [{'content': img_data_base64}], 'client_request_id':'1' }
+        img_data = self._load_image()
 
         logger.info("Extracting text from image.")
-        desc_output = image_to_text.image_to_text_extract(data=data)
+        desc_output = image_to_text.describe_image(img_data)
         logger.info("Raw Image Description - %s", desc_output)
 
-        # save image for display 
-        img_path = f"src/assets/display_{fh.get_current_timestamp()}.png"
-        image = Image.open(io.BytesIO(img_data))
-        image.save(img_path)
-        image.close()
-        logger.info("Display image saved.")
+        self._save_display_image(img_data)
+        return desc_output
+
+    async def _arun(self):
+        """Async version of `_run`. File I/O and image preprocessing run on the default executor. 
+
+        Returns:
+            str: returns a text description of the product. 
+        """
+        logger.info("Generating Product Description.")
 
+        img_data = await asyncio.to_thread(self._load_image)
+
+        logger.info("Extracting text from image.")
+        desc_output = await image_to_text.adescribe_image(img_data)
+        logger.info("Raw Image Description - %s", desc_output)
+
+        await asyncio.to_thread(self._save_display_image, img_data)
         return desc_output
 
+    def _load_image(self):
+        """Reads the uploaded image. It is downsized for the image to text request and displayed as uploaded. 
+
+        Returns:
+            bytes: the raw image bytes. 
+        """
+        with open(get_current_session().product_image_path, 'rb') as f:
+            return f.read()
+
+    def _save_display_image(self, img_data):
+        # publish the uploaded image (saved as png) for display 
+        get_asset_registry().publish(get_current_session().session_id, img_data, 'image/png')
+        logger.info("Display image saved.")
 
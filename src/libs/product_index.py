@@ -0,0 +1,218 @@
+import os
+import re
+import logging
+import threading
+import time
+from dotenv import load_dotenv
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+import libs.db_sql as dbsql
+
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+PRODUCT_FIELDS = ['name', 'id', 'description', 'company_name']
+
+
+def normalize_text(text):
+    """Lowercases and strips punctuation so 'Eggs, Large!' and 'eggs large' index the same. """
+    return re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).strip()
+
+
+class ProductIndex():
+    """In-memory top-k product matcher over character n-grams of product names.
+
+    Names are embedded as TF-IDF weighted, hashed character n-grams. Exact search multiplies the query
+    against an inverted (n-gram x product) matrix so only products sharing an n-gram with the query are touched.
+    The optional approximate mode projects vectors into a small dense space and buckets them with
+    random hyperplane LSH tables, then rescores the bucket candidates exactly.
+    """
+
+    def __init__(self, ngram_range=(2, 4), n_features=2**18, ann=False, n_components=64, n_tables=8, n_bits=10, min_candidates=50, random_state=42):
+        """
+        Args:
+            ngram_range (tuple, optional): character n-gram sizes used for matching. Defaults to (2, 4).
+            n_features (int, optional): size of the hashed feature space. Defaults to 2**18.
+            ann (bool, optional): use approximate nearest neighbour search. Defaults to False.
+            n_components (int, optional): dense dimensions used for the ANN projection. Defaults to 64.
+            n_tables (int, optional): number of LSH tables. Defaults to 8.
+            n_bits (int, optional): hyperplanes per LSH table. Defaults to 10.
+            min_candidates (int, optional): fall back to exact search when ANN yields fewer candidates. Defaults to 50.
+            random_state (int, optional): seed for the ANN projections. Defaults to 42.
+        """
+        self.ann = ann
+        self.n_components = n_components
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.min_candidates = min_candidates
+        self.random_state = random_state
+        self.vectorizer = HashingVectorizer(analyzer='char_wb', ngram_range=ngram_range, n_features=n_features, alternate_sign=False, norm=None, preprocessor=normalize_text)
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.records = []
+        self.matrix = None
+        self.inverted = None
+        self.built_at = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def fit(self, records):
+        """Builds the index.
+
+        Args:
+            records (list): product records as dictionaries with at least a 'name' key.
+
+        Returns:
+            ProductIndex: the fitted index.
+        """
+        start = time.perf_counter()
+        self.records = list(records)
+        names = [r['name'] for r in self.records]
+        counts = self.vectorizer.transform(names)
+        self.matrix = normalize(self.tfidf.fit_transform(counts)).tocsr()
+        # transposed copy: each row is the posting list of one n-gram
+        self.inverted = self.matrix.T.tocsr()
+
+        if self.ann:
+            self._build_lsh()
+
+        self.built_at = time.time()
+        logger.info("Product index built with %s products in %.2f seconds.", len(self.records), time.perf_counter() - start)
+        return self
+
+    def _build_lsh(self):
+        n_components = max(1, min(self.n_components, self.matrix.shape[0] - 1, self.matrix.shape[1] - 1))
+        self.svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        dense = normalize(self.svd.fit_transform(self.matrix))
+        rng = np.random.default_rng(self.random_state)
+        self.hyperplanes = rng.standard_normal((self.n_tables, n_components, self.n_bits))
+        self.bit_weights = 1 << np.arange(self.n_bits)
+        self.tables = []
+        for t in range(self.n_tables):
+            codes = ((dense @ self.hyperplanes[t]) > 0) @ self.bit_weights
+            order = np.argsort(codes, kind='stable')
+            buckets, starts = np.unique(codes[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self.tables.append({int(b): order[s:e] for b, s, e in zip(buckets, starts, ends)})
+
+    def _vectorize(self, queries):
+        return normalize(self.tfidf.transform(self.vectorizer.transform(queries))).tocsr()
+
+    def _candidates(self, query_vec):
+        # project using only the query's non-zero n-grams instead of a full sparse x dense product
+        dense = self.svd.components_[:, query_vec.indices] @ query_vec.data
+        dense = (dense / (np.linalg.norm(dense) or 1.0))[np.newaxis, :]
+        found = [self.tables[t].get(int(((dense @ self.hyperplanes[t]) > 0) @ self.bit_weights)) for t in range(self.n_tables)]
+        found = [f for f in found if f is not None]
+        if not found:
+            return None
+        candidates = np.unique(np.concatenate(found))
+        # too few candidates risks missing the best match, too many is slower than the inverted index
+        if len(candidates) < self.min_candidates or len(candidates) > len(self.records) // 4:
+            return None
+        return candidates
+
+    def _top_k(self, query_vec, k):
+        candidates = self._candidates(query_vec) if self.ann else None
+        if candidates is None:
+            scores = (query_vec @ self.inverted).toarray().ravel()
+            idx = np.arange(len(scores))
+        else:
+            scores = (self.matrix[candidates] @ query_vec.T).toarray().ravel()
+            idx = candidates
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        # products sharing no n-gram with the query are not matches
+        return [(self.records[idx[i]], float(scores[i])) for i in top if scores[i] > 0]
+
+    def search(self, query, k=1):
+        """Finds the products whose names best match the query.
+
+        Args:
+            query (str): free text product name from the user.
+            k (int, optional): number of matches to return. Defaults to 1.
+
+        Returns:
+            list: (record, score) tuples ordered from best to worst match.
+        """
+        return self.search_many([query], k=k)[0]
+
+    def search_many(self, queries, k=1):
+        """Vectorizes several queries at once and returns the top-k matches for each.
+
+        Args:
+            queries (list): free text product names.
+            k (int, optional): number of matches per query. Defaults to 1.
+
+        Returns:
+            list: one list of (record, score) tuples per query.
+        """
+        assert self.matrix is not None, "The product index has not been built."
+        query_matrix = self._vectorize(queries)
+        return [self._top_k(query_matrix[i], k) for i in range(query_matrix.shape[0])]
+
+
+def load_catalog(product_table_name):
+    """Reads every product in the catalog table in a single warehouse query.
+
+    Args:
+        product_table_name (str): fully qualified name of the catalog table.
+
+    Returns:
+        list: product records as dictionaries.
+    """
+    results = dbsql.execute_query(query=f"select {', '.join(PRODUCT_FIELDS)} from {product_table_name}")
+    return [{field: getattr(r, field) for field in PRODUCT_FIELDS} for r in results]
+
+
+class ProductIndexUnavailable(Exception):
+    """Raised while a failed index build is backing off. """
+
+
+_indexes = {}
+# table name -> (time of the last failed build, consecutive failures, error)
+_failures = {}
+_index_lock = threading.Lock()
+
+
+def _retry_delay(failures):
+    """Seconds before a failed build is tried again, doubling with every consecutive failure. """
+    base = float(os.getenv('PRODUCT_INDEX_RETRY_SECONDS', 60))
+    return min(base * 2 ** (failures - 1), float(os.getenv('PRODUCT_INDEX_MAX_RETRY_SECONDS', 600)))
+
+
+def get_product_index(product_table_name, refresh=False):
+    """Returns the shared product index for a catalog table, building it on first use. A failed build is remembered
+    and not retried before its backoff expired, so a warehouse outage does not add a catalog scan to every search.
+
+    Args:
+        product_table_name (str): fully qualified name of the catalog table.
+        refresh (bool, optional): rebuild the index from the warehouse. Defaults to False.
+
+    Returns:
+        ProductIndex: the fitted index.
+    """
+    with _index_lock:
+        index = _indexes.get(product_table_name)
+        if index is None or refresh:
+            failed_at, failures, error = _failures.get(product_table_name, (None, 0, None))
+            if failed_at is not None and not refresh and time.monotonic() - failed_at < _retry_delay(failures):
+                raise ProductIndexUnavailable(f"Building the product index failed, retrying in {_retry_delay(failures) - (time.monotonic() - failed_at):.0f} seconds: {error}")
+            ann = os.getenv('PRODUCT_INDEX_ANN', 'false').lower() == 'true'
+            try:
+                index = ProductIndex(ann=ann).fit(load_catalog(product_table_name))
+            except Exception as e:
+                _failures[product_table_name] = (time.monotonic(), failures + 1, e)
+                logger.warning("Building the product index of %s failed %s times, retrying in %.0f seconds: %s", product_table_name, failures + 1, _retry_delay(failures + 1), e)
+                raise
+            _failures.pop(product_table_name, None)
+            _indexes[product_table_name] = index
+    return index
@@ -0,0 +1,121 @@
+import re
+import zlib
+import logging
+import threading
+import numpy as np
+from libs.lru_cache import TTLLRUCache
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+def normalize_prompt(prompt):
+    """Lowercases, strips punctuation and collapses whitespace so trivially different prompts share a key. """
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', str(prompt).lower())).strip()
+
+
+def embed_prompt(prompt, dim=2048, ngram=3):
+    """Embeds a normalized prompt as an L2 normalized bag of hashed character n-grams.
+
+    Args:
+        prompt (str): the normalized prompt.
+        dim (int, optional): embedding size. Defaults to 2048.
+        ngram (int, optional): character n-gram size. Defaults to 3.
+
+    Returns:
+        np.ndarray: the embedding vector.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    padded = f" {prompt} "
+    for i in range(max(1, len(padded) - ngram + 1)):
+        vec[zlib.crc32(padded[i:i + ngram].encode('utf-8')) % dim] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class CachedResponse():
+    """A cached agent answer and the side effecting tool calls that produced it. """
+
+    def __init__(self, prompt, state, output, actions, embedding):
+        self.prompt = prompt
+        self.state = state
+        self.output = output
+        self.actions = actions
+        self.embedding = embedding
+
+
+class ResponseCache():
+    """Opt-in cache of agent answers keyed on the normalized prompt and the relevant tool state.
+
+    Lookups first try an exact match on the normalized prompt and then the most similar cached prompt for the same
+    tool state, using cosine similarity of local character n-gram embeddings. Answers with side effecting tool calls
+    are only served for the exact prompt, a similar prompt ("2 apples" vs "5 apples") would replay the wrong tool
+    input. Entries expire after `ttl` seconds and the least recently used entries are evicted beyond `max_size`.
+    """
+
+    def __init__(self, max_size=256, ttl=3600, similarity_threshold=0.92):
+        """
+        Args:
+            max_size (int, optional): maximum number of cached answers. Defaults to 256.
+            ttl (float, optional): seconds an answer stays valid. Defaults to 3600.
+            similarity_threshold (float, optional): minimum cosine similarity for a semantic hit, None disables semantic lookup. Defaults to 0.92.
+        """
+        self.similarity_threshold = similarity_threshold
+        self._cache = TTLLRUCache(max_size=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._semantic_hits = 0
+
+    def lookup(self, prompt, state=''):
+        """Finds a cached answer for the prompt.
+
+        Args:
+            prompt (str): the user message.
+            state (str, optional): key of the state the answer depends on (e.g. uploaded files and conversation). Defaults to ''.
+
+        Returns:
+            CachedResponse: the cached answer or None.
+        """
+        normalized = normalize_prompt(prompt)
+        entry = self._cache.get((normalized, state), count=False)
+        if entry is None and self.similarity_threshold is not None:
+            entry = self._most_similar(normalized, state)
+            if entry is not None:
+                with self._lock:
+                    self._semantic_hits += 1
+                # promote the matched entry so it is not evicted while it keeps serving hits
+                self._cache.get((entry.prompt, state), count=False)
+
+        self._cache.record_lookup(entry is not None)
+        if entry is not None:
+            logger.info("Response cache hit for prompt: %s", prompt)
+        return entry
+
+    def _most_similar(self, normalized, state):
+        candidates = [entry for (_, entry_state), entry in self._cache.items() if entry_state == state and not entry.actions]
+        if not candidates:
+            return None
+        scores = np.stack([entry.embedding for entry in candidates]) @ embed_prompt(normalized)
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] >= self.similarity_threshold else None
+
+    def store(self, prompt, state, output, actions=None):
+        """Caches an agent answer.
+
+        Args:
+            prompt (str): the user message.
+            state (str): key of the tool state the answer depends on.
+            output (str): the agent answer.
+            actions (list, optional): (tool_name, tool_input) pairs that must be executed again on every hit. Defaults to None.
+        """
+        normalized = normalize_prompt(prompt)
+        self._cache.put((normalized, state), CachedResponse(normalized, state, output, actions or [], embed_prompt(normalized)))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        """Returns hit/miss statistics. `hits` includes `semantic_hits`. """
+        stats = self._cache.stats()
+        stats['semantic_hits'] = self._semantic_hits
+        return stats
@@ -0,0 +1,272 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
+from libs.cart import Cart
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+class Session():
+    """The state of one user session: the agent and its memory, the cart and the uploaded files.
+
+    Uploads are saved in the session's own `upload_dir` so concurrent sessions never overwrite each other's files.
+    """
+
+    def __init__(self, session_id, upload_dir, llm_factory=None):
+        """
+        Args:
+            session_id (str): The session id.
+            upload_dir (str): The directory of the session's uploaded files.
+            llm_factory (callable, optional): Builds the session's `RetailLLM` from the session on first use. Defaults to None.
+        """
+        self.session_id = session_id
+        self.upload_dir = upload_dir
+        self.cart = Cart()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.active = 0
+        # the estimated memory as of the end of its last use, see `SessionManager.release`
+        self.size = 0
+        # hash of the name and contents of the file last saved from the upload component, see `app.save_upload`
+        self.upload_digest = None
+        # serializes the chat turns of a session, read only callbacks do not take it
+        self.lock = threading.RLock()
+        self._llm = None
+        self._llm_factory = llm_factory
+        self._llm_lock = threading.Lock()
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    @property
+    def llm(self):
+        """The session's agent, created on first use. """
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    self._llm = self._llm_factory(self)
+        return self._llm
+
+    @property
+    def has_llm(self):
+        """True once the session's agent was created. Read only callbacks check it so they never build an agent. """
+        return self._llm is not None
+
+    def path(self, name):
+        """Returns the location of an uploaded file in the session's upload directory. """
+        return os.path.join(self.upload_dir, name)
+
+    @property
+    def data_csv_path(self):
+        return self.path('data.csv')
+
+    @property
+    def data_arrow_path(self):
+        return self.path('data.arrow')
+
+    @property
+    def product_image_path(self):
+        return self.path('product_image.png')
+
+    def upload_paths(self):
+        return (self.data_csv_path, self.data_arrow_path, self.product_image_path)
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def reset(self):
+        """Clears the conversation and the cart, e.g. when the page is reloaded. """
+        if self._llm is not None:
+            self._llm.reset_chat_history()
+        self.cart.empty_cart()
+
+    def approx_bytes(self):
+        """Estimates the memory held by the session: chat messages and cart entries. """
+        size = 0
+        if self._llm is not None:
+            size += sum(len(str(msg.content)) for msg in self._llm.chat_history)
+            size += sum(len(str(msg.content)) for msg in self._llm.agent.memory.chat_memory.messages)
+        size += sum(len(str(item)) for item in self.cart.items())
+        return size
+
+
+# the session of the callback or tool call being executed
+current_session = ContextVar('current_session', default=None)
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_current_session():
+    """Returns the session of the current callback. Outside of a session (scripts, benchmarks) a process wide
+    default session using the historical `/tmp` upload locations is returned.
+    """
+    session = current_session.get()
+    if session is not None:
+        return session
+    global _default_session
+    if _default_session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = Session('default', upload_dir='/tmp')
+    return _default_session
+
+
+@contextmanager
+def session_scope(session):
+    """Makes `session` the current session for the duration of the block. """
+    token = current_session.set(session)
+    try:
+        yield session
+    finally:
+        current_session.reset(token)
+
+
+class SessionManager():
+    """Thread safe registry of user sessions.
+
+    Sessions are kept in least recently used order. Sessions idle for longer than `idle_timeout` are evicted, and the
+    least recently used sessions are evicted whenever there are more than `max_sessions` or their estimated memory
+    exceeds `max_bytes`. Sessions in use by a callback are never evicted. Evicted sessions lose their upload directory.
+    The memory of a session is estimated when it is released and the total is kept up to date incrementally, so
+    eviction never walks the messages of every session.
+    """
+
+    def __init__(self, llm_factory, root_dir='/tmp/sessions', max_sessions=500, idle_timeout=1800, max_bytes=None, on_remove=None):
+        """
+        Args:
+            llm_factory (callable): Builds the `RetailLLM` of a session from the session.
+            root_dir (str, optional): The parent directory of the session upload directories. Defaults to '/tmp/sessions'.
+            max_sessions (int, optional): The maximum number of sessions. Defaults to 500.
+            idle_timeout (float, optional): Seconds after which an unused session is evicted. Defaults to 1800.
+            max_bytes (int, optional): The maximum estimated memory of all sessions. Defaults to None (unbounded).
+            on_remove (callable, optional): Called with the id of every removed session, e.g. to drop its assets. Defaults to None.
+        """
+        self.llm_factory = llm_factory
+        self.root_dir = root_dir
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self.on_remove = on_remove
+        self._sessions = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'removed': 0, 'evicted_idle': 0, 'evicted_capacity': 0, 'evicted_memory': 0}
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """Returns an existing session without creating it, None if it does not exist. """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.touch()
+            return session
+
+    def get_or_create(self, session_id):
+        """Returns the session with this id, creating it (and evicting other sessions if needed). """
+        assert session_id, "A session id is required."
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                # the id is client supplied, the directory is named after its hash
+                dir_name = hashlib.sha1(str(session_id).encode('utf-8')).hexdigest()
+                session = Session(session_id, os.path.join(self.root_dir, dir_name), llm_factory=self.llm_factory)
+                self._sessions[session_id] = session
+                self._stats['created'] += 1
+                logger.info("Created session %s (%s sessions).", session_id, len(self._sessions))
+            self._sessions.move_to_end(session_id)
+            session.touch()
+            self._evict(keep=session_id)
+            return session
+
+    @contextmanager
+    def session(self, session_id, exclusive=True):
+        """Uses a session for the duration of the block: it becomes the current session and is protected from eviction.
+
+        Args:
+            session_id (str): The session id.
+            exclusive (bool, optional): Hold the session lock so chat turns of a session never interleave. Defaults to True.
+        """
+        session = self.hold(session_id)
+        try:
+            if exclusive:
+                with session.lock, session_scope(session):
+                    yield session
+            else:
+                with session_scope(session):
+                    yield session
+        finally:
+            self.release(session)
+
+    def hold(self, session_id):
+        """Protects a session from eviction until `release` is called, e.g. while a background chat turn is queued. """
+        session = self.get_or_create(session_id)
+        with self._lock:
+            session.active += 1
+        return session
+
+    def release(self, session):
+        # the turn that used the session is over, its messages and cart only change while it is held
+        size = session.approx_bytes() if self.max_bytes is not None else 0
+        with self._lock:
+            session.active -= 1
+            session.touch()
+            if self._sessions.get(session.session_id) is session:
+                self._total_bytes += size - session.size
+            session.size = size
+
+    def _evict(self, keep=None):
+        """Evicts idle sessions, then the least recently used sessions beyond the count and memory bounds. Call with the lock held. """
+        now = time.monotonic()
+        evictable = [sid for sid, session in self._sessions.items() if sid != keep and session.active == 0]
+
+        for sid in evictable:
+            if now - self._sessions[sid].last_used > self.idle_timeout:
+                self._remove(sid, 'evicted_idle')
+        evictable = [sid for sid in evictable if sid in self._sessions]
+
+        while len(self._sessions) > self.max_sessions and evictable:
+            self._remove(evictable.pop(0), 'evicted_capacity')
+
+        if self.max_bytes is not None:
+            while self._total_bytes > self.max_bytes and evictable:
+                self._remove(evictable.pop(0), 'evicted_memory')
+
+    def _remove(self, session_id, reason):
+        session = self._sessions.pop(session_id)
+        self._total_bytes -= session.size
+        self._stats[reason] += 1
+        # only directories created by the manager are removed
+        if os.path.dirname(os.path.abspath(session.upload_dir)) == os.path.abspath(self.root_dir):
+            shutil.rmtree(session.upload_dir, ignore_errors=True)
+        if self.on_remove is not None:
+            self.on_remove(session_id)
+        logger.info("Removed session %s (%s).", session_id, reason.replace('_', ' '))
+
+    def evict(self):
+        """Evicts idle and excess sessions, e.g. from a periodic task. """
+        with self._lock:
+            self._evict()
+
+    def remove(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id, 'removed')
+
+    def stats(self):
+        """Returns the number of sessions and the creation/eviction counters. """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sessions'] = len(self._sessions)
+            stats['bytes'] = self._total_bytes
+            stats['active'] = sum(1 for session in self._sessions.values() if session.active)
+        return stats
@@ -0,0 +1,162 @@
+import re
+import json
+import time
+import logging
+import threading
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+class TokenStream():
+    """Thread safe buffer of the tokens streamed for the current chat turn.
+
+    The agent writes tokens as they arrive and the web app polls `text()` to render the partial answer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = []
+        self.turn = 0
+        self.started_at = None
+        self.first_token_at = None
+        self.done = True
+
+    def start(self):
+        """Resets the buffer for a new turn. """
+        with self._lock:
+            self._tokens = []
+            self.turn += 1
+            self.started_at = time.perf_counter()
+            self.first_token_at = None
+            self.done = False
+
+    def put(self, token):
+        if not token:
+            return
+        with self._lock:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+                logger.info("Turn %s time to first token: %.3f seconds.", self.turn, self.ttft)
+            self._tokens.append(token)
+
+    def finish(self, final_text=None):
+        """Marks the turn as complete. The final text replaces the streamed tokens when given. """
+        with self._lock:
+            if final_text is not None:
+                self._tokens = [final_text]
+            self.done = True
+        logger.info("Turn %s streamed in %.3f seconds (time to first token: %s).", self.turn, time.perf_counter() - (self.started_at or time.perf_counter()), self.ttft)
+
+    @property
+    def ttft(self):
+        """Seconds between the start of the turn and the first streamed token, None if nothing was streamed yet. """
+        if self.first_token_at is None or self.started_at is None:
+            return None
+        return round(self.first_token_at - self.started_at, 3)
+
+    def text(self):
+        with self._lock:
+            return "".join(self._tokens)
+
+
+FINAL_ANSWER_PATTERN = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', '\\': '\\', '/': '/'}
+
+
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    """Forwards the agent's final answer to a `TokenStream` while the model is still generating it.
+
+    The structured chat agent answers with a JSON blob `{"action": "Final Answer", "action_input": "..."}`.
+    Intermediate tool selections are ignored; once the final answer action is detected the JSON string
+    `action_input` is decoded incrementally and pushed to the stream token by token.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._reset()
+
+    def _reset(self):
+        self.buffer = ""
+        self.pos = None
+        self.answer_done = False
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._reset()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._reset()
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.answer_done:
+            return
+        self.buffer += token
+        if self.pos is None:
+            match = FINAL_ANSWER_PATTERN.search(self.buffer)
+            if match is None:
+                return
+            self.pos = match.end()
+        self.stream.put(self._decode())
+
+    def _decode(self):
+        """Decodes as much of the JSON string as has arrived, stopping before incomplete escape sequences. """
+        out = []
+        buffer = self.buffer
+        while self.pos < len(buffer):
+            ch = buffer[self.pos]
+            if ch == '"':
+                self.answer_done = True
+                break
+            if ch != '\\':
+                out.append(ch)
+                self.pos += 1
+                continue
+            if self.pos + 1 >= len(buffer):
+                break
+            code = buffer[self.pos + 1]
+            if code == 'u':
+                if self.pos + 6 > len(buffer):
+                    break
+                out.append(json.loads(f'"{buffer[self.pos:self.pos + 6]}"'))
+                self.pos += 6
+            else:
+                out.append(JSON_ESCAPES.get(code, code))
+                self.pos += 2
+        return "".join(out)
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Forwards every generated token to a `TokenStream`, for plain text answers outside of the agent. """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.stream.put(token)
+
+
+def iter_sse_tokens(response, stream=None):
+    """Yields the content tokens of a server-sent events chat completion response.
+
+    Args:
+        response (requests.Response): a streaming response of a serving endpoint called with `"stream": true`.
+        stream (TokenStream, optional): also forwards every token to this stream. Defaults to None.
+
+    Yields:
+        str: the content of every chunk delta.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        chunk = json.loads(data)
+        choices = chunk.get('choices') or [{}]
+        token = (choices[0].get('delta') or {}).get('content')
+        if token:
+            if stream is not None:
+                stream.put(token)
+            yield token
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import Response
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+# upper bounds of the latency histogram buckets in seconds, from a cache lookup to a slow agent turn
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = 'retailai'
+
+# the trace of the chat turn being executed
+current_trace = ContextVar('current_trace', default=None)
+
+
+class Span():
+    """A timed stage of a chat turn, e.g. an LLM call, a SQL query or a Prophet fit. """
+
+    def __init__(self, stage, **attributes):
+        self.stage = stage
+        self.outcome = 'ok'
+        self.payload_bytes = attributes.pop('payload_bytes', None)
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, payload_bytes=None, outcome=None, **attributes):
+        """Records the payload size, outcome or other attributes known once the stage has run. """
+        if payload_bytes is not None:
+            self.payload_bytes = payload_bytes
+        if outcome is not None:
+            self.outcome = outcome
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.outcome = 'error'
+            self.attributes['error'] = type(error).__name__
+        return self
+
+    def to_dict(self, trace_start=None):
+        span = {'stage': self.stage, 'seconds': round(self.duration or 0.0, 4), 'outcome': self.outcome}
+        if trace_start is not None:
+            span['offset'] = round(self.started_at - trace_start, 4)
+        if self.payload_bytes is not None:
+            span['payload_bytes'] = self.payload_bytes
+        span.update(self.attributes)
+        return span
+
+
+class Trace():
+    """The spans of one chat turn. """
+
+    def __init__(self, **attributes):
+        self.attributes = attributes
+        self.root = Span('chat.turn')
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.started_at)
+        stage_seconds = {}
+        for span in spans:
+            stage_seconds[span.stage] = round(stage_seconds.get(span.stage, 0.0) + (span.duration or 0.0), 4)
+        trace = {'event': 'turn_trace', **self.attributes, **self.root.to_dict()}
+        trace.update(stage_seconds=stage_seconds, spans=[span.to_dict(self.root.started_at) for span in spans])
+        return trace
+
+
+class Histogram():
+    """Cumulative latency histogram with fixed buckets, as exposed by Prometheus. """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns (upper bound, observations at or below it) pairs, the last bound is +Inf. """
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """Estimates a quantile from the buckets by linear interpolation. """
+        if not self.count:
+            return None
+        rank, lower, total = q * self.count, 0.0, 0
+        for bound, count in zip(self.buckets, self.counts):
+            if total + count >= rank:
+                return lower + (bound - lower) * (rank - total) / max(count, 1)
+            total, lower = total + count, bound
+        # beyond the last bucket
+        return self.buckets[-1]
+
+
+class Telemetry():
+    """Aggregates the spans of all stages into latency histograms and payload counters per stage and outcome, and
+    emits the trace of every chat turn as a structured log line.
+    """
+
+    def __init__(self, enabled=True, trace_log=True, buckets=DEFAULT_BUCKETS, max_traces=100):
+        """
+        Args:
+            enabled (bool, optional): Record spans. Defaults to True.
+            trace_log (bool, optional): Log the trace of every chat turn as one JSON line. Defaults to True.
+            buckets (tuple, optional): Upper bounds of the latency buckets in seconds. Defaults to `DEFAULT_BUCKETS`.
+            max_traces (int, optional): The number of recent traces kept for `recent_traces`. Defaults to 100.
+        """
+        self.enabled = enabled
+        self.trace_log = trace_log
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._payload_bytes = {}
+        self._traces = deque(maxlen=max_traces)
+        self._collectors = {}
+
+    def record(self, span):
+        """Adds a finished span to the histograms and to the trace of the current turn. """
+        if not self.enabled:
+            return
+        key = (span.stage, span.outcome)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(span.duration)
+            if span.payload_bytes:
+                self._payload_bytes[span.stage] = self._payload_bytes.get(span.stage, 0) + span.payload_bytes
+        trace = current_trace.get()
+        if trace is not None and span is not trace.root:
+            trace.add(span)
+
+    def finish_trace(self, trace):
+        """Records the turn itself and logs its trace. """
+        self.record(trace.root)
+        if not self.enabled:
+            return
+        trace_dict = trace.to_dict()
+        with self._lock:
+            self._traces.append(trace_dict)
+        if self.trace_log:
+            logger.info("Turn trace: %s", json.dumps(trace_dict, default=str))
+
+    def add_collector(self, name, collect):
+        """Adds gauges read at scrape time, e.g. the number of live sessions.
+
+        Args:
+            name (str): The metric name prefix of the gauges.
+            collect (callable): Returns a dict of numeric values, other values are skipped.
+        """
+        self._collectors[name] = collect
+
+    def recent_traces(self):
+        """Returns the traces of the recent turns, oldest first. """
+        with self._lock:
+            return list(self._traces)
+
+    def stats(self):
+        """Returns the count, mean and estimated p50/p95/p99 seconds of every stage and outcome. """
+        with self._lock:
+            items = sorted(self._histograms.items())
+            stats = {}
+            for (stage, outcome), histogram in items:
+                stats[f"{stage}:{outcome}"] = {
+                    'count': histogram.count,
+                    'mean_seconds': round(histogram.sum / histogram.count, 4),
+                    'p50_seconds': round(histogram.quantile(0.5), 4),
+                    'p95_seconds': round(histogram.quantile(0.95), 4),
+                    'p99_seconds': round(histogram.quantile(0.99), 4),
+                }
+        return stats
+
+    def render_prometheus(self):
+        """Renders the histograms, payload counters and collected gauges in the Prometheus text format. """
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} Duration of the instrumented stages of the chat turns.", f"# TYPE {name} histogram"]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            payload_bytes = sorted(self._payload_bytes.items())
+            for (stage, outcome), histogram in histograms:
+                labels = f'stage="{_escape(stage)}",outcome="{_escape(outcome)}"'
+                for bound, total in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        name = f"{METRIC_PREFIX}_stage_payload_bytes_total"
+        lines += [f"# HELP {name} Payload bytes sent or produced by the instrumented stages.", f"# TYPE {name} counter"]
+        lines += [f'{name}{{stage="{_escape(stage)}"}} {total}' for stage, total in payload_bytes]
+
+        for collector, collect in sorted(self._collectors.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", collector, e)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                gauge = f"{METRIC_PREFIX}_{collector}_{key}"
+                lines += [f"# TYPE {gauge} gauge", f"{gauge} {value}"]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Returns the shared telemetry configured from the environment. """
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry(
+                    enabled=os.getenv('TELEMETRY_ENABLED', 'true').lower() == 'true',
+                    trace_log=os.getenv('TELEMETRY_TRACE_LOG', 'true').lower() == 'true',
+                )
+    return _telemetry
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Times a stage, e.g. `with span('sql.query', payload_bytes=len(query)) as s: ...`. Exceptions are recorded as
+    the 'error' outcome and re-raised. Spans inside a `trace` block are part of the trace of that turn.
+
+    Args:
+        stage (str): The stage name, the histogram label.
+        **attributes: `payload_bytes` and other attributes logged with the trace.
+
+    Yields:
+        Span: the span, use `Span.set` to record the payload size or outcome of the stage.
+    """
+    current = Span(stage, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(error=e)
+        get_telemetry().record(current)
+        raise
+    current.finish()
+    get_telemetry().record(current)
+
+
+@contextmanager
+def trace(**attributes):
+    """Collects the spans of a chat turn and logs them as one structured line at the end of the turn.
+
+    Args:
+        **attributes: Attributes of the turn, e.g. the session id.
+
+    Yields:
+        Trace: the trace, set `trace.root.set(...)` to add attributes known during the turn.
+    """
+    current = Trace(**attributes)
+    token = current_trace.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.root.finish(error=e)
+        raise
+    else:
+        current.root.finish()
+    finally:
+        current_trace.reset(token)
+        get_telemetry().finish_trace(current)
+
+
+def register_metrics_route(server, path='/metrics'):
+    """Serves the metrics in the Prometheus text format from the Flask server of the Dash app. """
+
+    @server.route(path)
+    def serve_metrics():
+        return Response(get_telemetry().render_prometheus(), mimetype='text/plain; version=0.0.4')
@@ -1,11 +1,13 @@
 from dotenv import load_dotenv
+import asyncio
 import logging
-import os 
+import json
+import os
 
 from langchain.tools import BaseTool
-import libs.cart as cart
-import libs.db_sql as dbsql
-from libs.foundation_api import call_foundation_model
+from libs.session_state import get_current_session
+from libs.telemetry import span
+from libs.foundation_api import call_foundation_model, acall_foundation_model
 
 
 load_dotenv()
@@ -15,79 +17,258 @@ logger = logging.getLogger()
 
 class Text2ShopTool(BaseTool):
     name = "Text to shop Tool"
-    description = "use this tool to help customers shop for items. They will likely provide items they want to buy or purchase or want. "
+    description = "use this tool to help customers shop for items. They will likely provide items they want to buy or purchase or want. When the customer asks for several items (for example a recipe or a shopping list) pass them all at once as `items`, a list of objects with `product_name` and `quantity`, instead of calling the tool once per item. "
+    product_table_name: str = "rac_demo_catalog.rac_demo_db.product_catalog"
+    use_local_index: bool = True
+    # adds items to the cart, so cached answers must run this tool again
+    has_side_effects: bool = True
 
     # def _to_args_and_kwargs(self, tool_input: Union[str, Dict]) -> Tuple[Tuple, Dict]:
     #     return (), {}
 
-    def _run(self, product_name, quantity):
-        """Searches available products based on user input and returns the available product that can be added to the cart. 
+    def _run(self, product_name=None, quantity=None, items=None):
+        """Searches available products based on user input and returns the available products that were added to the cart.
 
         Args:
-            product_name (str): The product the user requested. 
-            qty (str): The number of units that the user is asking for. 
+            product_name (str, optional): The product the user requested.
+            quantity (str, optional): The number of units that the user is asking for.
+            items (list, optional): Several (product_name, quantity) pairs, either as lists or dictionaries, resolved in a single batch.
 
         Returns:
-            str: The Name as listed in the catalog
+            str: The products as listed in the catalog and the recommended items.
         """
-        logger.info("Searching products for %s", product_name)
+        try:
+            requested = parse_requested_items(product_name=product_name, quantity=quantity, items=items)
+        except ValueError as e:
+            logger.warning("Invalid items %r: %s", items, e)
+            return f"{e} Pass `items` as a list of objects with `product_name` and `quantity`."
+        logger.info("Searching products for %s", requested)
+        if not requested:
+            return "No products were requested. Please ask the customer which items they would like to buy."
+
+        # get the items that the user requested and add them to the cart in one operation.
+        matches = self._search_products_batch([prd_name for prd_name, _ in requested], k=1)
+        out = self._add_to_cart(requested, matches)
+
+        rec_item = parse_recommendation(call_foundation_model(**recommendation_prompt(requested)))
+        logger.info("Raw Recommendation: %s", rec_item)
+
+        recs = [{'name': r['name'] } for r in self._search_products(rec_item, k=3)]
+
+        return format_tool_response(out, recs, unmatched_items(requested, matches))
+
+    async def _arun(self, product_name=None, quantity=None, items=None):
+        """Async version of `_run`. The product lookup and the upsell call run concurrently.
+
+        Args:
+            product_name (str, optional): The product the user requested.
+            quantity (str, optional): The number of units that the user is asking for.
+            items (list, optional): Several (product_name, quantity) pairs, either as lists or dictionaries, resolved in a single batch.
 
-        product_table_name = "rac_demo_catalog.rac_demo_db.product_catalog"
+        Returns:
+            str: The products as listed in the catalog and the recommended items.
+        """
         try:
-            qty = quantity.get('title') 
-        except: 
-            qty = quantity
-
-        try: 
-            prd_name = product_name.get('title') 
-        except:
-            prd_name = product_name
-
-        qty = 1 if qty is None else qty
-
-        # get the item that the user requested and add it to the cart. 
-        qry = f"""
-            select name, id, description, company_name
-            from {product_table_name}
-            order by ai_similarity(name, '{prd_name}') desc
-            limit 1
-            """
-        
-        vector_qry = f"""
-            select name, id, description, company_name
-            from {product_table_name}
-            order by ai_similarity(name, '{prd_name}') desc
-            limit 1
-            """
-        
-        results = dbsql.execute_query(query=qry)
-        out = [{'name': r.name, 'id': r.id, 'description': r.description, 'company_name': r.company_name, 'quantity': qty } for r in results]
-        cart.add_item(out[0])
-
-        rec_item = call_foundation_model(
-            system_msg="You are going to recieve user input information from another conversation related to items they are purchasing. Please recommend a single additional item they may be interested in. You should respond with a single word and do not use punctuation. Provide only a product name and nothing else.",
-            user_msg=f"The user is requesting to purchase the following prd_name. Please recommend a product we can upsell and only produce a 1 to 2 words. No punctuation."
-        ).get('choices')[0].get('message').get('content').split(" ")[0].replace("\n", "")
+            requested = parse_requested_items(product_name=product_name, quantity=quantity, items=items)
+        except ValueError as e:
+            logger.warning("Invalid items %r: %s", items, e)
+            return f"{e} Pass `items` as a list of objects with `product_name` and `quantity`."
+        logger.info("Searching products for %s", requested)
+        if not requested:
+            return "No products were requested. Please ask the customer which items they would like to buy."
+
+        matches, rec_response = await asyncio.gather(
+            self._asearch_products_batch([prd_name for prd_name, _ in requested], k=1),
+            acall_foundation_model(**recommendation_prompt(requested)),
+        )
+        out = self._add_to_cart(requested, matches)
+
+        rec_item = parse_recommendation(rec_response)
         logger.info("Raw Recommendation: %s", rec_item)
-        
 
-        recommendation_query = f"""
-            select name
-            from {product_table_name}
-            order by ai_similarity(name, '{rec_item}') desc
-            limit 3
+        recs = [{'name': r['name'] } for r in (await self._asearch_products_batch([rec_item], k=3))[0]]
+
+        return format_tool_response(out, recs, unmatched_items(requested, matches))
+
+    def _add_to_cart(self, requested, matches):
+        """Adds the best match of every requested item to the cart in one operation.
+
+        Args:
+            requested (list): (product_name, quantity) pairs.
+            matches (list): one list of matching product records per requested item.
+
+        Returns:
+            list: the cart entries that were added.
         """
-        product_recommendations = dbsql.execute_query(query=recommendation_query)
-        recs = [{'name': r.name } for r in product_recommendations]
+        out = [dict(match[0], quantity=qty) for (_, qty), match in zip(requested, matches) if match]
+        get_current_session().cart.add_items(out)
+        return out
 
+    def _search_products(self, search_term, k):
+        """Finds the k catalog products most similar to the search term.
 
+        Args:
+            search_term (str): The product name to match.
+            k (int): The number of products to return.
 
-        tool_response = f"""
-        We have automatically added the following to the customer's cart: {out}. \n
-        Please recommend the following items: {recs}
+        Returns:
+            list: product records as dictionaries ordered by similarity.
+        """
+        return self._search_products_batch([search_term], k=k)[0]
+
+    def _search_products_batch(self, search_terms, k):
+        """Finds the k catalog products most similar to each search term.
+        Uses the local product index and falls back to a single set based ai_similarity query on the warehouse if the index is unavailable.
+
+        Args:
+            search_terms (list): The product names to match.
+            k (int): The number of products to return per search term.
+
+        Returns:
+            list: one list of product records per search term, ordered by similarity.
         """
+        # the index (scikit-learn) and the warehouse connector are imported on first search
+        import libs.db_sql as dbsql
+        from libs.product_index import get_product_index
 
-        return tool_response
+        if self.use_local_index:
+            try:
+                index = get_product_index(self.product_table_name)
+                with span('product.search', terms=len(search_terms)):
+                    return [[record for record, _ in matches] for matches in index.search_many(search_terms, k=k)]
+            except Exception as e:
+                logger.warning("Local product index unavailable, falling back to warehouse search: %s", e)
 
+        results = dbsql.execute_query(query=self._batch_search_query(search_terms, k))
+        return self._group_matches(results, len(search_terms))
 
+    async def _asearch_products_batch(self, search_terms, k):
+        """Async version of `_search_products_batch`. The CPU bound index search runs on the default executor. """
+        import libs.db_sql as dbsql
+        from libs.product_index import get_product_index
 
+        if self.use_local_index:
+            try:
+                index = await asyncio.to_thread(get_product_index, self.product_table_name)
+                with span('product.search', terms=len(search_terms)):
+                    matches = await asyncio.to_thread(index.search_many, search_terms, k)
+                return [[record for record, _ in match] for match in matches]
+            except Exception as e:
+                logger.warning("Local product index unavailable, falling back to warehouse search: %s", e)
+
+        results = await dbsql.aexecute_query(query=self._batch_search_query(search_terms, k))
+        return self._group_matches(results, len(search_terms))
+
+    def _batch_search_query(self, search_terms, k):
+        # rank every catalog product against every search term in one query and keep the top k per term
+        values = ", ".join(f"({i}, {sql_string(term)})" for i, term in enumerate(search_terms))
+        return f"""
+            with requested as (
+                select * from values {values} as requested(request_id, search_term)
+            )
+            select r.request_id, p.name, p.id, p.description, p.company_name
+            from requested r
+            cross join {self.product_table_name} p
+            qualify row_number() over (partition by r.request_id order by ai_similarity(p.name, r.search_term) desc) <= {int(k)}
+            order by r.request_id
+            """
+
+    def _group_matches(self, results, n_terms):
+        out = [[] for _ in range(n_terms)]
+        for r in results:
+            out[r.request_id].append({'name': r.name, 'id': r.id, 'description': r.description, 'company_name': r.company_name})
+        return out
+
+
+def _unwrap(value):
+    # the agent sometimes sends arguments as {'title': value}
+    try:
+        return value.get('title')
+    except AttributeError:
+        return value
+
+
+def parse_items_argument(items):
+    """Returns the `items` argument as a list. Agents often send it as a JSON string, or send a single item.
+
+    Raises:
+        ValueError: if the argument is not a list of items.
+    """
+    if items is None:
+        return []
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except json.JSONDecodeError:
+            raise ValueError(f"The `items` argument {items!r} is not valid JSON.")
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, (list, tuple)):
+        raise ValueError(f"The `items` argument must be a list, got {type(items).__name__}.")
+    return list(items)
+
+
+def parse_requested_items(product_name=None, quantity=None, items=None):
+    """Normalizes the tool arguments into a list of (product_name, quantity) pairs.
+
+    Args:
+        product_name (str, optional): A single requested product.
+        quantity (str, optional): The quantity of the single requested product.
+        items (list, optional): Pairs as lists/tuples or dictionaries with `product_name` (or `name`) and `quantity` keys, or the JSON of such a list.
+
+    Returns:
+        list: (product_name, quantity) tuples. Quantities default to 1.
+
+    Raises:
+        ValueError: if `items` is not a list of items.
+    """
+    requested = []
+    for item in parse_items_argument(items):
+        if isinstance(item, dict):
+            prd_name, qty = item.get('product_name', item.get('name')), item.get('quantity')
+        elif isinstance(item, (list, tuple)):
+            prd_name, qty = (list(item) + [None])[:2]
+        else:
+            prd_name, qty = item, None
+        requested.append((_unwrap(prd_name), _unwrap(qty)))
+
+    if product_name is not None:
+        requested.append((_unwrap(product_name), _unwrap(quantity)))
+
+    return [(str(prd_name), 1 if qty is None else qty) for prd_name, qty in requested if prd_name]
+
+
+def sql_string(value):
+    """Quotes a value as a Spark SQL string literal. """
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def recommendation_prompt(requested):
+    """Builds the upsell prompt for the requested items. """
+    requested_names = ", ".join(prd_name for prd_name, _ in requested)
+    return {
+        'system_msg': "You are going to recieve user input information from another conversation related to items they are purchasing. Please recommend a single additional item they may be interested in. You should respond with a single word and do not use punctuation. Provide only a product name and nothing else.",
+        'user_msg': f"The user is requesting to purchase the following: {requested_names}. Please recommend a product we can upsell and only produce a 1 to 2 words. No punctuation.",
+    }
+
+
+def parse_recommendation(response):
+    """Extracts the single recommended product name from the foundation model response. """
+    return response.get('choices')[0].get('message').get('content').split(" ")[0].replace("\n", "")
+
+
+def unmatched_items(requested, matches):
+    """Returns the names of the requested items without a matching product. """
+    return [prd_name for (prd_name, _), match in zip(requested, matches) if not match]
+
+
+def format_tool_response(out, recs, unmatched=None):
+    tool_response = f"""
+        We have automatically added the following to the customer's cart: {out}. \n
+        Please recommend the following items: {recs}
+        """
+    if unmatched:
+        tool_response += f"""The following items were not found in the catalog and were not added, tell the customer: {unmatched}
+        """
+    return tool_response
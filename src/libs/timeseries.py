@@ -1,75 +1,385 @@
+import os
+import json
 import logging
-from typing import Union, Dict, Tuple
-from prophet import Prophet
+import asyncio
+from typing import Union, Dict, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
 import libs.file_handler as fh
+from libs.session_state import get_current_session
+from libs.asset_registry import get_asset_registry, PLOTLY_MIMETYPE
+from libs.forecast_cache import get_forecast_cache
+from libs.downsample import downsample_frame
+from libs.vectorized_forecast import forecast_frame, METHODS
+from libs.telemetry import span
+from libs.warmup import wait_for_warmup
 from langchain.tools import BaseTool
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 from math import sqrt
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
 
-
 class ForecastTool(BaseTool):
     name = "Forecast Generation Tool"
-    description = "use this tool to generate forecasts. "
+    description = "use this tool to generate forecasts. If the uploaded data contains many series (for example one per SKU or store) pass the name of the column identifying each series as `series_column`. The model can be chosen with `engine`: prophet, holt_winters, linear_trend or seasonal_naive. The non prophet engines are much faster for large uploads or quick what if questions. Set `tune` to true to backtest and tune the prophet model before forecasting. "
+    max_workers: Optional[int] = None
+    chunksize: Optional[int] = None
+    periods: int = 30
+    interval_width: float = 0.85
+    use_cache: bool = True
+    engine: str = os.getenv('FORECAST_ENGINE', 'prophet')
+    tune: bool = os.getenv('FORECAST_TUNE', 'false').lower() == 'true'
+    backtest_folds: int = int(os.getenv('FORECAST_BACKTEST_FOLDS', 3))
+    render_mode: str = os.getenv('FORECAST_RENDER_MODE', 'browser')
+    max_points: int = int(os.getenv('FORECAST_MAX_POINTS', 2000))
 
     # def _to_args_and_kwargs(self, tool_input: Union[str, Dict]) -> Tuple[Tuple, Dict]:
     #     return (), {}
 
-    def _run(self, frequency):
-        """Generates a forecast and image to display 
+    def _run(self, frequency, series_column=None, engine=None, tune=None):
+        """Generates a forecast and image to display
 
         Args:
-            frequency (str): The frequency of which to produce forecasts. It should be daily, weekly, or monthly.  
+            frequency (str): The frequency of which to produce forecasts. It should be daily, weekly, or monthly.
+            series_column (str, optional): The column identifying each series when the data contains many series. Defaults to None.
+            engine (str, optional): The forecasting engine, see `FORECAST_ENGINES`. Defaults to the tool's `engine`.
+            tune (bool, optional): Backtest and tune the Prophet parameters before forecasting. Defaults to the tool's `tune`.
 
         Returns:
-            str: returns a text description of the forecast. The image of the forecast is saved to the assets folder for display. 
+            str: returns a text description of the forecast. The chart of the forecast is published to the asset registry for display.
         """
-        freq = 'D' if frequency.lower() == 'daily' else 'D'
-        logger.info("Generating Forecast - %s")
-        # file was uploaded and saved to this location
-        pdf = pd.read_csv('/tmp/data.csv', parse_dates=['ds'])
+        freq = FREQUENCIES.get(str(frequency).lower().strip(), 'D')
+        engine_name = (engine or self.engine).lower()
+        if engine_name not in FORECAST_ENGINES:
+            return f"Unknown forecasting engine {engine_name}. Use one of {list(FORECAST_ENGINES)}."
+        forecast_engine = FORECAST_ENGINES[engine_name]
+        tune = (self.tune if tune is None else str(tune).lower() == 'true') and engine_name == 'prophet'
+        logger.info("Generating Forecast - %s with the %s engine", frequency, engine_name)
+        # file was uploaded and saved to this location, the columnar copy is preferred
+        session = get_current_session()
+        data_path = fh.forecast_data_path(session.data_csv_path, session.data_arrow_path)
+
+        # repeat requests on the same upload with the same parameters are answered from the cache
+        cache = get_forecast_cache() if self.use_cache else None
+        if cache is not None:
+            cache_key = cache.key(data_path, periods=self.periods, freq=freq, interval_width=self.interval_width, series_column=series_column, engine=engine_name, tune=tune)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self._save_chart(cached['chart'])
+                return cached['response']
+
+        pdf = fh.load_forecast_data(columns=['ds', 'y'] + ([series_column] if series_column is not None else []), csv_path=session.data_csv_path, arrow_path=session.data_arrow_path)
+        if series_column is not None and series_column not in pdf.columns:
+            return f"Column {series_column} was not found in the uploaded data. The uploaded columns are {fh.forecast_data_columns(csv_path=session.data_csv_path, arrow_path=session.data_arrow_path)}."
 
         logger.info("PDF Types: %s", pdf.dtypes)
+        # e.g. weekly data of mondays is W-MON, the engines reindex the history on the anchored frequency
+        freq = resolve_freq(freq, pdf['ds'])
 
-        model = Prophet(interval_width=0.85)
-        model.fit(pdf)
+        # the best backtested parameters are used for the forecast, many series are tuned on their total
+        params, backtest = {}, None
+        interval_width = self.interval_width
+        if tune:
+            # prophet is imported on first use, see libs.warmup
+            from libs.backtesting import tune as tune_forecast
+            tune_pdf = pdf if series_column is None else pdf.groupby('ds', as_index=False)['y'].sum()
+            try:
+                with span('forecast.tune', rows=len(tune_pdf), folds=self.backtest_folds):
+                    backtest = tune_forecast(tune_pdf, horizon=self.periods, n_folds=self.backtest_folds, max_workers=self.max_workers, interval_width=interval_width)
+            except ValueError as e:
+                # e.g. a short history, the default parameters are used
+                logger.warning("Backtest skipped: %s", e)
+            else:
+                params = dict(backtest['params'])
 
-        # create a forecast and keep historical values with a join
-        future_pd = model.make_future_dataframe(periods=30, freq=freq, include_history=True)
+        if series_column is not None:
+            with span('forecast.fit', engine=engine_name, rows=len(pdf), series=int(pdf[series_column].nunique())):
+                output_df, metrics_df, errors, models = forecast_engine.forecast_many(pdf, series_column, periods=self.periods, freq=freq, interval_width=interval_width, params=params, max_workers=self.max_workers, chunksize=self.chunksize)
+            if output_df.empty:
+                return f"The forecast could not be generated for any series. Errors: {errors}"
+            # chart the total across all series
+            chart_df = output_df.groupby('ds', as_index=False)[['y', 'yhat', 'yhat_upper', 'yhat_lower']].sum(min_count=1)
+            chart_df.rename(columns={'ds': 'Date'}, inplace=True)
+            response = summarize_series_forecasts(metrics_df, errors)
+            metrics = metrics_df.to_dict(orient='records')
+            models = {str(series_id): params for series_id, params in models.items()}
+            # only cache complete results so failed series are retried
+            cacheable = not errors
+        else:
+            with span('forecast.fit', engine=engine_name, rows=len(pdf), series=1):
+                output_df, models = forecast_engine.forecast(pdf, periods=self.periods, freq=freq, interval_width=interval_width, params=params)
 
-        # Generate forecast
-        forecast_pd = model.predict(future_pd)
-        output_df = pd.merge(forecast_pd, pdf, on='ds', how='left')
+            # Resetting index to keep 'ds' as a column
+            chart_df = output_df.rename(columns={'ds': 'Date'})
+            response = evaluate_forecasts(chart_df)
+            metrics = compute_forecast_metrics(output_df)
+            cacheable = True
 
-        # Resetting index to keep 'ds' as a column
-        output_df.rename(columns={'ds': 'Date'}, inplace=True)
+        if backtest is not None:
+            response += summarize_backtest(backtest)
 
-        # generate a forecast image
-        logger.info("Generating image.")
-        forecast_image = px.line(output_df, x='Date', y=['y', 'yhat','yhat_upper', 'yhat_lower'])
-        img_path = f"src/assets/display_{fh.get_current_timestamp()}.png"
-        pio.write_image(forecast_image, img_path)
+        self._save_chart(chart_df)
+        if cache is not None and cacheable:
+            cache.put(cache_key, model=models, forecast=output_df, chart=chart_df, metrics=metrics, response=response)
 
-        return evaluate_forecasts(output_df)
+        return response
 
+    def _save_chart(self, output_df):
+        """Renders the forecast chart. Long histories are downsampled so the chart holds at most a few thousand points.
 
+        In browser mode the figure JSON is published for the app to render in a `dcc.Graph`, in png mode the figure
+        is exported with kaleido and published as an image.
+        """
+        import plotly.express as px
+        import plotly.io as pio
 
-    def _arun(self):
-        return NotImplementedError
-    
-    
-def evaluate_forecasts(pdf):
+        logger.info("Generating chart.")
+        y_columns = ['y', 'yhat', 'yhat_upper', 'yhat_lower']
+        chart_df = downsample_frame(output_df.sort_values('Date'), 'Date', y_columns, max_points=self.max_points)
+        session_id = get_current_session().session_id
+        with span('chart.export', render_mode=self.render_mode, points=len(chart_df)) as s:
+            forecast_image = px.line(chart_df, x='Date', y=y_columns)
+            data = pio.to_image(forecast_image, format='png') if self.render_mode == 'png' else forecast_image.to_json()
+            s.set(payload_bytes=len(data))
+        get_asset_registry().publish(session_id, data, 'image/png' if self.render_mode == 'png' else PLOTLY_MIMETYPE)
+
+    async def _arun(self, frequency, series_column=None, engine=None, tune=None):
+        """Async version of `_run`. The model fit and chart export are CPU bound and run on the default executor.
+
+        Args:
+            frequency (str): The frequency of which to produce forecasts. It should be daily, weekly, or monthly.
+            series_column (str, optional): The column identifying each series when the data contains many series. Defaults to None.
+            engine (str, optional): The forecasting engine, see `FORECAST_ENGINES`. Defaults to the tool's `engine`.
+            tune (bool, optional): Backtest and tune the Prophet parameters before forecasting. Defaults to the tool's `tune`.
+
+        Returns:
+            str: returns a text description of the forecast.
+        """
+        return await asyncio.to_thread(self._run, frequency, series_column, engine, tune)
+
+
+class ForecastEngine():
+    """Interface of the forecasting engines used by `ForecastTool`.
+
+    Both methods return forecasts in the Prophet output format: `ds`, `yhat`, `yhat_lower`, `yhat_upper` and the
+    actuals `y` for the history and the future periods, plus JSON serializable model parameters.
+    """
+
+    def forecast(self, pdf, periods=30, freq='D', interval_width=0.85, params=None):
+        """Forecasts a single series. `params` are engine specific model parameters.
+
+        Returns:
+            tuple: the forecast frame and the fitted model parameters.
+        """
+        raise NotImplementedError
+
+    def forecast_many(self, pdf, series_column, periods=30, freq='D', interval_width=0.85, params=None, **kwargs):
+        """Forecasts every series of a long format frame.
+
+        Returns:
+            tuple: the combined forecast frame, a frame of per series metrics, a dictionary of errors by series id and the model parameters by series id.
+        """
+        raise NotImplementedError
+
+
+class ProphetEngine(ForecastEngine):
+    """Fits one Prophet model per series, many series are fit in parallel across a process pool. """
+
+    def forecast(self, pdf, periods=30, freq='D', interval_width=0.85, params=None):
+        from prophet.serialize import model_to_json
+        output_df, model = fit_forecast(pdf, periods=periods, freq=freq, interval_width=interval_width, return_model=True, params=params)
+        return output_df, json.loads(model_to_json(model))
+
+    def forecast_many(self, pdf, series_column, periods=30, freq='D', interval_width=0.85, params=None, max_workers=None, chunksize=None):
+        output_df, metrics_df, errors, models = forecast_many(pdf, series_column, periods=periods, freq=freq, interval_width=interval_width, max_workers=max_workers, chunksize=chunksize, return_models=True, params=params)
+        return output_df, metrics_df, errors, {str(series_id): params for series_id, params in models.items()}
+
+
+# id of the series of an upload without a series column
+SINGLE_SERIES_ID = 'uploaded'
+
+
+class VectorizedEngine(ForecastEngine):
+    """Fits every series at once with NumPy array operations, see `libs.vectorized_forecast`. """
+
+    def __init__(self, method='holt_winters', season_length=None):
+        """
+        Args:
+            method (str, optional): seasonal_naive, linear_trend or holt_winters. Defaults to 'holt_winters'.
+            season_length (int, optional): The number of periods in a season. Defaults to the season of the frequency.
+        """
+        assert method in METHODS, f"Unknown forecasting method {method}. Use one of {list(METHODS)}."
+        self.method = method
+        self.season_length = season_length
+
+    def forecast(self, pdf, periods=30, freq='D', interval_width=0.85, params=None):
+        series_pdf = pdf[['ds', 'y']].assign(series=SINGLE_SERIES_ID)
+        output_df, errors, models = forecast_frame(series_pdf, 'series', periods=periods, freq=freq, interval_width=interval_width, method=self.method, season_length=self.season_length)
+        if SINGLE_SERIES_ID in errors:
+            raise ValueError(f"The {self.method} forecast of the {SINGLE_SERIES_ID} series failed: {errors[SINGLE_SERIES_ID]}")
+        return output_df.drop(columns='series'), models[SINGLE_SERIES_ID]
+
+    def forecast_many(self, pdf, series_column, periods=30, freq='D', interval_width=0.85, params=None, **kwargs):
+        if series_column not in pdf.columns:
+            raise ValueError(f"Column {series_column} was not found in the uploaded data.")
+        output_df, errors, models = forecast_frame(pdf, series_column, periods=periods, freq=freq, interval_width=interval_width, method=self.method, season_length=self.season_length)
+        for series_id, error in errors.items():
+            logger.warning("Forecast failed for series %s: %s", series_id, error)
+        metrics_df = compute_series_metrics(output_df, series_column) if not output_df.empty else pd.DataFrame(columns=[series_column, 'mae', 'mse', 'rmse', 'upper_alerts', 'lower_alerts'])
+        return output_df, metrics_df, errors, {str(series_id): params for series_id, params in models.items()}
+
+
+FORECAST_ENGINES = {
+    'prophet': ProphetEngine(),
+    'holt_winters': VectorizedEngine('holt_winters'),
+    'linear_trend': VectorizedEngine('linear_trend'),
+    'seasonal_naive': VectorizedEngine('seasonal_naive'),
+}
+
+
+# pandas frequency of each frequency the tool accepts
+FREQUENCIES = {'daily': 'D', 'weekly': 'W', 'monthly': 'MS'}
+
+
+def resolve_freq(freq, dates):
+    """Anchors a pandas frequency on the dates of the history so the engines' date ranges match the data.
+
+    Args:
+        freq (str): 'D', 'W' or 'MS', see `FREQUENCIES`.
+        dates (pd.Series): The dates of the history.
+
+    Returns:
+        str: the frequency inferred from the dates when it is of the same kind as `freq`, e.g. 'W-MON' or 'M' for month ends, else `freq`.
     """
-    Forecast evaluation function. Generates MAE, RMSE, MSE metrics. 
+    dates = pd.DatetimeIndex(pd.to_datetime(dates).unique()).sort_values()
+    inferred = pd.infer_freq(dates) if len(dates) >= 3 else None
+    if inferred is not None and inferred[0] == freq[0]:
+        return inferred
+    if len(dates) and freq == 'W':
+        return f"W-{dates[0].day_name()[:3].upper()}"
+    if len(dates) and freq == 'MS' and dates[0].is_month_end:
+        return 'M'
+    return freq
+
+
+def fit_forecast(pdf, periods=30, freq='D', interval_width=0.85, return_model=False, params=None):
+    """Fits a Prophet model on a single series and forecasts it.
+
+    Args:
+        pdf (pd.DataFrame): The history with `ds` and `y` columns.
+        periods (int, optional): The number of periods to forecast. Defaults to 30.
+        freq (str, optional): The pandas frequency of the series. Defaults to 'D'.
+        interval_width (float, optional): The width of the uncertainty interval. Defaults to 0.85.
+        return_model (bool, optional): Also return the fitted model. Defaults to False.
+        params (dict, optional): Additional Prophet parameters, e.g. the result of a backtest. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The forecast for the history and future periods joined with the actual values `y`, and the fitted model if `return_model` is set.
+    """
+    from prophet import Prophet
+    history = pdf[['ds', 'y']]
+    model = Prophet(interval_width=interval_width, **(params or {}))
+    model.fit(history)
+
+    # create a forecast and keep historical values with a join
+    future_pd = model.make_future_dataframe(periods=periods, freq=freq, include_history=True)
+
+    # Generate forecast
+    forecast_pd = model.predict(future_pd)
+    output_df = pd.merge(forecast_pd, history, on='ds', how='left')
+    return (output_df, model) if return_model else output_df
+
+
+def _fit_series_chunk(chunk, periods, freq, interval_width, return_models=False, params=None):
+    """Fits every series of a chunk in a worker process. A failing series is reported instead of raised.
+
+    Returns:
+        list: (series_id, forecast or None, error message or None, model parameters or None) tuples.
+    """
+    from prophet.serialize import model_to_json
+    results = []
+    for series_id, series_pdf in chunk:
+        try:
+            output_df, model = fit_forecast(series_pdf, periods=periods, freq=freq, interval_width=interval_width, return_model=True, params=params)
+            results.append((series_id, output_df, None, json.loads(model_to_json(model)) if return_models else None))
+        except Exception as e:
+            results.append((series_id, None, f"{type(e).__name__}: {e}", None))
+    return results
+
+
+def forecast_many(pdf, series_column, periods=30, freq='D', interval_width=0.85, max_workers=None, chunksize=None, return_models=False, params=None):
+    """Fits and forecasts every series of a long format frame in parallel across a process pool.
+
+    Args:
+        pdf (pd.DataFrame): The history with `ds`, `y` and the series id column.
+        series_column (str): The column identifying each series.
+        periods (int, optional): The number of periods to forecast. Defaults to 30.
+        freq (str, optional): The pandas frequency of the series. Defaults to 'D'.
+        interval_width (float, optional): The width of the uncertainty interval. Defaults to 0.85.
+        max_workers (int, optional): The number of worker processes. Defaults to the FORECAST_MAX_WORKERS environment variable or the CPU count.
+        chunksize (int, optional): The number of series sent to a worker at once. Defaults to the FORECAST_CHUNKSIZE environment variable or an even split into 4 chunks per worker.
+        return_models (bool, optional): Also return the fitted model parameters by series id. Defaults to False.
+        params (dict, optional): Additional Prophet parameters used for every series. Defaults to None.
+
+    Returns:
+        tuple: the combined forecast frame, a frame of per series metrics and a dictionary of errors by series id (and the model parameters by series id if `return_models` is set).
+    """
+    if series_column not in pdf.columns:
+        raise ValueError(f"Column {series_column} was not found in the uploaded data.")
+    groups = [(series_id, series_pdf) for series_id, series_pdf in pdf.groupby(series_column)]
+    max_workers = max_workers or int(os.getenv('FORECAST_MAX_WORKERS', os.cpu_count() or 1))
+    chunksize = chunksize or int(os.getenv('FORECAST_CHUNKSIZE', 0)) or max(1, -(-len(groups) // (max_workers * 4)))
+    chunks = [groups[i:i + chunksize] for i in range(0, len(groups), chunksize)]
+    logger.info("Forecasting %s series in %s chunks across %s workers.", len(groups), len(chunks), max_workers)
+
+    results = []
+    if max_workers == 1 or len(chunks) == 1:
+        for chunk in chunks:
+            results.extend(_fit_series_chunk(chunk, periods, freq, interval_width, return_models, params))
+    else:
+        # the workers are forked, see `wait_for_warmup`
+        wait_for_warmup()
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = {executor.submit(_fit_series_chunk, chunk, periods, freq, interval_width, return_models, params): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    # the worker itself died, every series of the chunk failed
+                    results.extend((series_id, None, f"{type(e).__name__}: {e}", None) for series_id, _ in futures[future])
+
+    frames = []
+    metrics = []
+    errors = {}
+    models = {}
+    for series_id, output_df, error, model in results:
+        if error is not None:
+            logger.warning("Forecast failed for series %s: %s", series_id, error)
+            errors[series_id] = error
+            continue
+        output_df.insert(0, series_column, series_id)
+        frames.append(output_df)
+        models[series_id] = model
+        metrics.append(dict(compute_forecast_metrics(output_df), **{series_column: series_id}))
+
+    output_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    metrics_df = pd.DataFrame(metrics, columns=[series_column, 'mae', 'mse', 'rmse', 'upper_alerts', 'lower_alerts'])
+    metrics_df = metrics_df.sort_values(series_column, ignore_index=True)
+    if return_models:
+        return output_df, metrics_df, errors, models
+    return output_df, metrics_df, errors
+
+
+def compute_forecast_metrics(pdf):
+    """
+    Forecast evaluation metrics. Returns MAE, MSE, RMSE and the number of actuals outside of the forecast interval.
     """
-    evaluation_pd = pdf[pdf['y'].notnull()]
-    
+    evaluation_pd = pdf[pdf['y'].notnull() & pdf['yhat'].notnull()]
+
+    from sklearn.metrics import mean_squared_error, mean_absolute_error
+
     # calulate evaluation metrics
     mae = round(mean_absolute_error( evaluation_pd['y'], evaluation_pd['yhat'] ), 4)
     mse = round(mean_squared_error( evaluation_pd['y'], evaluation_pd['yhat'] ), 4)
@@ -78,11 +388,79 @@ def evaluate_forecasts(pdf):
     # Get trend alerts
     yhat_above_upper = pdf[pdf['y'] > pdf['yhat_upper']]
     yhat_below_lower = pdf[pdf['y'] < pdf['yhat_lower']]
-    num_upper_alerts = str(len(yhat_above_upper))
-    num_lower_alerts = str(len(yhat_below_lower))
-    
+    return {'mae': mae, 'mse': mse, 'rmse': rmse, 'upper_alerts': len(yhat_above_upper), 'lower_alerts': len(yhat_below_lower)}
+
+
+def compute_series_metrics(pdf, series_column):
+    """Vectorized `compute_forecast_metrics` for every series of a long format forecast frame.
+
+    Returns:
+        pd.DataFrame: the metrics with one row per series.
+    """
+    evaluated = pdf['y'].notnull() & pdf['yhat'].notnull()
+    errors = (pdf['y'] - pdf['yhat']).where(evaluated)
+    grouped = pd.DataFrame({
+        series_column: pdf[series_column],
+        'mae': errors.abs(),
+        'mse': errors ** 2,
+        'upper_alerts': pdf['y'] > pdf['yhat_upper'],
+        'lower_alerts': pdf['y'] < pdf['yhat_lower'],
+    }).groupby(series_column)
+    metrics_df = grouped[['mae', 'mse']].mean().round(4)
+    metrics_df['rmse'] = np.sqrt(metrics_df['mse']).round(4)
+    metrics_df[['upper_alerts', 'lower_alerts']] = grouped[['upper_alerts', 'lower_alerts']].sum()
+    return metrics_df.reset_index()[[series_column, 'mae', 'mse', 'rmse', 'upper_alerts', 'lower_alerts']]
+
+
+def evaluate_forecasts(pdf):
+    """
+    Forecast evaluation function. Generates MAE, RMSE, MSE metrics.
+    """
+    metrics = compute_forecast_metrics(pdf)
+    mae, mse, rmse = metrics['mae'], metrics['mse'], metrics['rmse']
+    num_upper_alerts = str(metrics['upper_alerts'])
+    num_lower_alerts = str(metrics['lower_alerts'])
+
     # assemble result set
     # results = {'training_date':[training_date], 'workspace_id':[workspace_id], 'sku':[sku], 'mae':[mae], 'mse':[mse], 'rmse':[rmse]}
     results = f"The forecast has been generated. We have observed that there are {num_upper_alerts} occurences where the y value was above the upper threshold (yhat_upper) and {num_lower_alerts} occurrences where the y value was below the lower threshold (yhat_lower). Here are evaluation metrics for the forecast. Mean Average Error:{mae}, Mean Squared Error: {mse}, Root Mean Squared Error: {rmse}"
     return results
 
+
+def summarize_series_forecasts(metrics_df, errors, max_rows=20):
+    """Describes the forecasts of many series for the agent.
+
+    Args:
+        metrics_df (pd.DataFrame): per series metrics from `forecast_many`.
+        errors (dict): error messages by series id.
+        max_rows (int, optional): The number of series listed, worst RMSE first. Defaults to 20.
+
+    Returns:
+        str: a text description of the forecasts.
+    """
+    results = f"The forecast has been generated for {len(metrics_df)} series. "
+    if len(metrics_df):
+        results += f"Across all series there are {int(metrics_df['upper_alerts'].sum())} occurences where the y value was above the upper threshold (yhat_upper) and {int(metrics_df['lower_alerts'].sum())} occurrences where the y value was below the lower threshold (yhat_lower). "
+        results += f"The average evaluation metrics are Mean Average Error:{round(metrics_df['mae'].mean(), 4)}, Mean Squared Error: {round(metrics_df['mse'].mean(), 4)}, Root Mean Squared Error: {round(metrics_df['rmse'].mean(), 4)}. "
+        results += f"Here are the evaluation metrics of the series with the highest error:\n{metrics_df.sort_values('rmse', ascending=False).head(max_rows).to_string(index=False)}\n"
+    if errors:
+        results += f"The forecast failed for {len(errors)} series: {errors}"
+    return results
+
+
+def summarize_backtest(backtest):
+    """Describes the result of a backtest for the agent.
+
+    Args:
+        backtest (dict): the result of `libs.backtesting.tune`.
+
+    Returns:
+        str: a text description of the out of sample accuracy and the chosen parameters.
+    """
+    results_df = backtest['results']
+    return (
+        f" The model was tuned with a rolling origin backtest of {backtest['folds']} folds forecasting {backtest['horizon']} periods each, "
+        f"{len(results_df)} parameter candidates were evaluated and {int(results_df['pruned'].sum())} were stopped early. "
+        f"The best parameters are {backtest['params']} with an out of sample Mean Average Error: {backtest['mae']}, Root Mean Squared Error: {backtest['rmse']} "
+        f"and an interval coverage of {backtest['coverage']}. "
+    )
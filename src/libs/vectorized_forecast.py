@@ -0,0 +1,224 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+# default season length of each pandas frequency, anchored frequencies like W-MON use the season of their base
+SEASON_LENGTHS = {'D': 7, 'W': 52, 'M': 12, 'ME': 12, 'MS': 12, 'H': 24, 'h': 24}
+
+# smoothing parameters searched for every series by the Holt-Winters model
+HOLT_WINTERS_GRID = [
+    (alpha, beta, gamma)
+    for alpha in (0.05, 0.2, 0.5, 0.8)
+    for beta in (0.01, 0.1)
+    for gamma in (0.05, 0.3)
+]
+
+
+def min_history(method, season_length):
+    """Returns the minimum number of observations a series needs to be fit by `method`. """
+    return 2 * season_length if method in ('holt_winters', 'linear_trend') else season_length + 1
+
+
+def seasonal_naive(Y, periods, season_length):
+    """Forecasts every series with the value of the same season in the last observed cycle.
+
+    Args:
+        Y (np.ndarray): (series, time) array of gap free histories.
+        periods (int): the number of periods to forecast.
+        season_length (int): the number of periods in a season.
+
+    Returns:
+        tuple: the (series, time) one step fitted values, the (series, periods) forecast, the (series, time + periods)
+        standard deviation multiplier of the prediction interval and the fitted parameters.
+    """
+    n_series, n_time = Y.shape
+    fitted = np.full_like(Y, np.nan)
+    fitted[:, season_length:] = Y[:, :-season_length]
+    steps = np.arange(periods)
+    forecast = Y[:, n_time - season_length + steps % season_length]
+    # the error of a seasonal naive forecast grows with the number of complete seasons ahead
+    scale = np.concatenate([np.ones(n_time), np.sqrt(steps // season_length + 1)])
+    return fitted, forecast, np.broadcast_to(scale, (n_series, n_time + periods)), {}
+
+
+def linear_trend(Y, periods, season_length):
+    """Fits a linear trend with additive seasonal dummies to every series with a single batched least squares solve.
+
+    Args:
+        Y (np.ndarray): (series, time) array of gap free histories.
+        periods (int): the number of periods to forecast.
+        season_length (int): the number of periods in a season.
+
+    Returns:
+        tuple: the (series, time) fitted values, the (series, periods) forecast, the interval standard deviation
+        multiplier and the fitted coefficients.
+    """
+    n_series, n_time = Y.shape
+    t = np.arange(n_time + periods)
+    X = np.column_stack([np.ones(len(t)), t / n_time] + [(t % season_length == s).astype(np.float64) for s in range(1, season_length)])
+    coef, *_ = np.linalg.lstsq(X[:n_time], Y.T, rcond=None)
+    prediction = (X @ coef).T
+    scale = np.ones((n_series, n_time + periods))
+    return prediction[:, :n_time], prediction[:, n_time:], scale, {'coefficients': coef.T}
+
+
+def _holt_winters_pass(Y, alpha, beta, gamma, season_length, keep_fitted=False):
+    """Runs the additive Holt-Winters recursion over time for every series (and parameter set) at once.
+
+    `Y` has shape (series, time) and the smoothing parameters broadcast against the leading axes, so the recursion
+    is one vectorized update per time step.
+    """
+    n_time = Y.shape[-1]
+    first = Y[..., :season_length].mean(axis=-1)
+    second = Y[..., season_length:2 * season_length].mean(axis=-1)
+    shape = np.broadcast_shapes(np.shape(alpha), Y.shape[:-1])
+    level = np.broadcast_to(first, shape).copy()
+    trend = np.broadcast_to((second - first) / season_length, shape).copy()
+    season = np.broadcast_to(Y[..., :season_length] - first[..., None], shape + (season_length,)).copy()
+
+    sse = np.zeros(shape)
+    fitted = np.empty(shape + (n_time,)) if keep_fitted else None
+    for t in range(n_time):
+        s = t % season_length
+        y = Y[..., t]
+        prediction = level + trend + season[..., s]
+        sse += (y - prediction) ** 2
+        if keep_fitted:
+            fitted[..., t] = prediction
+        new_level = alpha * (y - season[..., s]) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season[..., s] = gamma * (y - new_level) + (1 - gamma) * season[..., s]
+        level = new_level
+    return sse, fitted, level, trend, season
+
+
+def holt_winters(Y, periods, season_length):
+    """Fits additive Holt-Winters (ETS(A,A,A)) models to every series.
+
+    The smoothing parameters of each series are chosen from `HOLT_WINTERS_GRID` by in-sample one step squared error.
+    All series and all parameter sets are evaluated in one batched recursion.
+
+    Args:
+        Y (np.ndarray): (series, time) array of gap free histories.
+        periods (int): the number of periods to forecast.
+        season_length (int): the number of periods in a season.
+
+    Returns:
+        tuple: the (series, time) one step fitted values, the (series, periods) forecast, the interval standard
+        deviation multiplier and the chosen smoothing parameters.
+    """
+    n_series, n_time = Y.shape
+    grid = np.array(HOLT_WINTERS_GRID)
+    alpha, beta, gamma = (grid[:, i, None] for i in range(3))
+    sse, *_ = _holt_winters_pass(Y[None], alpha, beta, gamma, season_length)
+    best = grid[np.argmin(sse, axis=0)]
+    alpha, beta, gamma = best[:, 0], best[:, 1], best[:, 2]
+
+    _, fitted, level, trend, season = _holt_winters_pass(Y, alpha, beta, gamma, season_length, keep_fitted=True)
+    steps = np.arange(1, periods + 1)
+    forecast = level[:, None] + steps * trend[:, None] + season[:, (n_time + steps - 1) % season_length]
+
+    # forecast variance of ETS(A,A,A): sigma^2 * (1 + sum_{j<h} c_j^2)
+    j = np.arange(1, periods)
+    c = alpha[:, None] + alpha[:, None] * beta[:, None] * j + gamma[:, None] * (1 - alpha[:, None]) * (j % season_length == 0)
+    variance = 1 + np.concatenate([np.zeros((n_series, 1)), np.cumsum(c ** 2, axis=1)], axis=1)
+    scale = np.concatenate([np.ones((n_series, n_time)), np.sqrt(variance)], axis=1)
+    return fitted, forecast, scale, {'alpha': alpha, 'beta': beta, 'gamma': gamma}
+
+
+METHODS = {
+    'seasonal_naive': seasonal_naive,
+    'linear_trend': linear_trend,
+    'holt_winters': holt_winters,
+}
+
+
+def forecast_arrays(Y, periods, season_length, method='holt_winters', interval_width=0.85):
+    """Fits `method` to every row of `Y` and forecasts with prediction intervals.
+
+    Args:
+        Y (np.ndarray): (series, time) array of gap free histories.
+        periods (int): the number of periods to forecast.
+        season_length (int): the number of periods in a season.
+        method (str, optional): one of `METHODS`. Defaults to 'holt_winters'.
+        interval_width (float, optional): The width of the uncertainty interval. Defaults to 0.85.
+
+    Returns:
+        tuple: the (series, time + periods) arrays yhat, yhat_lower and yhat_upper and the fitted parameters.
+    """
+    # scipy is only needed for the interval, it is imported on first use to keep the app startup fast
+    from scipy.stats import norm
+    fitted, forecast, scale, params = METHODS[method](Y, periods, season_length)
+    residuals = Y - fitted
+    sigma = np.sqrt(np.nanmean(residuals ** 2, axis=1))
+    yhat = np.concatenate([fitted, forecast], axis=1)
+    half_width = norm.ppf(0.5 + interval_width / 2) * sigma[:, None] * scale
+    return yhat, yhat - half_width, yhat + half_width, params
+
+
+def forecast_frame(pdf, series_column, periods=30, freq='D', interval_width=0.85, method='holt_winters', season_length=None):
+    """Forecasts every series of a long format frame as one batched array operation.
+
+    The series are pivoted onto a shared date index, gaps are filled by interpolation for fitting and every series is
+    fit at once. The output matches the Prophet output of `fit_forecast`: `ds`, `yhat`, `yhat_lower`, `yhat_upper` and
+    the actuals `y`, for the history of each series and `periods` future periods.
+
+    Args:
+        pdf (pd.DataFrame): The history with `ds`, `y` and the series id column.
+        series_column (str): The column identifying each series.
+        periods (int, optional): The number of periods to forecast. Defaults to 30.
+        freq (str, optional): The pandas frequency of the series. Defaults to 'D'.
+        interval_width (float, optional): The width of the uncertainty interval. Defaults to 0.85.
+        method (str, optional): one of `METHODS`. Defaults to 'holt_winters'.
+        season_length (int, optional): The number of periods in a season. Defaults to the season of `freq`.
+
+    Returns:
+        tuple: the forecast frame, a dictionary of errors by series id and the fitted parameters by series id.
+    """
+    assert method in METHODS, f"Unknown forecasting method {method}. Use one of {list(METHODS)}."
+    season_length = season_length or SEASON_LENGTHS.get(freq.split('-')[0], 7)
+    wide = pdf.pivot_table(index='ds', columns=series_column, values='y', aggfunc='sum', dropna=False)
+    wide = wide.reindex(pd.date_range(wide.index.min(), wide.index.max(), freq=freq))
+    values = wide.to_numpy(dtype=np.float64).T
+
+    observed = ~np.isnan(values)
+    counts = observed.sum(axis=1)
+    starts = observed.argmax(axis=1)
+    required = min_history(method, season_length)
+    errors = {
+        series_id: f"ValueError: {count} observations, the {method} model needs at least {required}."
+        for series_id, count in zip(wide.columns, counts) if count < required
+    }
+    valid = counts >= required
+    series_ids = wide.columns[valid]
+    if not valid.any():
+        return pd.DataFrame(), errors, {}
+
+    # fit every series over the shared index, gaps and the periods before a series starts or after it ends are filled
+    Y = wide.loc[:, valid].interpolate(limit_direction='both').to_numpy(dtype=np.float64).T
+    yhat, lower, upper, params = forecast_arrays(Y, periods, season_length, method=method, interval_width=interval_width)
+
+    dates = pd.date_range(wide.index[0], periods=len(wide) + periods, freq=freq)
+    steps = np.arange(len(dates))
+    # keep each series from its first observation, all series are forecast from the last date of the shared index
+    keep = steps >= starts[valid][:, None]
+    y = np.concatenate([values[valid], np.full((valid.sum(), periods), np.nan)], axis=1)
+    rows, cols = np.nonzero(keep)
+    output_df = pd.DataFrame({
+        series_column: np.asarray(series_ids)[rows],
+        'ds': dates[cols],
+        'yhat': yhat[rows, cols],
+        'yhat_lower': lower[rows, cols],
+        'yhat_upper': upper[rows, cols],
+        'y': y[rows, cols],
+    })
+    models = {
+        series_id: dict({'method': method, 'season_length': season_length}, **{name: value[i].tolist() for name, value in params.items()})
+        for i, series_id in enumerate(series_ids)
+    }
+    return output_df, errors, models
@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import importlib
+import threading
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+
+_thread = None
+
+
+def import_modules(names):
+    """Imports modules ahead of their first use. """
+    for name in names:
+        importlib.import_module(name)
+
+
+def preload_prophet():
+    """Imports Prophet and fits a tiny series so the Stan backend and its compiled model are loaded before the first
+    forecast request.
+    """
+    import pandas as pd
+    from prophet import Prophet
+
+    history = pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=30, freq='D'), 'y': [float(i % 7) for i in range(30)]})
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    Prophet(daily_seasonality=False, yearly_seasonality=False, uncertainty_samples=0).fit(history)
+
+
+def open_connections(urls=None, timeout=5):
+    """Opens the keep-alive connections of the shared HTTP client to the serving endpoints, so the first request
+    skips the DNS lookup and TLS handshake. Failures are ignored, the endpoints may reject a bare HEAD request.
+
+    Args:
+        urls (list, optional): The endpoint urls. Defaults to the image to text endpoint and the Databricks host.
+        timeout (float, optional): The seconds to wait per endpoint. Defaults to 5.
+    """
+    if urls is None:
+        host = os.getenv('DATABRICKS_HOST')
+        urls = [os.getenv('ITT_ENDPOINT'), f"https://{host.replace('https://', '')}" if host else None]
+    import libs.http_client as http_client
+    client = http_client.get_client()
+    for url in filter(None, urls):
+        try:
+            client.session(url).head(url, timeout=timeout)
+        except Exception as e:
+            logger.info("Warm-up could not connect to %s: %s", url, e)
+
+
+def warm_up(tasks):
+    """Runs the warm-up tasks one after the other. A failing task is logged and the next task still runs.
+
+    Args:
+        tasks (list): (name, callable) pairs.
+
+    Returns:
+        dict: the seconds spent on every task, None for failed tasks.
+    """
+    timings = {}
+    for name, task in tasks:
+        start = time.perf_counter()
+        try:
+            task()
+            timings[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            timings[name] = None
+            logger.warning("Warm-up task %s failed: %s", name, e)
+    logger.info("Warm-up finished: %s", timings)
+    return timings
+
+
+def start_warmup(tasks, delay=0.0):
+    """Runs the warm-up tasks on a background daemon thread so the server binds immediately.
+
+    Args:
+        tasks (list): (name, callable) pairs.
+        delay (float, optional): Seconds to wait before warming up, e.g. to let the server start first. Defaults to 0.
+
+    Returns:
+        threading.Thread: the warm-up thread.
+    """
+    global _thread
+
+    def run():
+        if delay:
+            time.sleep(delay)
+        warm_up(tasks)
+
+    _thread = threading.Thread(target=run, name='warmup', daemon=True)
+    _thread.start()
+    return _thread
+
+
+def wait_for_warmup(timeout=None):
+    """Waits for a running warm-up to finish. Call it before forking worker processes: a fork while the warm-up
+    thread holds the import lock or a logging lock leaves the child waiting for a lock no thread will release.
+
+    Returns:
+        bool: False if the warm-up is still running after `timeout` seconds.
+    """
+    thread = _thread
+    if thread is None or thread is threading.current_thread():
+        return True
+    thread.join(timeout)
+    return not thread.is_alive()
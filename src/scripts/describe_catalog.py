@@ -0,0 +1,42 @@
+"""Generates product descriptions for a directory of catalog images, see `libs.bulk_describe`.
+
+The run statistics are logged when it finishes, `--json` also prints them as JSON.
+
+Usage:
+    python src/scripts/describe_catalog.py /data/catalog_images descriptions.jsonl --batch-size 16 --concurrency 4
+    python src/scripts/describe_catalog.py /data/catalog_images descriptions.parquet --endpoint http://localhost:5000/invocations
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from libs.bulk_describe import bulk_describe
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate product descriptions for a directory of catalog images.")
+    parser.add_argument('input_dir', help="directory of the catalog images (searched recursively)")
+    parser.add_argument('output', help="JSONL file or Parquet directory (.parquet) of the results")
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default=None, help="output format, defaults to the output extension")
+    parser.add_argument('--batch-size', type=int, default=16, help="images per request")
+    parser.add_argument('--concurrency', type=int, default=4, help="maximum requests in flight")
+    parser.add_argument('--max-side', type=int, default=448, help="maximum width and height of the images sent")
+    parser.add_argument('--no-preprocess', action='store_true', help="send the images as they are")
+    parser.add_argument('--limit', type=int, default=None, help="maximum number of images described by this run")
+    parser.add_argument('--endpoint', default=None, help="image to text endpoint, defaults to ITT_ENDPOINT")
+    parser.add_argument('--json', action='store_true', help="print the run statistics as JSON")
+    args = parser.parse_args(argv)
+
+    if args.endpoint:
+        os.environ['ITT_ENDPOINT'] = args.endpoint
+    stats = bulk_describe(args.input_dir, args.output, output_format=args.format, batch_size=args.batch_size, concurrency=args.concurrency,
+                          preprocess=not args.no_preprocess, max_side=args.max_side, limit=args.limit)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    return stats
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'scripts'))
+
+# the modules read their settings at import, the tests never reach Databricks
+os.environ.setdefault('DATABRICKS_HOST', 'http://127.0.0.1:9')
+os.environ.setdefault('DATABRICKS_TOKEN', 'test')
+os.environ.setdefault('APP_WARMUP_ENABLED', 'false')
+os.environ.setdefault('TELEMETRY_TRACE_LOG', 'false')
+
+
+@pytest.fixture
+def itt_endpoint(monkeypatch):
+    """Starts fake image to text endpoints, see `fake_itt_endpoint.py`. The last one started serves `ITT_ENDPOINT`.
+
+    The description cache starts empty and the shared clients do not retry, so failures surface at once.
+    """
+    import libs.http_client as http_client
+    import libs.image_to_text as image_to_text
+    from fake_itt_endpoint import start_fake_endpoint
+    servers = []
+
+    def start(failure_rate=0.0):
+        server, url = start_fake_endpoint(failure_rate=failure_rate)
+        servers.append(server)
+        monkeypatch.setenv('ITT_ENDPOINT', url)
+        return server
+
+    monkeypatch.setattr(image_to_text, '_cache', None)
+    monkeypatch.setattr(http_client, '_client', http_client.HttpClient(max_retries=0, failure_threshold=100))
+    monkeypatch.setattr(http_client, '_async_client', http_client.AsyncHttpClient(max_retries=0, failure_threshold=100))
+    yield start
+    for server in servers:
+        server.shutdown()
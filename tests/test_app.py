@@ -0,0 +1,78 @@
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    import app
+    from libs.session_state import SessionManager
+
+    class FakeLLM():
+        def __init__(self):
+            self.messages = []
+
+        def add_message(self, message):
+            self.messages.append(message)
+
+    monkeypatch.setattr(app, 'session_manager', SessionManager(llm_factory=lambda session: FakeLLM(), root_dir=str(tmp_path)))
+    return app
+
+
+def test_a_failed_submit_releases_the_session(app, monkeypatch):
+    class BrokenJobManager():
+        def active(self, session_id):
+            return []
+
+        def submit(self, *args, **kwargs):
+            raise RuntimeError("cannot schedule new futures after shutdown")
+
+    monkeypatch.setattr(app, 'get_job_manager', lambda: BrokenJobManager())
+    with pytest.raises(RuntimeError):
+        app.update_chat(1, None, "hello", [], None, None, 'session-1')
+    assert app.session_manager.get('session-1').active == 0
+
+
+def test_a_full_queue_releases_the_session(app, monkeypatch):
+    class FullJobManager():
+        def active(self, session_id):
+            return []
+
+        def submit(self, *args, **kwargs):
+            raise app.JobQueueFull("100 jobs are already waiting.")
+
+    monkeypatch.setattr(app, 'get_job_manager', lambda: FullJobManager())
+    app.update_chat(1, None, "hello", [], None, None, 'session-1')
+    session = app.session_manager.get('session-1')
+    assert session.active == 0
+    assert session.llm.messages[-1].content == "The assistant is busy, please try again in a moment."
+
+
+def test_an_unchanged_upload_is_saved_once(app, monkeypatch):
+    saved = []
+    monkeypatch.setattr('libs.file_handler.save_file_upload', lambda **kwargs: saved.append(kwargs['input_file_name']))
+    session = app.session_manager.get_or_create('session-1')
+    content = "data:text/csv;base64,ZHMseQo="
+
+    assert app.save_upload(session, 'sales.csv', content)
+    assert not app.save_upload(session, 'sales.csv', content)
+    assert app.save_upload(session, 'sales.csv', "data:text/csv;base64,ZHMseSx6Cg==")
+    assert saved == ['sales.csv', 'sales.csv']
+
+
+def test_chunked_uploads_need_an_existing_session(app):
+    with pytest.raises(ValueError, match="unknown session"):
+        app.session_upload_dir('session-1')
+    assert app.session_upload_dir(app.session_manager.get_or_create('session-1').session_id)
+
+
+def test_displaying_the_chat_never_builds_the_agent(app, monkeypatch):
+    def llm_factory(session):
+        raise AssertionError("the agent was built")
+
+    from libs.session_state import SessionManager
+    monkeypatch.setattr(app, 'session_manager', SessionManager(llm_factory=llm_factory, root_dir=app.session_manager.root_dir))
+    session = app.session_manager.get_or_create('session-1')
+
+    assert app.display_chat(None, None, 'session-1') == ([], {'start': 0, 'end': 0}, {'display': 'none'})
+    assert app.poll_chat(1, None, [], 'session-1')[0] is app.dash.no_update
+    app.load_earlier_messages(1, {'start': 5, 'end': 10}, 'session-1')
+    assert not session.has_llm
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+import libs.backtesting as backtesting
+
+
+def daily_history(days=200):
+    ds = pd.date_range('2024-01-01', periods=days, freq='D')
+    return pd.DataFrame({'ds': ds, 'y': 100 + 10 * np.sin(np.arange(days) / 7)})
+
+
+@pytest.fixture
+def fake_folds(monkeypatch):
+    """Runs the folds on threads with a fake scorer, the multiplicative candidate is 10 times worse. """
+    calls = []
+    lock = threading.Lock()
+
+    def evaluate(pdf, cutoff, horizon, params, interval_width):
+        with lock:
+            calls.append((params['seasonality_mode'], cutoff, interval_width))
+        error = 10.0 if params['seasonality_mode'] == 'multiplicative' else 1.0
+        return {'mae': error, 'rmse': error, 'coverage': 0.8}
+
+    monkeypatch.setattr(backtesting, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(backtesting, '_evaluate_fold', evaluate)
+    return calls
+
+
+def test_short_history_raises_value_error():
+    with pytest.raises(ValueError, match="Not enough history"):
+        backtesting.tune(daily_history(days=60), horizon=30)
+
+
+def test_pruned_candidates_skip_their_remaining_folds(fake_folds):
+    space = {'seasonality_mode': ['additive', 'multiplicative']}
+    result = backtesting.tune(daily_history(), space=space, horizon=30, n_folds=3, max_workers=1)
+
+    assert result['params'] == {'seasonality_mode': 'additive'}
+    assert [mode for mode, _, _ in fake_folds].count('additive') == 3
+    assert [mode for mode, _, _ in fake_folds].count('multiplicative') == 1
+
+
+def test_without_early_stopping_every_fold_is_fit(fake_folds):
+    space = {'seasonality_mode': ['additive', 'multiplicative']}
+    backtesting.tune(daily_history(), space=space, horizon=30, n_folds=3, max_workers=2, early_stopping=False)
+
+    assert len(fake_folds) == 6
+
+
+def test_every_candidate_failing_raises_value_error(monkeypatch):
+    def evaluate(pdf, cutoff, horizon, params, interval_width):
+        raise RuntimeError("fit failed")
+
+    monkeypatch.setattr(backtesting, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(backtesting, '_evaluate_fold', evaluate)
+    with pytest.raises(ValueError, match="Every backtest candidate failed"):
+        backtesting.tune(daily_history(), space={'seasonality_mode': ['additive']}, horizon=30)
+
+
+def test_the_interval_width_is_not_searched(fake_folds):
+    with pytest.raises(ValueError, match="interval_width"):
+        backtesting.tune(daily_history(), space={'interval_width': [0.8, 0.9]}, horizon=30)
+    assert 'interval_width' not in backtesting.DEFAULT_SEARCH_SPACE
+
+    result = backtesting.tune(daily_history(), space={'seasonality_mode': ['additive']}, horizon=30, n_folds=2, interval_width=0.9)
+    # one fit per fold, scored with the requested interval width
+    assert [width for _, _, width in fake_folds] == [0.9, 0.9]
+    assert result['params'] == {'seasonality_mode': 'additive'}
@@ -0,0 +1,52 @@
+import pytest
+from bench_load import BASELINE_METRICS, compare, validate
+
+
+def results(turns_per_second=10.0, latency=0.1, **overrides):
+    results = {'turns': 12, 'errors': [], 'turns_per_second': turns_per_second}
+    for metric in BASELINE_METRICS:
+        section, _, stat = metric.partition('.')
+        if stat:
+            results.setdefault(section, {})[stat] = latency
+    results.update(overrides)
+    return results
+
+
+def regressions(comparison):
+    return [metric for metric, _, _, _, regressed in comparison if regressed]
+
+
+def test_an_unchanged_run_does_not_regress():
+    assert regressions(compare(results(), results())) == []
+
+
+def test_slower_callbacks_and_lower_throughput_regress():
+    assert regressions(compare(results(turns_per_second=5.0), results())) == ['turns_per_second']
+    assert len(regressions(compare(results(latency=0.2), results()))) == len(BASELINE_METRICS) - 1
+
+
+def test_missing_metrics_regress():
+    current = results()
+    del current['turn']['p99']
+    del current['turns_per_second']
+    comparison = compare(current, results())
+    assert regressions(comparison) == ['turn.p99', 'turns_per_second']
+    assert ('turn.p99', 0.1, None, None, True) in comparison
+
+    baseline = results()
+    del baseline['poll_chat']
+    assert regressions(compare(results(), baseline)) == ['poll_chat.p50', 'poll_chat.p95', 'poll_chat.p99']
+
+
+def test_a_zero_baseline_regresses_when_the_latency_grows():
+    assert regressions(compare(results(latency=0.1), results(latency=0.0))) != []
+    assert regressions(compare(results(latency=0.0), results(latency=0.0))) == []
+
+
+@pytest.mark.parametrize('run, problems', [
+    (results(), []),
+    (results(errors=["'hello': TimeoutError: "]), ["1 turns failed"]),
+    (results(turns=0), ["no turn completed"]),
+])
+def test_runs_with_errors_or_without_turns_are_invalid(run, problems):
+    assert validate(run) == problems
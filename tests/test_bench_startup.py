@@ -0,0 +1,14 @@
+import bench_startup
+
+
+def test_the_app_starts_without_its_deferred_modules():
+    result = bench_startup.measure('app')
+    assert 'error' not in result
+    assert result['deferred_loaded'] == []
+    assert bench_startup.validate([result]) == []
+
+
+def test_deferred_modules_loaded_by_the_app_invalidate_the_run():
+    assert bench_startup.validate([{'module': 'app', 'deferred_loaded': ['pandas', 'numpy']}]) == ["importing the app loaded pandas, numpy"]
+    # the warm-up loads them on purpose
+    assert bench_startup.validate([{'module': 'app (warm)', 'deferred_loaded': ['pandas']}]) == []
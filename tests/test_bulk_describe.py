@@ -0,0 +1,121 @@
+import json
+import pytest
+import pandas as pd
+from PIL import Image
+import libs.bulk_describe as bulk_describe
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """A directory of 12 small product images in two folders. """
+    image_dir = tmp_path / 'images'
+    for i in range(12):
+        folder = image_dir / f"shelf{i % 2}"
+        folder.mkdir(parents=True, exist_ok=True)
+        Image.new('RGB', (32 + i, 32), (20 * i, 100, 200)).save(folder / f"item{i:02d}.png")
+    return image_dir
+
+
+def read_rows(output_path):
+    if str(output_path).endswith('.parquet'):
+        return pd.read_parquet(output_path).to_dict(orient='records')
+    with open(output_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def read_errors(output_path):
+    with open(f"{output_path}.errors.jsonl", encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('name', ['descriptions.jsonl', 'descriptions.parquet'])
+def test_an_interrupted_run_resumes_where_it_stopped(itt_endpoint, catalog, tmp_path, name):
+    server = itt_endpoint()
+    output_path = str(tmp_path / name)
+    first = bulk_describe.bulk_describe(str(catalog), output_path, batch_size=4, concurrency=2, limit=5)
+    assert first['described'] == 5
+    if name.endswith('.jsonl'):
+        # a line torn by the interruption is dropped on resume
+        with open(output_path, 'a', encoding='utf-8') as f:
+            f.write('{"image_id": "shelf1/ite')
+
+    second = bulk_describe.bulk_describe(str(catalog), output_path, batch_size=4, concurrency=2)
+    assert second['skipped'] == 5
+    assert second['described'] == 7
+    assert server.RequestHandlerClass.requests_served == 2 + 2
+
+    rows = read_rows(output_path)
+    assert sorted(row['image_id'] for row in rows) == sorted(image_id for image_id, _ in bulk_describe.iter_images(str(catalog)))
+    assert all(row['description'].endswith(')') for row in rows)
+
+
+def test_a_keyboard_interrupt_keeps_the_written_batches(itt_endpoint, catalog, tmp_path, monkeypatch):
+    itt_endpoint()
+    output_path = str(tmp_path / 'descriptions.jsonl')
+    write = bulk_describe.JsonlWriter.write
+    calls = []
+
+    def interrupted_write(self, rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        write(self, rows)
+
+    monkeypatch.setattr(bulk_describe.JsonlWriter, 'write', interrupted_write)
+    with pytest.raises(KeyboardInterrupt):
+        bulk_describe.bulk_describe(str(catalog), output_path, batch_size=4, concurrency=1)
+    assert len(read_rows(output_path)) == 4
+
+    monkeypatch.setattr(bulk_describe.JsonlWriter, 'write', write)
+    stats = bulk_describe.bulk_describe(str(catalog), output_path, batch_size=4, concurrency=1)
+    assert stats['skipped'] == 4 and stats['described'] == 8
+    assert len(read_rows(output_path)) == 12
+
+
+def test_a_broken_image_fails_alone(itt_endpoint, catalog, tmp_path):
+    itt_endpoint()
+    (catalog / 'shelf0' / 'item04.png').write_bytes(b'not an image')
+    output_path = str(tmp_path / 'descriptions.jsonl')
+    stats = bulk_describe.bulk_describe(str(catalog), output_path, batch_size=4)
+
+    assert stats['described'] == 11 and stats['failed'] == 1
+    assert [error['image_id'] for error in read_errors(output_path)] == ['shelf0/item04.png']
+
+
+def test_a_failed_request_is_bisected_down_to_the_bad_image(itt_endpoint, catalog, tmp_path):
+    server = itt_endpoint()
+    (catalog / 'shelf0' / 'item04.png').write_bytes(b'not an image')
+    output_path = str(tmp_path / 'descriptions.jsonl')
+    # without preprocessing the endpoint rejects the request carrying the broken image
+    stats = bulk_describe.bulk_describe(str(catalog), output_path, batch_size=4, preprocess=False)
+
+    assert stats['described'] == 11 and stats['failed'] == 1
+    assert [error['image_id'] for error in read_errors(output_path)] == ['shelf0/item04.png']
+    # 3 batches, the failed batch of 4 is retried as 2 + 2 and its failed half as 1 + 1
+    assert stats['requests'] == server.RequestHandlerClass.requests_served == 3 + 2 + 2
+
+
+def test_row_errors_of_the_served_model_are_failures(catalog, monkeypatch):
+    # the served model answers every row with its description or its error
+    def extract(data):
+        return {'predictions': [{'description': None, 'error': "RuntimeError: CUDA out of memory"}] + [{'description': "a mug", 'error': None}] * (len(data['dataframe_records']) - 1)}
+
+    monkeypatch.setattr(bulk_describe.image_to_text, 'image_to_text_extract', extract)
+    batch = list(bulk_describe.iter_images(str(catalog)))[:3]
+    rows, failures, request_stats = bulk_describe.describe_batch(batch)
+
+    assert [row['image_id'] for row in rows] == [image_id for image_id, _ in batch[1:]]
+    assert all(row['description'] == "a mug" for row in rows)
+    assert failures == [{'image_id': batch[0][0], 'path': batch[0][1], 'error': "RuntimeError: CUDA out of memory"}]
+    assert request_stats['requests'] == 1
+
+
+def test_the_command_line_prints_json_only_when_asked(itt_endpoint, catalog, tmp_path, capsys):
+    import describe_catalog
+    itt_endpoint()
+    stats = describe_catalog.main([str(catalog), str(tmp_path / 'descriptions.jsonl'), '--batch-size', '4'])
+    assert stats['described'] == 12
+    assert capsys.readouterr().out == ''
+
+    describe_catalog.main([str(catalog), str(tmp_path / 'descriptions.jsonl'), '--json'])
+    assert json.loads(capsys.readouterr().out)['skipped'] == 12
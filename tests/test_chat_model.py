@@ -0,0 +1,54 @@
+import pytest
+from libs.chat_model import RetailLLM
+from libs.file_handler import upload_fingerprint
+from libs.response_cache import ResponseCache
+from libs.session_state import SessionManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    cache = ResponseCache()
+
+    def llm_factory(session):
+        return RetailLLM("You are a retail assistant.", tools=[], response_cache=cache, cache_state=lambda: upload_fingerprint(session.upload_paths()))
+    return SessionManager(llm_factory=llm_factory, root_dir=str(tmp_path))
+
+
+def upload(session, data):
+    with open(session.data_csv_path, 'w') as f:
+        f.write(data)
+
+
+def test_a_second_session_hits_the_cached_answer(manager):
+    with manager.session('a') as first:
+        upload(first, "ds,y\n2024-01-01,1\n")
+        first.llm.agent.memory.save_context({'input': "hi"}, {'output': "Hello!"})
+        prompt = "Generate a forecast"
+        state = first.llm._cache_state(prompt)
+        first.llm.response_cache.store(prompt, state, "Here is the forecast.")
+
+    with manager.session('b') as second:
+        upload(second, "ds,y\n2024-01-01,1\n")
+        # a different conversation and upload location, the same uploaded data
+        assert second.llm._cache_state(prompt) == state
+        assert second.llm.send_chat("generate a forecast!") == "Here is the forecast."
+        assert second.llm.response_cache.stats()['hits'] == 1
+
+
+def test_prompts_about_the_conversation_are_not_shared(manager):
+    with manager.session('a') as first:
+        first.llm.agent.memory.save_context({'input': "hi"}, {'output': "Hello!"})
+        prompt = "Do it again"
+        first.llm.response_cache.store(prompt, first.llm._cache_state(prompt), "Done.")
+
+    with manager.session('b') as second:
+        assert second.llm.response_cache.lookup(prompt, second.llm._cache_state(prompt)) is None
+
+
+def test_a_different_upload_misses(manager):
+    with manager.session('a') as first:
+        upload(first, "ds,y\n2024-01-01,1\n")
+        state = first.llm._cache_state("generate a forecast")
+    with manager.session('b') as second:
+        upload(second, "ds,y\n2024-01-01,2\n")
+        assert second.llm._cache_state("generate a forecast") != state
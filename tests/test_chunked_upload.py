@@ -0,0 +1,74 @@
+import pytest
+from flask import Flask
+import libs.chunked_upload as chunked_upload
+from libs.chunked_upload import ChunkedUploadStore, register_upload_routes
+from libs.file_handler import load_forecast_data
+from libs.session_state import SessionManager
+
+
+CSV = b"ds,y,store,notes\n2024-01-01,1,a,x\n2024-01-02,2,a,y\n"
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return SessionManager(llm_factory=lambda session: None, root_dir=str(tmp_path / 'sessions'))
+
+
+@pytest.fixture
+def client(tmp_path, sessions, monkeypatch):
+    monkeypatch.setattr(chunked_upload, '_store', ChunkedUploadStore(upload_dir=str(tmp_path / 'uploads')))
+
+    def output_dir(session_id):
+        session = sessions.get(session_id)
+        if session is None:
+            raise ValueError(f"Error: unknown session {session_id}.")
+        return session.upload_dir
+
+    server = Flask(__name__)
+    register_upload_routes(server, output_dir=output_dir)
+    return server.test_client()
+
+
+def upload(client, filename, data, session_id):
+    response = client.post('/upload', json={'filename': filename, 'size': len(data), 'session_id': session_id})
+    if response.status_code != 200:
+        return response
+    upload_id = response.get_json()['upload_id']
+    client.put(f"/upload/{upload_id}?offset=0", data=data)
+    return client.post(f"/upload/{upload_id}/complete")
+
+
+def test_uploads_are_saved_to_the_session(client, sessions):
+    session = sessions.get_or_create('a')
+    response = upload(client, 'sales.csv', CSV, 'a')
+    assert response.status_code == 200
+    assert response.get_json()['rows'] == 2
+
+    pdf = load_forecast_data(columns=['ds', 'y', 'missing'], csv_path=session.data_csv_path, arrow_path=session.data_arrow_path)
+    assert list(pdf.columns) == ['ds', 'y']
+    assert pdf['y'].tolist() == [1, 2]
+    assert str(pdf['ds'].dtype).startswith('datetime64')
+
+
+def test_unknown_sessions_are_rejected(client, sessions):
+    for session_id in ('unknown', '../../etc', None):
+        response = upload(client, 'sales.csv', CSV, session_id)
+        assert response.status_code == 400
+        assert "unknown session" in response.get_json()['error']
+    assert sessions.stats()['sessions'] == 0
+
+
+def test_unsupported_files_are_rejected(client, sessions):
+    sessions.get_or_create('a')
+    for filename in ('notes.txt', 'run.sh', 'Makefile'):
+        response = upload(client, filename, b"echo", 'a')
+        assert response.status_code == 400
+        assert "can not be uploaded" in response.get_json()['error']
+
+
+def test_csv_data_loads_only_the_requested_columns(tmp_path):
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_bytes(CSV)
+    pdf = load_forecast_data(columns=['ds', 'y'], csv_path=str(csv_path), arrow_path=str(tmp_path / 'data.arrow'))
+    assert list(pdf.columns) == ['ds', 'y']
+    assert str(pdf['ds'].dtype).startswith('datetime64')
@@ -0,0 +1,178 @@
+import time
+import threading
+import pytest
+from types import SimpleNamespace
+from libs.db_sql import ConnectionPool, PoolTimeoutError
+
+
+class OperationalError(Exception):
+    pass
+
+
+class InterfaceError(Exception):
+    pass
+
+
+class FakeCursor():
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._rows = []
+
+    def execute(self, query):
+        self._rows = self.warehouse.run(query)
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection():
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self.open = True
+
+    def cursor(self):
+        if not self.open:
+            raise InterfaceError("Connection is closed.")
+        return FakeCursor(self.warehouse)
+
+    def close(self):
+        self.open = False
+
+
+class FakeWarehouse():
+    """Minimal stand-in for the `databricks.sql` module: `connect()` and `exc`, every query returns the catalog. """
+
+    exc = SimpleNamespace(OperationalError=OperationalError, InterfaceError=InterfaceError)
+
+    def __init__(self, failure_rate=0.0, catalog_size=3):
+        self.failure_rate = failure_rate
+        self.catalog = [(f"product {i}", i, "description", "company") for i in range(catalog_size)]
+        self.connections = 0
+
+    def connect(self, **kwargs):
+        self.connections += 1
+        return FakeConnection(self)
+
+    def run(self, query):
+        if self.failure_rate >= 1.0:
+            raise OperationalError("Simulated warehouse failure.")
+        return list(self.catalog)
+
+
+def make_pool(warehouse=None, **kwargs):
+    return ConnectionPool(connect_kwargs={}, connector=warehouse or FakeWarehouse(), **kwargs)
+
+
+def test_acquire_and_release_reuse_the_connection():
+    warehouse = FakeWarehouse()
+    pool = make_pool(warehouse, pool_size=2)
+    first = pool.acquire()
+    assert pool.metrics()['in_use'] == 1
+    pool.release(first)
+    second = pool.acquire()
+    assert second is first
+    pool.release(second)
+    metrics = pool.metrics()
+    assert (metrics['open'], metrics['idle'], metrics['in_use'], metrics['connects']) == (1, 1, 0, 1)
+    assert warehouse.connections == 1
+
+
+def test_execute_returns_the_rows():
+    pool = make_pool(FakeWarehouse(catalog_size=10))
+    rows = pool.execute("select name, id, description, company_name from catalog")
+    assert len(rows) == 10
+    assert pool.metrics()['idle'] == 1
+
+
+def test_release_with_discard_closes_the_connection():
+    pool = make_pool()
+    pooled = pool.acquire()
+    pool.release(pooled, discard=True)
+    assert pooled.connection.open is False
+    assert pool.metrics()['open'] == 0
+
+
+def test_health_check_replaces_a_broken_connection():
+    pool = make_pool(health_check_interval=0)
+    pooled = pool.acquire()
+    pool.release(pooled)
+    # the warehouse dropped the session while it was idle
+    pooled.connection.close()
+    replacement = pool.acquire()
+    assert replacement is not pooled
+    assert replacement.connection.open
+    metrics = pool.metrics()
+    assert metrics['failed_health_checks'] == 1
+    assert metrics['reconnects'] == 1
+    assert metrics['open'] == 1
+
+
+def test_health_check_keeps_a_healthy_connection():
+    pool = make_pool(health_check_interval=0)
+    pooled = pool.acquire()
+    pool.release(pooled)
+    assert pool.acquire() is pooled
+    assert pool.metrics()['health_checks'] == 1
+
+
+def test_idle_timeout_closes_unused_connections():
+    pool = make_pool(idle_timeout=0.05)
+    pooled = pool.acquire()
+    pool.release(pooled)
+    time.sleep(0.1)
+    fresh = pool.acquire()
+    assert fresh is not pooled
+    assert pooled.connection.open is False
+    metrics = pool.metrics()
+    assert metrics['idle_evictions'] == 1
+    assert metrics['open'] == 1
+
+
+def test_exhausted_pool_times_out():
+    pool = make_pool(pool_size=1, checkout_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    metrics = pool.metrics()
+    assert metrics['timeouts'] == 1
+    assert metrics['waits'] == 1
+
+
+def test_exhausted_pool_hands_over_a_released_connection():
+    pool = make_pool(pool_size=1, checkout_timeout=2)
+    pooled = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(pooled,)).start()
+    assert pool.acquire() is pooled
+    assert pool.metrics()['waits'] == 1
+
+
+def test_failed_connect_frees_the_slot():
+    warehouse = FakeWarehouse()
+    warehouse.connect = lambda **kwargs: (_ for _ in ()).throw(ConnectionError("warehouse unreachable"))
+    pool = make_pool(warehouse, pool_size=1, checkout_timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.acquire()
+    assert pool.metrics()['open'] == 0
+
+
+def test_execute_retries_connection_failures_on_a_fresh_connection():
+    pool = make_pool(FakeWarehouse(failure_rate=1.0), max_retries=1)
+    with pytest.raises(FakeWarehouse.exc.OperationalError):
+        pool.execute("select 1")
+    metrics = pool.metrics()
+    assert metrics['connects'] == 2
+    assert metrics['open'] == 0
+
+
+def test_invalid_pool_size_raises_value_error():
+    with pytest.raises(ValueError):
+        make_pool(pool_size=0)
@@ -0,0 +1,107 @@
+import os
+import stat
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import libs.forecast_cache as forecast_cache
+from libs.forecast_cache import ForecastCache, hash_file
+from libs.lru_cache import TTLLRUCache
+
+
+def forecast_frame(days=30):
+    return pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=days, freq='D'), 'yhat': np.arange(days, dtype=float), 'y': np.arange(days, dtype=float)})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ForecastCache(cache_dir=str(tmp_path / 'forecast_cache'))
+
+
+def test_round_trip(cache):
+    frame = forecast_frame()
+    metrics = {'mae': np.float64(1.5), 'upper_alerts': np.int64(2)}
+    assert cache.put('key', model={'series': 1}, forecast=frame, metrics=metrics, response="The forecast.")
+    entry = cache.get('key')
+    pd.testing.assert_frame_equal(entry['forecast'], frame)
+    assert entry['metrics'] == {'mae': 1.5, 'upper_alerts': 2}
+    assert entry['response'] == "The forecast."
+    assert entry['model'] == {'series': 1}
+    assert not any(name.endswith('.pkl') for name in os.listdir(os.path.join(cache.cache_dir, 'key')))
+    assert cache.get('missing') is None
+
+
+def test_directory_is_private(tmp_path):
+    cache_dir = tmp_path / 'shared'
+    cache_dir.mkdir(mode=0o777)
+    os.chmod(cache_dir, 0o777)
+    ForecastCache(cache_dir=str(cache_dir))
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+
+
+def test_concurrent_puts_of_the_same_entry(cache):
+    frame = forecast_frame(365)
+    results = []
+    barrier = threading.Barrier(8)
+
+    def put():
+        barrier.wait()
+        results.append(cache.put('key', forecast=frame, response="The forecast."))
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [True] * 8
+    assert cache.get('key')['response'] == "The forecast."
+    assert [name for name in os.listdir(cache.cache_dir) if name.startswith('.tmp_')] == []
+
+
+def test_write_errors_are_not_raised(cache, monkeypatch):
+    def failing_to_parquet(*args, **kwargs):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', failing_to_parquet)
+    assert cache.put('key', forecast=forecast_frame()) is False
+    assert cache.stats()['write_errors'] == 1
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_corrupt_entries_are_removed(cache):
+    cache.put('key', response="The forecast.")
+    with open(os.path.join(cache.cache_dir, 'key', 'entry.json'), 'w') as f:
+        f.write('{not json')
+    assert cache.get('key') is None
+    assert not os.path.exists(os.path.join(cache.cache_dir, 'key'))
+    assert cache.put('key', response="The forecast.")
+    assert cache.get('key')['response'] == "The forecast."
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ForecastCache(cache_dir=str(tmp_path / 'cache'), max_bytes=1)
+    cache.put('first', forecast=forecast_frame())
+    cache.put('second', forecast=forecast_frame())
+    assert cache.get('first') is None
+    assert cache.stats()['evictions'] >= 1
+
+
+def test_entries_of_the_pickle_format_are_replaced(cache):
+    os.makedirs(os.path.join(cache.cache_dir, 'key'))
+    with open(os.path.join(cache.cache_dir, 'key', 'entry.pkl'), 'wb') as f:
+        f.write(b'not loaded')
+    assert cache.get('key') is None
+    assert cache.put('key', response="The forecast.")
+    assert cache.get('key')['response'] == "The forecast."
+
+
+def test_file_hashes_are_memoized_within_a_bound(tmp_path, monkeypatch):
+    monkeypatch.setattr(forecast_cache, '_file_hashes', TTLLRUCache(max_size=2, ttl=None))
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"data_{i}.csv"
+        path.write_text(f"ds,y\n2024-01-01,{i}\n")
+        paths.append(str(path))
+    digests = [hash_file(path) for path in paths]
+
+    assert len(set(digests)) == 3
+    assert len(forecast_cache._file_hashes) == 2
+    assert hash_file(paths[0]) == digests[0]
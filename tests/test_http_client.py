@@ -0,0 +1,213 @@
+import time
+import json
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+import requests
+from libs.http_client import HttpClient, AsyncHttpClient, CircuitBreaker, CircuitOpenError
+
+
+class ScriptedServer(ThreadingHTTPServer):
+    """Answers POST requests with the scripted (status, headers) responses in order, then with 200. """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ScriptedHandler)
+        self.script = []
+        self.requests = []
+        self.delay = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/serving-endpoints/test/invocations"
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append(time.monotonic())
+        time.sleep(self.server.delay)
+        status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        data = json.dumps({'status': status}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ScriptedServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def make_client(cls=HttpClient, **kwargs):
+    settings = dict(max_retries=2, backoff_base=0.01, backoff_max=1, failure_threshold=2, reset_timeout=0.2)
+    settings.update(kwargs)
+    return cls(**settings)
+
+
+def test_retries_retryable_responses(server):
+    server.script = [(503, {}), (429, {})]
+    response = make_client().post(server.url, json={})
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+
+
+def test_returns_the_last_response_once_retries_are_exhausted(server):
+    server.script = [(503, {})] * 3
+    client = make_client()
+    assert client.post(server.url, json={}).status_code == 503
+    assert len(server.requests) == 3
+    assert client.breaker(server.url).failures == 1
+
+
+def test_does_not_retry_client_errors(server):
+    server.script = [(400, {})]
+    assert make_client().post(server.url, json={}).status_code == 400
+    assert len(server.requests) == 1
+
+
+def test_does_not_retry_read_timeouts(server):
+    server.delay = 0.3
+    with pytest.raises(requests.Timeout):
+        make_client().post(server.url, timeout=(1, 0.1), json={})
+    assert len(server.requests) == 1
+
+
+def test_retries_read_timeouts_of_idempotent_calls(server):
+    server.delay = 0.3
+    with pytest.raises(requests.Timeout):
+        make_client().post(server.url, timeout=(1, 0.1), idempotent=True, json={})
+    assert len(server.requests) == 3
+
+
+def test_retries_connection_errors(server):
+    url = server.url
+    server.shutdown()
+    server.server_close()
+    client = make_client()
+    session = client.session(url)
+    attempts = []
+
+    def counting_post(*args, **kwargs):
+        attempts.append(1)
+        return requests.Session.post(session, *args, **kwargs)
+    session.post = counting_post
+    with pytest.raises(requests.ConnectionError):
+        client.post(url, json={})
+    assert len(attempts) == 3
+
+
+def test_async_client_does_not_retry_read_timeouts(server):
+    server.delay = 0.3
+
+    async def run():
+        client = make_client(AsyncHttpClient)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.post(server.url, timeout=(1, 0.1), json={})
+        finally:
+            await client.aclose()
+    asyncio.run(run())
+    assert len(server.requests) == 1
+
+
+def test_honors_retry_after(server):
+    server.script = [(429, {'Retry-After': '0.3'})]
+    make_client().post(server.url, json={})
+    assert server.requests[1] - server.requests[0] >= 0.3
+
+
+def test_circuit_opens_half_opens_and_closes(server):
+    client = make_client(max_retries=0)
+    breaker = client.breaker(server.url)
+    server.script = [(503, {})] * 2
+    client.post(server.url, json={})
+    assert breaker.state == 'closed'
+    client.post(server.url, json={})
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.post(server.url, json={})
+    assert len(server.requests) == 2
+
+    time.sleep(0.25)
+    assert breaker.state == 'half_open'
+    # a failed trial opens the circuit again
+    server.script = [(503, {})]
+    client.post(server.url, json={})
+    assert breaker.state == 'open'
+
+    time.sleep(0.25)
+    assert client.post(server.url, json={}).status_code == 200
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_unexpected_errors_settle_the_trial(server, monkeypatch):
+    client = make_client(max_retries=0, failure_threshold=1)
+    breaker = client.breaker(server.url)
+    breaker.record_failure()
+    time.sleep(0.25)
+
+    def broken_post(*args, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+    monkeypatch.setattr(client.session(server.url), 'post', broken_post)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.post(server.url, json={})
+    assert not breaker.trial_in_flight
+    assert breaker.state == 'open'
+
+    monkeypatch.undo()
+    time.sleep(0.25)
+    assert client.post(server.url, json={}).status_code == 200
+    assert breaker.state == 'closed'
+
+
+def test_async_client_retries_and_closes_the_circuit(server):
+    async def run():
+        client = make_client(AsyncHttpClient)
+        server.script = [(503, {})]
+        response = await client.post(server.url, json={})
+        await client.aclose()
+        return response
+    assert asyncio.run(run()).status_code == 200
+    assert len(server.requests) == 2
+
+
+def test_async_cancellation_releases_the_trial(server):
+    client = make_client(AsyncHttpClient, failure_threshold=1)
+    breaker = client.breaker(server.url)
+    breaker.record_failure()
+    time.sleep(0.25)
+
+    async def cancelled():
+        server.script = [(503, {})] * 3
+        task = asyncio.create_task(client.post(server.url, json={}))
+        # cancelled while backing off after the first 503
+        while not server.requests:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+    asyncio.run(cancelled())
+    assert not breaker.trial_in_flight
+    assert breaker.allow()
@@ -0,0 +1,45 @@
+import io
+import asyncio
+import pytest
+from PIL import Image
+import libs.image_to_text as image_to_text
+
+
+def png(color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_error_responses_are_not_cached(itt_endpoint):
+    itt_endpoint(failure_rate=1.0)
+    output = image_to_text.describe_image(png())
+    assert 'predictions' not in output
+    assert len(image_to_text.get_description_cache()) == 0
+
+    # the next request reaches the recovered endpoint
+    itt_endpoint()
+    output = image_to_text.describe_image(png())
+    assert output['predictions']
+    assert len(image_to_text.get_description_cache()) == 1
+
+
+def test_descriptions_are_served_from_the_cache(itt_endpoint):
+    server = itt_endpoint()
+    first = image_to_text.describe_image(png())
+    second = image_to_text.describe_image(png())
+    assert first == second
+    assert server.RequestHandlerClass.requests_served == 1
+
+
+def test_async_error_responses_are_not_cached(itt_endpoint):
+    itt_endpoint(failure_rate=1.0)
+    output = asyncio.run(image_to_text.adescribe_image(png()))
+    assert 'predictions' not in output
+    assert len(image_to_text.get_description_cache()) == 0
+
+
+def test_only_successful_predictions_are_descriptions():
+    assert image_to_text.is_description(200, {'predictions': ['a red mug']})
+    assert not image_to_text.is_description(200, {'error_code': 'BAD_REQUEST'})
+    assert not image_to_text.is_description(503, {'predictions': ['a red mug']})
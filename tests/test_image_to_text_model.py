@@ -0,0 +1,93 @@
+import io
+import base64
+import logging
+import pandas as pd
+import pytest
+from PIL import Image
+from transformers import PretrainedConfig
+from deploy.image_to_text_model import ImageToTextModel
+
+
+class FakeInputs(dict):
+
+    def to(self, device):
+        return self
+
+
+class FakeProcessor():
+    """Stands in for the InstructBLIP processor, the "tokens" of an image are its size. """
+
+    def __call__(self, images, text, return_tensors, padding):
+        assert len(images) == len(text)
+        return FakeInputs(sizes=[image.size for image in images])
+
+    def batch_decode(self, outputs, skip_special_tokens):
+        return [f" {width}x{height} product " for width, height in outputs]
+
+
+class FakeModel():
+    """Describes images by their size and fails on every batch with a 13 pixel wide image. """
+    config = PretrainedConfig()
+
+    def __init__(self):
+        self.batches = []
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def generate(self, sizes, generation_config):
+        self.batches.append(len(sizes))
+        if any(width == 13 for width, _ in sizes):
+            raise RuntimeError("CUDA out of memory")
+        return sizes
+
+
+def encode_image(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (10, 20, 30)).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+@pytest.fixture
+def model():
+    return ImageToTextModel(max_batch_size=3).setup(FakeModel(), FakeProcessor(), device='cpu')
+
+
+def test_every_row_is_described_in_mini_batches(model):
+    model_input = pd.DataFrame({'content': [encode_image(20 + i, 10) for i in range(7)]})
+    output = model.predict(None, model_input)
+
+    assert list(output['description']) == [f"{20 + i}x10 product" for i in range(7)]
+    assert output['error'].isna().all()
+    assert model.model.batches == [3, 3, 1]
+
+
+def test_batched_rows_match_single_rows(model):
+    model_input = pd.DataFrame({'content': [encode_image(20 + i, 10 + i) for i in range(5)]})
+    batched = model.predict(None, model_input)
+    single = [model.predict(None, model_input.iloc[[i]])['description'].iloc[0] for i in range(5)]
+    assert list(batched['description']) == single
+
+
+def test_unreadable_rows_get_an_error(model, caplog):
+    model_input = pd.DataFrame({'content': [encode_image(20, 10), "not an image", encode_image(21, 10)]})
+    with caplog.at_level(logging.WARNING):
+        output = model.predict(None, model_input)
+
+    assert list(output['description']) == ["20x10 product", None, "21x10 product"]
+    assert output['error'].iloc[1] == "Error: Incorrect padding"
+    assert "Row 1 is not a readable image" in caplog.text
+
+
+def test_a_failed_batch_only_fails_its_rows(model, caplog):
+    model_input = pd.DataFrame({'content': [encode_image(20, 10), encode_image(13, 10), encode_image(22, 10), encode_image(23, 10)]})
+    with caplog.at_level(logging.ERROR):
+        output = model.predict(None, model_input)
+
+    assert list(output['error'][:3]) == ["RuntimeError: CUDA out of memory"] * 3
+    assert output['description'][:3].isna().all()
+    assert output['description'].iloc[3] == "23x10 product" and output['error'].iloc[3] is None
+    assert "Describing rows [0, 1, 2] failed" in caplog.text
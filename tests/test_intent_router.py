@@ -0,0 +1,66 @@
+import pytest
+from PIL import Image
+from libs.intent_router import IntentRouter, INTENT_TOOLS, parse_shopping_items
+from libs.session_state import Session, session_scope
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = Session('test', upload_dir=str(tmp_path))
+    with session_scope(session):
+        yield session
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(list(INTENT_TOOLS.values()))
+
+
+@pytest.mark.parametrize('message', [
+    "add up the total of my cart",
+    "can you order my cart by price?",
+    "add 2 gallons of milk, remove the eggs",
+    "delete the bananas from my cart",
+    "undo that",
+    "sort my cart by price",
+    "can you add milk?",
+])
+def test_cart_questions_and_edits_go_to_the_agent(router, session, message):
+    assert not router.route(message).routed
+
+
+def test_describing_the_conversation_goes_to_the_agent(router, session):
+    Image.new('RGB', (8, 8)).save(session.product_image_path)
+    route = router.route("describe what you just did")
+    assert not route.routed
+    assert router.route("describe this product").tool_name == INTENT_TOOLS['describe']
+
+
+@pytest.mark.parametrize('message, items', [
+    ("add 2 apples and milk to my cart", [{'product_name': 'apples', 'quantity': 2}, {'product_name': 'milk', 'quantity': 1}]),
+    ("buy 2 gallons of milk", [{'product_name': 'gallons of milk', 'quantity': 2}]),
+    ("i need milk, eggs and butter", [{'product_name': 'milk', 'quantity': 1}, {'product_name': 'eggs', 'quantity': 1}, {'product_name': 'butter', 'quantity': 1}]),
+])
+def test_plain_shopping_lists_are_routed(router, session, message, items):
+    route = router.route(message)
+    assert route.tool_name == INTENT_TOOLS['shop']
+    assert route.tool_input == {'items': items}
+
+
+@pytest.mark.parametrize('message', [
+    "add up the total of my cart",
+    "add milk and take out the trash",
+    "add my usual order",
+    "add some of that really nice organic yogurt",
+])
+def test_fragments_that_are_not_product_names_are_rejected(message):
+    assert parse_shopping_items(message) is None
+
+
+def test_side_effecting_intents_need_a_higher_confidence(session):
+    message = "add bananas"
+    intent, confidence, _ = IntentRouter(list(INTENT_TOOLS.values())).classify(message)
+    assert intent == 'shop'
+    assert IntentRouter(list(INTENT_TOOLS.values()), side_effect_threshold=confidence - 0.01).route(message).routed
+    route = IntentRouter(list(INTENT_TOOLS.values()), side_effect_threshold=confidence + 0.01).route(message)
+    assert not route.routed and route.reason == "low confidence"
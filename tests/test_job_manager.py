@@ -0,0 +1,50 @@
+import threading
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from libs.job_manager import Job, JobManager, JobCancelled, CANCELLED
+from libs.callbacks import JobProgressHandler
+
+
+def test_a_job_that_can_not_be_queued_is_forgotten():
+    manager = JobManager(max_workers=1)
+    manager.shutdown()
+    with pytest.raises(RuntimeError):
+        manager.submit(lambda job: None, session_id='a')
+    assert manager.active('a') == []
+    assert manager.stats()['submitted'] == 0
+
+
+def test_a_streamed_answer_stops_at_the_next_token():
+    job = Job()
+    tokens = []
+
+    class CancelAfterFirstToken(JobProgressHandler):
+        def on_llm_new_token(self, token, **kwargs):
+            tokens.append(token)
+            if len(tokens) == 1:
+                self.job._cancel.set()
+            super().on_llm_new_token(token, **kwargs)
+
+    llm = FakeListChatModel(responses=["a long streamed answer"])
+    with pytest.raises(JobCancelled):
+        for _ in llm.stream("hello", config={'callbacks': [CancelAfterFirstToken(job)]}):
+            pass
+    assert len(tokens) == 1
+
+
+def test_a_running_job_is_cancelled_while_streaming():
+    manager = JobManager(max_workers=1)
+    started = threading.Event()
+    done = threading.Event()
+
+    def stream(job):
+        llm = FakeListChatModel(responses=["x" * 1000], sleep=0.01)
+        for _ in llm.stream("hello", config={'callbacks': [JobProgressHandler(job)]}):
+            started.set()
+
+    job = manager.submit(stream, on_done=lambda job, status: done.set())
+    assert started.wait(5)
+    manager.cancel(job.job_id)
+    assert done.wait(5)
+    assert job.status == CANCELLED
+    manager.shutdown()
@@ -0,0 +1,45 @@
+import pytest
+from fake_sql import FakeWarehouse
+import libs.db_sql as dbsql
+import libs.product_index as product_index
+
+
+@pytest.fixture
+def warehouse():
+    warehouse = FakeWarehouse(catalog_size=60)
+    dbsql.configure_pool(connector=warehouse, connect_kwargs={}, max_retries=0)
+    product_index._indexes.clear()
+    product_index._failures.clear()
+    yield warehouse
+    dbsql.close_pool()
+    product_index._indexes.clear()
+    product_index._failures.clear()
+
+
+def test_index_matches_products(warehouse):
+    index = product_index.get_product_index('catalog')
+    (record, score), = index.search_many(['apples'], k=1)[0]
+    assert 'Apples' in record['name']
+    assert product_index.get_product_index('catalog') is index
+    assert warehouse.stats()['queries'] == 1
+
+
+def test_failed_build_backs_off(warehouse, monkeypatch):
+    warehouse.failure_rate = 1.0
+    with pytest.raises(FakeWarehouse.exc.OperationalError):
+        product_index.get_product_index('catalog')
+    # within the backoff the catalog is not scanned again
+    with pytest.raises(product_index.ProductIndexUnavailable):
+        product_index.get_product_index('catalog')
+    assert warehouse.stats()['queries'] == 1
+
+    warehouse.failure_rate = 0.0
+    monkeypatch.setenv('PRODUCT_INDEX_RETRY_SECONDS', '0')
+    assert product_index.get_product_index('catalog') is not None
+    assert 'catalog' not in product_index._failures
+
+
+def test_retry_delay_doubles_up_to_the_maximum(monkeypatch):
+    monkeypatch.setenv('PRODUCT_INDEX_RETRY_SECONDS', '10')
+    monkeypatch.setenv('PRODUCT_INDEX_MAX_RETRY_SECONDS', '30')
+    assert [product_index._retry_delay(n) for n in (1, 2, 3)] == [10, 20, 30]
@@ -0,0 +1,24 @@
+from libs.response_cache import ResponseCache
+
+
+def test_exact_and_semantic_hits():
+    cache = ResponseCache()
+    cache.store("What can you do?", 'state', "I can shop and forecast.")
+    assert cache.lookup("what can you do", 'state').output == "I can shop and forecast."
+    assert cache.lookup("What can you do?", 'other state') is None
+
+
+def test_semantic_hits_never_replay_side_effects():
+    cache = ResponseCache()
+    actions = [("Text to shop Tool", {'items': [{'product_name': 'whole milk', 'quantity': 2}]})]
+    cache.store("add 2 gallons of whole milk to my shopping cart", 'state', "Added 2 gallons.", actions)
+    assert cache.lookup("add 3 gallons of whole milk to my shopping cart", 'state') is None
+    # the exact prompt still replays its tool calls
+    assert cache.lookup("Add 2 gallons of whole milk to my shopping cart!", 'state').actions == actions
+
+
+def test_semantic_hits_without_side_effects():
+    cache = ResponseCache(similarity_threshold=0.9)
+    cache.store("add 2 gallons of whole milk to my shopping cart", 'state', "Added 2 gallons.")
+    assert cache.lookup("add 3 gallons of whole milk to my shopping cart", 'state') is not None
+    assert cache.stats()['semantic_hits'] == 1
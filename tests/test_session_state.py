@@ -0,0 +1,54 @@
+import pytest
+from libs.session_state import SessionManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return SessionManager(llm_factory=lambda session: None, root_dir=str(tmp_path), max_bytes=1000)
+
+
+def use(manager, session_id, item_bytes):
+    """Adds a cart item of about `item_bytes` characters during a use of the session. """
+    with manager.session(session_id) as session:
+        session.cart.add_items([{'name': 'x' * item_bytes}])
+    return session
+
+
+def test_total_bytes_tracks_released_sessions(manager):
+    first = use(manager, 'a', 300)
+    second = use(manager, 'b', 200)
+
+    assert manager.stats()['bytes'] == first.size + second.size == first.approx_bytes() + second.approx_bytes()
+    use(manager, 'a', 100)
+    assert manager.stats()['bytes'] == first.approx_bytes() + second.approx_bytes()
+
+
+def test_least_recently_used_sessions_are_evicted_beyond_max_bytes(manager):
+    use(manager, 'a', 400)
+    use(manager, 'b', 400)
+    use(manager, 'c', 400)
+    # the next session triggers the eviction of the oldest
+    manager.get_or_create('d')
+
+    assert manager.get('a') is None
+    assert manager.get('b') is not None and manager.get('c') is not None
+    assert manager.stats()['evicted_memory'] == 1
+    assert manager.stats()['bytes'] <= 1000
+
+
+def test_removed_sessions_leave_the_total(manager):
+    use(manager, 'a', 400)
+    manager.remove('a')
+    assert manager.stats()['bytes'] == 0
+
+
+def test_held_sessions_are_not_evicted(manager):
+    held = manager.hold('a')
+    held.cart.add_items([{'name': 'x' * 2000}])
+    use(manager, 'b', 2000)
+    manager.get_or_create('c')
+
+    assert manager.get('a') is held
+    assert manager.get('b') is None
+    manager.release(held)
+    assert manager.stats()['bytes'] == held.size
@@ -0,0 +1,52 @@
+import pytest
+from fake_sql import FakeWarehouse
+import libs.db_sql as dbsql
+import libs.product_index as product_index
+from libs.session_state import SessionManager
+from libs.text_to_shop import Text2ShopTool, parse_requested_items, format_tool_response, unmatched_items
+
+
+def test_items_as_a_list():
+    assert parse_requested_items(items=[{'product_name': 'milk', 'quantity': 2}, ['eggs', 12], 'bread']) == [('milk', 2), ('eggs', 12), ('bread', 1)]
+
+
+def test_items_as_a_json_string():
+    assert parse_requested_items(items='[{"product_name": "milk", "quantity": 2}, {"product_name": "eggs"}]') == [('milk', 2), ('eggs', 1)]
+    assert parse_requested_items(items='{"product_name": "milk", "quantity": 2}') == [('milk', 2)]
+
+
+@pytest.mark.parametrize('items', ['milk, eggs', 42, '"milk"'])
+def test_invalid_items_are_rejected(items):
+    with pytest.raises(ValueError):
+        parse_requested_items(items=items)
+
+
+def test_unmatched_items_are_reported():
+    requested = [('milk', 1), ('unobtainium', 1)]
+    assert unmatched_items(requested, [[{'name': 'Acme Milk'}], []]) == ['unobtainium']
+    assert "unobtainium" in format_tool_response([], [], ['unobtainium'])
+    assert "not found" not in format_tool_response([], [])
+
+
+@pytest.fixture
+def session(tmp_path):
+    dbsql.configure_pool(connector=FakeWarehouse(catalog_size=60), connect_kwargs={})
+    product_index._indexes.clear()
+    manager = SessionManager(llm_factory=lambda session: None, root_dir=str(tmp_path))
+    with manager.session('test') as session:
+        yield session
+    dbsql.close_pool()
+    product_index._indexes.clear()
+
+
+def test_tool_rejects_items_it_cannot_read(session):
+    response = Text2ShopTool()._run(items='milk and eggs')
+    assert 'not valid JSON' in response
+    assert session.cart.items() == []
+
+
+def test_tool_reports_items_missing_from_the_catalog(session, monkeypatch):
+    monkeypatch.setattr('libs.text_to_shop.call_foundation_model', lambda **kwargs: {'choices': [{'message': {'content': 'Butter'}}]})
+    response = Text2ShopTool()._run(items='[{"product_name": "milk", "quantity": 2}, {"product_name": "zzqx"}]')
+    assert [item['name'] for item in session.cart.items()] == ['Acme Milk']
+    assert "zzqx" in response
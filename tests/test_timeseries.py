@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from libs.session_state import Session, session_scope
+from libs.timeseries import forecast_many, resolve_freq, ForecastTool, VectorizedEngine
+
+
+def daily_sales(series=2, days=60):
+    rng = np.random.default_rng(0)
+    return pd.concat([
+        pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=days, freq='D'), 'y': 100 + rng.normal(0, 3, days), 'store': f"store_{i}"})
+        for i in range(series)
+    ], ignore_index=True)
+
+
+def test_forecast_many_rejects_a_missing_series_column():
+    with pytest.raises(ValueError, match="sku"):
+        forecast_many(daily_sales(), 'sku', max_workers=1)
+
+
+def test_vectorized_engine_rejects_a_missing_series_column():
+    with pytest.raises(ValueError, match="sku"):
+        VectorizedEngine('holt_winters').forecast_many(daily_sales(), 'sku')
+
+
+def test_vectorized_engine_forecasts_every_series():
+    output_df, metrics_df, errors, models = VectorizedEngine('linear_trend').forecast_many(daily_sales(), 'store', periods=7)
+    assert errors == {}
+    assert sorted(metrics_df['store']) == ['store_0', 'store_1']
+    assert output_df.groupby('store').size().tolist() == [67, 67]
+
+
+def test_vectorized_engine_reports_why_a_forecast_failed():
+    with pytest.raises(ValueError, match=r"holt_winters forecast of the uploaded series failed: .*3 observations"):
+        VectorizedEngine('holt_winters').forecast(daily_sales(series=1, days=3)[['ds', 'y']], periods=7)
+
+
+def test_vectorized_engine_forecasts_a_single_series():
+    output_df, model = VectorizedEngine('seasonal_naive').forecast(daily_sales(series=1)[['ds', 'y']], periods=7)
+    assert len(output_df) == 67
+    assert 'series' not in output_df.columns
+    assert model['method'] == 'seasonal_naive'
+
+
+def weekly_sales(weeks=120):
+    rng = np.random.default_rng(0)
+    # weeks starting on monday
+    return pd.DataFrame({'ds': pd.date_range('2023-01-02', periods=weeks, freq='W-MON'), 'y': 100 + rng.normal(0, 3, weeks)})
+
+
+def test_frequencies_are_anchored_on_the_data():
+    assert resolve_freq('W', weekly_sales()['ds']) == 'W-MON'
+    assert resolve_freq('W', weekly_sales(weeks=2)['ds']) == 'W-MON'
+    assert resolve_freq('MS', pd.Series(pd.date_range('2024-01-31', periods=6, freq='M'))) == 'M'
+    assert resolve_freq('D', daily_sales(series=1)['ds']) == 'D'
+
+
+def test_vectorized_engine_forecasts_weekly_data():
+    pdf = weekly_sales()
+    output_df, model = VectorizedEngine('seasonal_naive').forecast(pdf, periods=4, freq=resolve_freq('W', pdf['ds']))
+    assert model['season_length'] == 52
+    assert len(output_df) == 124
+    assert output_df['y'].notna().sum() == 120
+    assert (output_df['ds'].dt.dayofweek == 0).all()
+    assert (output_df['ds'].diff().dropna() == pd.Timedelta(days=7)).all()
+
+
+def test_forecast_tool_forecasts_weekly_data(tmp_path, monkeypatch):
+    charts = []
+    monkeypatch.setattr(ForecastTool, '_save_chart', lambda self, chart_df: charts.append(chart_df))
+    session = Session('weekly', str(tmp_path))
+    weekly_sales().to_csv(session.data_csv_path, index=False)
+    with session_scope(session):
+        ForecastTool(engine='seasonal_naive', use_cache=False, periods=4)._run('weekly')
+    assert len(charts[0]) == 124
+    assert (charts[0]['Date'].diff().dropna() == pd.Timedelta(days=7)).all()
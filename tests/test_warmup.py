@@ -0,0 +1,21 @@
+import time
+import threading
+import libs.warmup as warmup
+
+
+def test_wait_for_warmup_blocks_until_the_tasks_finished(monkeypatch):
+    monkeypatch.setattr(warmup, '_thread', None)
+    release = threading.Event()
+    assert warmup.wait_for_warmup()
+
+    warmup.start_warmup([('slow', release.wait)])
+    assert not warmup.wait_for_warmup(timeout=0.05)
+    release.set()
+    assert warmup.wait_for_warmup(timeout=5)
+
+
+def test_a_failing_task_does_not_stop_the_warmup():
+    calls = []
+    timings = warmup.warm_up([('broken', lambda: 1 / 0), ('next', lambda: calls.append(time.time()))])
+    assert timings['broken'] is None and timings['next'] is not None
+    assert len(calls) == 1